@@ -1,11 +1,16 @@
 import asyncio
+import shutil
+import uuid
 import websockets
 import aioconsole
 from InquirerPy import inquirer
 from rich.console import Console
 from rich.table import Table
 from Shared.protocol import Protocol
+from Client.connection import Connection
 from Editor.editor import Editor
+from Shared.crdt import CrdtDocument
+from Shared.ot import PendingOperations
 
 
 class Client:
@@ -16,12 +21,17 @@ class Client:
         self.filename = None
         self.user_id = None
         self.console = Console()
+        self.history_page_size = 50
+        self.codec = "json"
+        self.login_timeout = 5
+        # edits sent but not acknowledged yet
+        self.edit_window = 32
 
     @staticmethod
-    async def ping(websocket):
+    async def ping(connection):
         try:
             while True:
-                await websocket.send(Protocol.create_message("PING", None))
+                await connection.notify("PING")
                 await asyncio.sleep(10)
         except asyncio.CancelledError:
             pass
@@ -30,19 +40,28 @@ class Client:
         async with websockets.connect(self.server_uri) as websocket:
             self.console.print("Text Editor", style="#61afef")
             self.editor = Editor(asyncio.get_event_loop(), self.user_id)
-            ping_pong = asyncio.create_task(self.ping(websocket))
-            await self.login(websocket)
-            await self.handle_message(websocket)
+            connection = Connection(websocket).start()
+            ping_pong = asyncio.create_task(self.ping(connection))
+            await self.login(connection)
+            await self.handle_message(connection)
             ping_pong.cancel()
+            await connection.stop()
 
-    async def login(self, websocket):
+    async def login(self, connection):
         username = await aioconsole.ainput("Enter username: ")
-        await websocket.send(Protocol.create_message("LOGIN", {"username": username}))
         try:
-            response = await asyncio.wait_for(websocket.recv(), timeout=5)
-            result = Protocol.parse_response(response)
+            result = await asyncio.wait_for(
+                connection.request(
+                    "LOGIN",
+                    {"username": username, "codecs": Protocol.preferred_codecs},
+                ),
+                timeout=self.login_timeout,
+            )
             if result["data"]["status"] == "success":
                 self.user_id = result["data"]["user_id"]
+                self.codec = result["data"].get("codec", "json")
+                self.editor.sender.codec = self.codec
+                connection.codec = self.codec
                 self.console.print(
                     f"{username} logged in successfully with {self.user_id}",
                     style="#00A6A6",
@@ -55,7 +74,7 @@ class Client:
         except Exception as e:
             print(f"An error occurred: {e}")
 
-    async def handle_message(self, websocket):
+    async def handle_message(self, connection):
         while True:
             print("\n")
             command = await inquirer.select(
@@ -76,30 +95,30 @@ class Client:
             ).execute_async()
 
             if command == "1":
-                file_list = await self.get_files(websocket)
+                file_list = await self.get_files(connection)
                 self.console.print("\nFiles in folder:", style="#61afef")
                 for i, file in enumerate(file_list, start=1):
                     self.console.print(f" {i}) {file}")
             if command == "2":
-                file_list = await self.get_files(websocket)
-                await self.open_file(websocket, file_list)
+                file_list = await self.get_files(connection)
+                await self.open_file(connection, file_list)
             if command == "3":
-                await self.create_file(websocket)
+                await self.create_file(connection)
             if command == "4":
-                file_list = await self.get_files(websocket)
-                await self.edit_file(websocket, file_list)
+                file_list = await self.get_files(connection)
+                await self.edit_file(connection, file_list)
             if command == "5":
-                file_list = await self.get_files(websocket)
-                await self.delete_file(websocket, file_list)
+                file_list = await self.get_files(connection)
+                await self.delete_file(connection, file_list)
             if command == "6":
-                file_list = await self.get_files(websocket)
-                await self.get_history(websocket, file_list)
+                file_list = await self.get_files(connection)
+                await self.get_history(connection, file_list)
             if command == "7":
-                file_list = await self.get_files(websocket)
-                await self.grant_access(websocket, file_list)
+                file_list = await self.get_files(connection)
+                await self.grant_access(connection, file_list)
             if command == "8":
-                file_list = await self.get_files(websocket)
-                await self.remove_access(websocket, file_list)
+                file_list = await self.get_files(connection)
+                await self.remove_access(connection, file_list)
             if command == "help":
                 self.console.print("\nEditor commands:", style="#61afef")
                 self.console.print(" ctrl + E: Start/end selection mode")
@@ -114,16 +133,15 @@ class Client:
                 self.console.print("Exiting...", style="#61afef")
                 break
 
-    async def get_files(self, websocket):
-        await websocket.send(Protocol.create_message("GET_FILES"))
-        response = await websocket.recv()
-        file_list = Protocol.parse_response(response)["data"].get("files")
+    async def get_files(self, connection):
+        result = await connection.request("GET_FILES")
+        file_list = result["data"].get("files")
         if not file_list:
             self.console.print("No files found in the folder.", style="#F08700")
             return None
         return file_list
 
-    async def open_file(self, websocket, file_list):
+    async def open_file(self, connection, file_list):
         selected_file = await inquirer.select(
             message="Choose a file to open: ",
             choices=[{"name": file, "value": file} for file in file_list]
@@ -143,14 +161,9 @@ class Client:
         else:
             filename = selected_file
 
-        await websocket.send(
-            Protocol.create_message(
-                "OPEN_FILE",
-                {"filename": filename, "user_id": user_id, "host_id": host_id},
-            )
+        result = await connection.request(
+            "OPEN_FILE", {"filename": filename, "user_id": user_id, "host_id": host_id}
         )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
 
         if result["data"].get("status") == "success":
             self.filename = filename
@@ -161,11 +174,9 @@ class Client:
                 self.console.print(line)
         else:
             self.console.print(f"Error: {result['data']['error']}", style="#F08700")
-        await websocket.send(
-            Protocol.create_message("CLOSE_FILE", {"filename": filename})
-        )
+        await connection.notify("CLOSE_FILE", {"filename": filename})
 
-    async def create_file(self, websocket):
+    async def create_file(self, connection):
         choice = await inquirer.select(
             message="Enter a new file name or choose 'Cancel' to go back:",
             choices=[
@@ -179,12 +190,17 @@ class Client:
             return
 
         filename = await aioconsole.ainput("Enter new file name: ")
+        mode = await inquirer.select(
+            message="How should concurrent edits be merged?",
+            choices=[
+                {"name": "In server order", "value": "ordered"},
+                {"name": "CRDT, without coordination", "value": "crdt"},
+            ],
+        ).execute_async()
 
-        await websocket.send(
-            Protocol.create_message("CREATE_FILE", {"filename": filename})
+        result = await connection.request(
+            "CREATE_FILE", {"filename": filename, "mode": mode}
         )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
         if result["data"]["status"] == "success":
             self.console.print(
                 f"File '{filename}' created successfully.", style="#00A6A6"
@@ -195,7 +211,7 @@ class Client:
                 style="#F08700",
             )
 
-    async def delete_file(self, websocket, file_list):
+    async def delete_file(self, connection, file_list):
         selected_file = await inquirer.select(
             message="Choose a file to delete: ",
             choices=[{"name": file, "value": file} for file in file_list]
@@ -211,11 +227,7 @@ class Client:
         else:
             filename = selected_file
 
-        await websocket.send(
-            Protocol.create_message("DELETE_FILE", {"filename": filename})
-        )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
+        result = await connection.request("DELETE_FILE", {"filename": filename})
         if result["data"]["status"] == "success":
             self.console.print(
                 f"File {filename} deleted successfully.", style="#00A6A6"
@@ -225,14 +237,10 @@ class Client:
                 f"Error deleting file {filename}: {result['data']['error']}.",
                 style="#F08700",
             )
-        await websocket.send(
-            Protocol.create_message("DELETE_HISTORY", {"filename": filename})
-        )
+        await connection.notify("DELETE_HISTORY", {"filename": filename})
 
-    async def get_user(self, websocket):
-        await websocket.send(Protocol.create_message("GET_REGISTERED_USERS"))
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
+    async def get_user(self, connection):
+        result = await connection.request("GET_REGISTERED_USERS")
 
         if result["data"]["status"] == "success":
             users = result["data"]["users"]
@@ -252,8 +260,8 @@ class Client:
             )
             return None
 
-    async def grant_access(self, websocket, file_list):
-        user = await self.get_user(websocket)
+    async def grant_access(self, connection, file_list):
+        user = await self.get_user(connection)
         if not user:
             return
 
@@ -272,16 +280,12 @@ class Client:
         else:
             filename = selected_file
 
-        await websocket.send(
-            Protocol.create_message(
-                "GRANT_ACCESS", {"user": user, "filename": filename}
-            )
+        result = await connection.request(
+            "GRANT_ACCESS", {"user": user, "filename": filename}
         )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
         self.console.print(result["data"]["answer"])
 
-    async def remove_access(self, websocket, file_list):
+    async def remove_access(self, connection, file_list):
         if not file_list:
             self.console.print("You don't have any files.", style="#F08700")
             return
@@ -301,20 +305,16 @@ class Client:
         else:
             filename = selected_file
 
-        user = await self.get_user(websocket)
+        user = await self.get_user(connection)
         if not user:
             return
 
-        await websocket.send(
-            Protocol.create_message(
-                "REMOVE_ACCESS", {"filename": filename, "user": user}
-            )
+        result = await connection.request(
+            "REMOVE_ACCESS", {"filename": filename, "user": user}
         )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
         self.console.print(result["data"]["answer"])
 
-    async def edit_file(self, websocket, file_list):
+    async def edit_file(self, connection, file_list):
         selected_file = await inquirer.select(
             message="Choose a file to edit: ",
             choices=[{"name": file, "value": file} for file in file_list]
@@ -336,35 +336,62 @@ class Client:
 
         print("host_id:", host_id)
 
-        await websocket.send(
-            Protocol.create_message(
-                "OPEN_FILE",
-                {"filename": filename, "user_id": user_id, "host_id": host_id},
-            )
+        # large files arrive as a first screenful followed by chunks
+        stream = connection.stream(
+            "OPEN_FILE",
+            {
+                "filename": filename,
+                "user_id": user_id,
+                "host_id": host_id,
+                "viewport": shutil.get_terminal_size().lines,
+            },
+            clear_pushes=True,
+            hold_pushes=True,
         )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
+        result = await stream.__anext__()
 
         if result["data"].get("status", "") == "success":
             self.filename = filename
             content = result["data"]["content"]
             self.current_content = content
+            if "revision" in result["data"]:
+                self.editor.sender.revisions = PendingOperations(
+                    result["data"]["revision"], self.edit_window
+                )
+            if result["data"].get("mode") == "crdt":
+                self.editor.sender.replica = CrdtDocument.from_state(
+                    result["data"]["crdt"], f"{user_id}:{uuid.uuid4().hex[:8]}"
+                )
+            loader = None
+            if not result["data"].get("done", True):
+                loader = asyncio.create_task(self.load_lines(stream, content))
 
             stop_event = asyncio.Event()
-            await self.editor.edit(
-                self.current_content, filename, stop_event, websocket
-            )
-
-            await websocket.send(
-                Protocol.create_message("CLOSE_FILE", {"filename": filename})
-            )
+            try:
+                await self.editor.edit(
+                    self.current_content, filename, stop_event, connection
+                )
+            finally:
+                if loader is not None:
+                    loader.cancel()
+                    await asyncio.gather(loader, return_exceptions=True)
+                await stream.aclose()
+                self.editor.sender.revisions = None
+                self.editor.sender.replica = None
+
+            await connection.notify("CLOSE_FILE", {"filename": filename})
         else:
+            await stream.aclose()
             self.console.print(
                 f"Error editing file {filename}: {result['data']['error']}",
                 style="#F08700",
             )
 
-    async def get_history(self, websocket, file_list):
+    async def load_lines(self, stream, content):
+        async for message in stream:
+            content.extend(message["data"]["content"])
+
+    async def get_history(self, connection, file_list):
         selected_file = await inquirer.select(
             message="Choose a file to view history: ",
             choices=[{"name": file, "value": file} for file in file_list]
@@ -380,20 +407,80 @@ class Client:
         else:
             filename = selected_file
 
-        await websocket.send(
-            Protocol.create_message("GET_HISTORY", {"filename": filename})
-        )
-        response = await websocket.recv()
-        result = Protocol.parse_response(response)
-        if result["data"]["status"] == "success":
-            history = result["data"].get("history", [])
-            if history is None:
-                self.console.print("No history found for this file.", style="#EFCA08")
-            else:
-                self.display_history(history)
-        else:
+        filters = await self.history_filters()
+        cursor = 0
+        shown = 0
+        while cursor is not None:
+            pages = connection.stream(
+                "GET_HISTORY",
+                {
+                    "filename": filename,
+                    "cursor": cursor,
+                    "limit": self.history_page_size,
+                    "page_size": self.history_page_size,
+                    "filters": filters,
+                },
+            )
+            async for result in pages:
+                if result["data"]["status"] != "success":
+                    self.console.print(
+                        "No history found for this file.", style="#EFCA08"
+                    )
+                    return
+                history = result["data"].get("history") or []
+                if history:
+                    shown += len(history)
+                    self.display_history(history)
+                cursor = result["data"].get("cursor")
+
+            if cursor is None:
+                break
+            load_more = await inquirer.confirm(
+                message="Load more history?", default=True
+            ).execute_async()
+            if not load_more:
+                break
+
+        if not shown:
             self.console.print("No history found for this file.", style="#EFCA08")
 
+    async def history_filters(self):
+        choice = await inquirer.select(
+            message="Filter history:",
+            choices=[
+                {"name": "Show all", "value": "all"},
+                {"name": "By user", "value": "user_id"},
+                {"name": "By operation", "value": "op_type"},
+                {"name": "By line range", "value": "lines"},
+                {"name": "By time range", "value": "time"},
+            ],
+            default="all",
+        ).execute_async()
+
+        if choice == "user_id":
+            return {"user_id": await aioconsole.ainput("User ID: ")}
+        if choice == "op_type":
+            op_type = await inquirer.select(
+                message="Operation:",
+                choices=[
+                    {"name": "Insert", "value": "insert"},
+                    {"name": "Delete", "value": "delete"},
+                ],
+            ).execute_async()
+            return {"op_type": op_type}
+        if choice == "lines":
+            start_line = await aioconsole.ainput("From line: ")
+            end_line = await aioconsole.ainput("To line: ")
+            return {
+                "start_line": int(start_line) - 1 if start_line.isdigit() else None,
+                "end_line": int(end_line) - 1 if end_line.isdigit() else None,
+            }
+        if choice == "time":
+            since = await aioconsole.ainput("From (YYYY-MM-DD HH:MM): ")
+            until = await aioconsole.ainput("To (YYYY-MM-DD HH:MM): ")
+            return {"since": since or None, "until": until or None}
+        return {}
+
     def display_history(self, history):
         table = Table(title="Changes history", show_header=True)
         table.add_column("User ID", style="white")
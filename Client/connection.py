@@ -0,0 +1,146 @@
+import asyncio
+from itertools import count
+from Shared.protocol import Protocol
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class Connection:
+    def __init__(self, websocket, codec: str = "json"):
+        self.websocket = websocket
+        self.codec = codec
+        self.ids = count(1)
+        self.pending: dict[int, asyncio.Queue] = {}
+        self.subscribers = {}
+        self.pushes = asyncio.Queue()
+        self.clear_pushes_on = set()
+        self.hold_pushes_on = set()
+        self.held = None
+        self.task = None
+        self.closed = False
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.receive_loop())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def receive_loop(self):
+        try:
+            while True:
+                frame = await self.websocket.recv()
+                self.dispatch(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Receive loop stopped: {e}")
+        finally:
+            self.closed = True
+            for queue in self.pending.values():
+                queue.put_nowait(ConnectionClosed("connection closed"))
+            self.pending.clear()
+
+    def dispatch(self, frame):
+        message = Protocol.parse_response(frame)
+        queue = self.pending.get(message.get("id"))
+        if queue is not None:
+            if message.get("id") in self.clear_pushes_on:
+                # pushes received before this response are already part of it
+                self.clear_pushes_on.discard(message["id"])
+                while not self.pushes.empty():
+                    self.pushes.get_nowait()
+            if message.get("id") in self.hold_pushes_on:
+                # later pushes refer to lines the rest of the stream delivers
+                self.hold_pushes_on.discard(message["id"])
+                self.held = []
+            queue.put_nowait(message)
+            return
+        callbacks = self.subscribers.get(message.get("command"))
+        if callbacks:
+            for callback in callbacks:
+                callback(message)
+        elif self.held is not None:
+            self.held.append(frame)
+        else:
+            self.pushes.put_nowait(frame)
+
+    def release_pushes(self):
+        for frame in self.held or ():
+            self.pushes.put_nowait(frame)
+        self.held = None
+
+    def subscribe(self, command: str, callback):
+        self.subscribers.setdefault(command, []).append(callback)
+
+    def unsubscribe(self, command: str, callback):
+        callbacks = self.subscribers.get(command, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def encode(self, command: str, data=None, request_id=None):
+        message = {"command": command, "data": data or {}}
+        if request_id is not None:
+            message["id"] = request_id
+        return Protocol.encode(message, self.codec)
+
+    def open(self, command: str, data=None):
+        if self.closed:
+            raise ConnectionClosed("connection closed")
+        request_id = next(self.ids)
+        self.pending[request_id] = asyncio.Queue()
+        return request_id, self.encode(command, data, request_id)
+
+    async def request(self, command: str, data=None, clear_pushes=False) -> dict:
+        request_id, frame = self.open(command, data)
+        if clear_pushes:
+            self.clear_pushes_on.add(request_id)
+        try:
+            await self.websocket.send(frame)
+            return await self.next_response(request_id)
+        finally:
+            self.pending.pop(request_id, None)
+            self.clear_pushes_on.discard(request_id)
+
+    async def stream(
+        self, command: str, data=None, clear_pushes=False, hold_pushes=False
+    ):
+        # multi-frame responses end with a frame whose data has done=True
+        request_id, frame = self.open(command, data)
+        if clear_pushes:
+            self.clear_pushes_on.add(request_id)
+        if hold_pushes:
+            self.hold_pushes_on.add(request_id)
+        try:
+            await self.websocket.send(frame)
+            while True:
+                message = await self.next_response(request_id)
+                yield message
+                if message["data"].get("done", True):
+                    return
+        finally:
+            self.pending.pop(request_id, None)
+            self.clear_pushes_on.discard(request_id)
+            if hold_pushes:
+                self.hold_pushes_on.discard(request_id)
+                self.release_pushes()
+
+    async def next_response(self, request_id: int) -> dict:
+        message = await self.pending[request_id].get()
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def notify(self, command: str, data=None):
+        await self.websocket.send(self.encode(command, data, next(self.ids)))
+
+    async def send(self, frame):
+        await self.websocket.send(frame)
+
+    async def recv(self):
+        return await self.pushes.get()
@@ -1,4 +1,10 @@
+from .viewport import Viewport
+
+
 class CursorMover:
+    def __init__(self, viewport: Viewport = None):
+        self.viewport = viewport if viewport is not None else Viewport()
+
     def left(self, cursor_x: int, cursor_y: int, text: list[str]):
         if cursor_x > 0:
             cursor_x -= 1
@@ -26,3 +32,16 @@ class CursorMover:
             cursor_y += 1
             cursor_x = min(cursor_x, len(text[cursor_y]) if text[cursor_y] else 0)
         return cursor_x, cursor_y
+
+    def page_up(self, cursor_x: int, cursor_y: int, text: list[str]):
+        # the view moves with the cursor, which keeps its row on screen
+        step = min(self.viewport.height, cursor_y)
+        self.viewport.top = max(self.viewport.top - self.viewport.height, 0)
+        cursor_y -= step
+        return min(cursor_x, len(text[cursor_y])), cursor_y
+
+    def page_down(self, cursor_x: int, cursor_y: int, text: list[str]):
+        step = min(self.viewport.height, len(text) - 1 - cursor_y)
+        self.viewport.top += step
+        cursor_y += step
+        return min(cursor_x, len(text[cursor_y])), cursor_y
@@ -1,26 +1,45 @@
 import curses
 import asyncio
+import threading
 import time
 import pyperclip
+from Shared.crdt import OPERATIONS as CRDT_OPERATIONS, CrdtDocument
+from Shared.ot import inserted_text, point, shift_by_delete, shift_by_insert
 from Shared.protocol import Protocol
 
 try:
     from message_sender import MessageSender
     from cursor_mover import CursorMover
     from selection import Selection
+    from renderer import Renderer
+    from viewport import Viewport
+    from typing_buffer import TypingBuffer
 except ModuleNotFoundError:
     from .message_sender import MessageSender
     from .cursor_mover import CursorMover
     from .selection import Selection
+    from .renderer import Renderer
+    from .viewport import Viewport
+    from .typing_buffer import TypingBuffer
 
 
 class Editor:
     def __init__(self, event_loop, user_id):
         self.user_id = user_id
         self.event_loop = event_loop
-        self.selection = Selection()
+        self.viewport = Viewport()
+        self.selection = Selection(self.viewport)
         self.sender = MessageSender()
-        self.cursor = CursorMover()
+        self.cursor = CursorMover(self.viewport)
+        self.renderer = Renderer(self.viewport)
+        self.typing = TypingBuffer(self.sender, user_id)
+        # where the cursor is now, as last drawn by the curses thread or
+        # moved by remote edits
+        self.cursor_y, self.cursor_x = 0, 0
+        # held by the curses thread while it edits the content and by the
+        # event loop while it applies remote operations to it, and by either
+        # while it draws
+        self.lock = threading.RLock()
 
     async def edit(self, content: list[str], filename: str, stop_event, websocket):
         await asyncio.get_event_loop().run_in_executor(
@@ -46,69 +65,141 @@ class Editor:
         websocket,
         stdscr,
         current_content: list[str],
-        cursor_y: int,
-        cursor_x: int,
     ):
         try:
             while True:
                 message = await websocket.recv()
                 update = Protocol.parse_response(message)
-                operation = update["data"]["operation"]
-                start_y, start_x = (
-                    operation["start_pos"]["y"],
-                    operation["start_pos"]["x"],
-                )
-
-                if operation["op_type"] == "insert":
-                    insert_text = operation["text"]
-                    close_line = current_content[start_y][start_x:]
-                    for i in range(len(insert_text)):
-                        if i == 0:
-                            current_content[start_y] = (
-                                current_content[start_y][:start_x] + insert_text[i]
-                            )
-                        else:
-                            current_content.insert(start_y + i, insert_text[i])
-                    current_content[start_y + len(insert_text) - 1] += close_line
-                elif operation["op_type"] == "delete":
-                    end_y, end_x = (
-                        operation["end_pos"]["y"],
-                        operation["end_pos"]["x"],
+                if update.get("command") == "EDIT_BATCH":
+                    entries = update["data"]["operations"]
+                else:
+                    entries = [update["data"]]
+                with self.lock:
+                    # typing not sent yet is registered first, so remote
+                    # operations are rebased over it
+                    self.typing.flush()
+                    for entry in entries:
+                        if entry.get("ack"):
+                            self.sender.acknowledge(entry)
+                            continue
+                        for operation in self.integrate(entry):
+                            self.renderer.damage(operation)
+                            self.shift_cursor(operation)
+                            self.apply_remote_operation(current_content, operation)
+                    cursor_y = max(min(self.cursor_y, len(current_content) - 1), 0)
+                    cursor_x = min(
+                        self.cursor_x,
+                        len(current_content[cursor_y]) if current_content else 0,
                     )
-                    close_line = current_content[end_y][end_x:]
-                    if start_y == end_y:
-                        current_content[start_y] = (
-                            current_content[start_y][:start_x] + close_line
-                        )
-                    else:
-                        for i in range(start_y + 1, end_y + 1):
-                            current_content.pop(i)
-                        current_content[start_y] = (
-                            current_content[start_y][:start_x] + close_line
-                        )
 
-                elif operation["op_type"] == "new line":
-                    new_line = current_content[start_y][start_x:]
-                    current_content[start_y] = current_content[start_y][:start_x]
-                    current_content.insert(start_y + 1, new_line)
-
-                elif operation["op_type"] == "insert_text":
-                    insert_text = operation["insert_text"]
-                    close_line = current_content[start_y][start_x:]
-                    for i in range(len(insert_text)):
-                        if i == 0:
-                            current_content[start_y] = (
-                                current_content[start_y][:start_x] + insert_text[i]
-                            )
-                        else:
-                            current_content.insert(start_y + i, insert_text[i])
-                    current_content[start_y + len(insert_text) - 1] += close_line
-
-                self.display_text(stdscr, current_content, cursor_y, cursor_x)
+                    self.display_text(stdscr, current_content, cursor_y, cursor_x)
+                await self.sender.drain()
 
         except asyncio.CancelledError:
             pass
 
+    def shift_cursor(self, operation):
+        # keeps the cursor on the same text, before the operation is applied
+        kind = operation["op_type"]
+        start = (self.cursor_y, self.cursor_x)
+        if kind in ("insert", "new line"):
+            text = inserted_text(operation)
+        elif kind == "insert_text":
+            text = operation["insert_text"]
+        elif kind == "delete":
+            self.cursor_y, self.cursor_x = shift_by_delete(
+                start, point(operation["start_pos"]), point(operation["end_pos"])
+            )
+            return
+        else:
+            return
+        self.cursor_y, self.cursor_x = shift_by_insert(
+            start, point(operation["start_pos"]), text, False
+        )
+
+    def integrate(self, entry) -> list:
+        # remote operations are moved past our own unacknowledged ones
+        revisions = self.sender.revisions
+        operation = entry["operation"]
+        if operation["op_type"] == "resync":
+            if "crdt" in operation and self.sender.replica is not None:
+                self.sender.replica = CrdtDocument.from_state(
+                    operation["crdt"], self.sender.replica.site
+                )
+            if revisions is not None and "revision" in entry:
+                revisions.reset(entry["revision"])
+            return [operation]
+        if revisions is None or "revision" not in entry:
+            return self.project([operation])
+        return self.project(revisions.receive(operation, entry["revision"]))
+
+    def project(self, operations) -> list:
+        # CRDT operations become the line edits they made to the replica
+        replica = self.sender.replica
+        if replica is None:
+            return operations
+        projected = []
+        for operation in operations:
+            if operation["op_type"] in CRDT_OPERATIONS:
+                projected.extend(replica.apply(operation))
+            else:
+                projected.append(operation)
+        return projected
+
+    @staticmethod
+    def apply_remote_operation(current_content: list[str], operation):
+        start_y, start_x = (
+            operation["start_pos"]["y"],
+            operation["start_pos"]["x"],
+        )
+
+        if operation["op_type"] == "insert":
+            insert_text = operation["text"]
+            close_line = current_content[start_y][start_x:]
+            for i in range(len(insert_text)):
+                if i == 0:
+                    current_content[start_y] = (
+                        current_content[start_y][:start_x] + insert_text[i]
+                    )
+                else:
+                    current_content.insert(start_y + i, insert_text[i])
+            current_content[start_y + len(insert_text) - 1] += close_line
+        elif operation["op_type"] == "delete":
+            end_y, end_x = (
+                operation["end_pos"]["y"],
+                operation["end_pos"]["x"],
+            )
+            close_line = current_content[end_y][end_x:]
+            if start_y == end_y:
+                current_content[start_y] = (
+                    current_content[start_y][:start_x] + close_line
+                )
+            else:
+                del current_content[start_y + 1 : end_y + 1]
+                current_content[start_y] = (
+                    current_content[start_y][:start_x] + close_line
+                )
+
+        elif operation["op_type"] == "new line":
+            new_line = current_content[start_y][start_x:]
+            current_content[start_y] = current_content[start_y][:start_x]
+            current_content.insert(start_y + 1, new_line)
+
+        elif operation["op_type"] == "insert_text":
+            insert_text = operation["insert_text"]
+            close_line = current_content[start_y][start_x:]
+            for i in range(len(insert_text)):
+                if i == 0:
+                    current_content[start_y] = (
+                        current_content[start_y][:start_x] + insert_text[i]
+                    )
+                else:
+                    current_content.insert(start_y + i, insert_text[i])
+            current_content[start_y + len(insert_text) - 1] += close_line
+
+        elif operation["op_type"] == "resync":
+            current_content[:] = operation["text"]
+
     def insert_text(
         self,
         websocket,
@@ -121,6 +212,8 @@ class Editor:
 
         text = pyperclip.paste()
         text = text.split("\n")
+        self.renderer.touch(cursor_y)
+        self.renderer.shift(cursor_y + 1, len(text) - 1)
         close_line = current_content[cursor_y][cursor_x:]
 
         for i in range(len(text)):
@@ -167,12 +260,21 @@ class Editor:
 
         current_content[start_y] = start_line + close_line
 
-    @staticmethod
-    def display_text(stdscr, current_content: list[str], cursor_y: int, cursor_x: int):
-        stdscr.clear()
-        for i, line in enumerate(current_content):
-            stdscr.addstr(i, 0, line)
-        stdscr.move(cursor_y, cursor_x)
+    def display_text(
+        self, stdscr, current_content: list[str], cursor_y: int, cursor_x: int
+    ):
+        # both threads draw; damage recorded while a frame is painted would
+        # be cleared with it
+        with self.lock:
+            self.cursor_y, self.cursor_x = cursor_y, cursor_x
+            self.renderer.render(stdscr, current_content, cursor_y, cursor_x)
+
+    def resize(self, stdscr):
+        height, width = stdscr.getmaxyx()
+        with self.lock:
+            # the last column stays free for the cursor after a full row
+            self.viewport.resize(height, width - 1)
+            self.renderer.invalidate()
 
     def curses_editor(
         self,
@@ -196,52 +298,30 @@ class Editor:
         )
 
         last_input_time = time.time()
-        start_y, start_x = None, None
-        inserted_text: list[str] = []
-        count_delete_char = 0
-        end_y, end_x = None, None
+        self.typing.open(websocket, filename, event_loop)
 
         def update_line(y: int):
-            stdscr.move(y, 0)
-            stdscr.clrtoeol()
-            stdscr.addstr(y, 0, current_content[y])
-            stdscr.move(cursor_y, cursor_x)
-            stdscr.refresh()
+            self.renderer.touch(y)
+            self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
+        self.resize(stdscr)
         self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
         update_task = asyncio.run_coroutine_threadsafe(
-            self.listen_for_update(
-                websocket, stdscr, current_content, cursor_y, cursor_x
-            ),
+            self.listen_for_update(websocket, stdscr, current_content),
             event_loop,
         )
 
         while True:
             key = stdscr.getch()
+            if key != -1:
+                with self.lock:
+                    # remote edits may have moved the cursor since the last key
+                    cursor_y, cursor_x = self.cursor_y, self.cursor_x
 
             if key == 27:
-                if inserted_text or count_delete_char > 0:
-                    self.sender.send_edit_message(
-                        websocket,
-                        filename,
-                        inserted_text,
-                        start_y,
-                        start_x,
-                        event_loop,
-                        self.user_id,
-                    )
-                    self.sender.send_delete_message(
-                        websocket,
-                        filename,
-                        end_y,
-                        end_x,
-                        start_y,
-                        start_x,
-                        count_delete_char,
-                        event_loop,
-                        self.user_id,
-                    )
+                with self.lock:
+                    self.typing.flush()
 
                 asyncio.run_coroutine_threadsafe(
                     self.save_content_file(filename, current_content, websocket),
@@ -250,120 +330,99 @@ class Editor:
                 break
 
             elif key in (curses.KEY_BACKSPACE, 8, 127):
-                if inserted_text:
-                    self.sender.send_edit_message(
+                with self.lock:
+                    erased_y, erased_x = cursor_y, cursor_x
+                    if cursor_x > 0:
+                        current_content[cursor_y] = (
+                            current_content[cursor_y][: cursor_x - 1]
+                            + current_content[cursor_y][cursor_x:]
+                        )
+                        cursor_x -= 1
+                        update_line(cursor_y)
+
+                    elif cursor_y > 0:
+                        prev_line_len = len(current_content[cursor_y - 1])
+                        current_content[cursor_y - 1] += current_content[cursor_y]
+                        del current_content[cursor_y]
+                        cursor_y -= 1
+                        cursor_x = prev_line_len
+                        self.renderer.touch(cursor_y)
+                        self.renderer.shift(cursor_y + 1, -1)
+                        self.display_text(stdscr, current_content, cursor_y, cursor_x)
+
+                    if (cursor_y, cursor_x) != (erased_y, erased_x):
+                        self.typing.erase(erased_y, erased_x, cursor_y, cursor_x)
+
+                last_input_time = time.time()
+
+            elif key == 10:
+                with self.lock:
+                    self.typing.flush()
+                    self.insert_enter(current_content, cursor_y, cursor_x)
+                    self.renderer.touch(cursor_y)
+                    self.renderer.shift(cursor_y + 1, 1)
+                    self.sender.send_new_line(
                         websocket,
                         filename,
-                        inserted_text,
-                        start_y,
-                        start_x,
+                        cursor_y,
+                        cursor_x,
                         event_loop,
                         self.user_id,
                     )
-                    start_x, start_y = None, None
-                    inserted_text.clear()
 
-                if start_y is None and start_x is None:
-                    start_y, start_x = cursor_y, cursor_x
-
-                if cursor_x > 0:
-                    current_content[cursor_y] = (
-                        current_content[cursor_y][: cursor_x - 1]
-                        + current_content[cursor_y][cursor_x:]
-                    )
-                    cursor_x -= 1
-                    end_x = cursor_x
-                    update_line(cursor_y)
+                    cursor_y += 1
+                    cursor_x = 0
 
-                elif cursor_y > 0:
-                    prev_line_len = len(current_content[cursor_y - 1])
-                    current_content[cursor_y - 1] += current_content[cursor_y]
-                    del current_content[cursor_y]
-                    cursor_y -= 1
-                    cursor_x = prev_line_len
-                    end_x = cursor_x
                     self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
-                end_y = cursor_y
-
-                count_delete_char += 1
-                last_input_time = time.time()
-
-            elif key == 10:
-                self.insert_enter(current_content, cursor_y, cursor_x)
-                self.sender.send_new_line(
-                    websocket,
-                    filename,
-                    cursor_y,
-                    cursor_x,
-                    event_loop,
-                    self.user_id,
-                )
-
-                cursor_y += 1
-                cursor_x = 0
-
-                self.display_text(stdscr, current_content, cursor_y, cursor_x)
-
             elif key == curses.KEY_LEFT:
                 cursor_x, cursor_y = self.cursor.left(
                     cursor_x, cursor_y, current_content
                 )
-                stdscr.move(cursor_y, cursor_x)
-                stdscr.refresh()
+                self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
             elif key == curses.KEY_RIGHT:
                 cursor_x, cursor_y = self.cursor.right(
                     cursor_x, cursor_y, current_content
                 )
-                stdscr.move(cursor_y, cursor_x)
-                stdscr.refresh()
+                self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
             elif key == curses.KEY_UP:
                 cursor_x, cursor_y = self.cursor.up(cursor_x, cursor_y, current_content)
-                stdscr.move(cursor_y, cursor_x)
-                stdscr.refresh()
+                self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
             elif key == curses.KEY_DOWN:
                 cursor_x, cursor_y = self.cursor.down(
                     cursor_x, cursor_y, current_content
                 )
-                stdscr.move(cursor_y, cursor_x)
-                stdscr.refresh()
-
-            elif key >= 32:
-                if count_delete_char > 0:
-                    self.sender.send_delete_message(
-                        websocket,
-                        filename,
-                        end_y,
-                        end_x,
-                        start_y,
-                        start_x,
-                        count_delete_char,
-                        event_loop,
-                        self.user_id,
-                    )
-                    count_delete_char = 0
+                self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
-                if not inserted_text:
-                    start_y, start_x = cursor_y, cursor_x
+            elif key in (curses.KEY_PPAGE, curses.KEY_NPAGE):
+                page = (
+                    self.cursor.page_up
+                    if key == curses.KEY_PPAGE
+                    else self.cursor.page_down
+                )
+                cursor_x, cursor_y = page(cursor_x, cursor_y, current_content)
+                self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
-                while len(current_content) <= cursor_y:
-                    current_content.append("")
+            elif key == curses.KEY_RESIZE:
+                self.resize(stdscr)
+                self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
-                current_content[cursor_y] = (
-                    current_content[cursor_y][:cursor_x]
-                    + chr(key)
-                    + current_content[cursor_y][cursor_x:]
-                )
-                cursor_x += 1
-                update_line(cursor_y)
+            elif key >= 32:
+                with self.lock:
+                    while len(current_content) <= cursor_y:
+                        current_content.append("")
 
-                if not inserted_text:
-                    inserted_text.append(chr(key))
-                else:
-                    inserted_text[0] += chr(key)
+                    current_content[cursor_y] = (
+                        current_content[cursor_y][:cursor_x]
+                        + chr(key)
+                        + current_content[cursor_y][cursor_x:]
+                    )
+                    self.typing.type(cursor_y, cursor_x, chr(key))
+                    cursor_x += 1
+                    update_line(cursor_y)
 
                 last_input_time = time.time()
 
@@ -372,49 +431,73 @@ class Editor:
                 while True:
                     key = stdscr.getch()
                     if key == 5:
-                        self.selection.clear_selection()
-                        self.selection.clear_clipboard()
-                        self.selection.clear_container()
-                        self.display_text(stdscr, current_content, cursor_y, cursor_x)
+                        with self.lock:
+                            self.selection.clear_selection()
+                            self.selection.clear_clipboard()
+                            self.selection.clear_container()
+                            # the highlighting was drawn around the renderer
+                            self.renderer.invalidate()
+                            self.display_text(
+                                stdscr, current_content, cursor_y, cursor_x
+                            )
                         break
 
                     elif key == curses.KEY_LEFT:
-                        if cursor_x - 1 >= 0:
-                            cursor_x, cursor_y = self.cursor.left(
+                        with self.lock:
+                            if cursor_x - 1 >= 0:
+                                cursor_x, cursor_y = self.cursor.left(
+                                    cursor_x, cursor_y, current_content
+                                )
+                                self.selection.left(
+                                    stdscr, cursor_x, cursor_y, current_content
+                                )
+                                self.display_text(
+                                    stdscr, current_content, cursor_y, cursor_x
+                                )
+
+                    elif key == curses.KEY_RIGHT:
+                        with self.lock:
+                            if cursor_x + 1 <= len(current_content[cursor_y]):
+                                self.selection.right(
+                                    stdscr, cursor_x, cursor_y, current_content
+                                )
+                                cursor_x, cursor_y = self.cursor.right(
+                                    cursor_x, cursor_y, current_content
+                                )
+                                self.display_text(
+                                    stdscr, current_content, cursor_y, cursor_x
+                                )
+
+                    elif key == curses.KEY_UP:
+                        with self.lock:
+                            cursor_x, cursor_y = self.cursor.up(
                                 cursor_x, cursor_y, current_content
                             )
-                            self.selection.left(
-                                stdscr, cursor_x, cursor_y, current_content
+                            # scrolled first, so the highlighting lands on screen
+                            self.display_text(
+                                stdscr, current_content, cursor_y, cursor_x
                             )
-                            stdscr.move(cursor_y, cursor_x)
-                            stdscr.refresh()
-
-                    elif key == curses.KEY_RIGHT:
-                        if cursor_x + 1 <= len(current_content[cursor_y]):
-                            self.selection.right(
+                            self.selection.up(
                                 stdscr, cursor_x, cursor_y, current_content
                             )
-                            cursor_x, cursor_y = self.cursor.right(
-                                cursor_x, cursor_y, current_content
+                            self.display_text(
+                                stdscr, current_content, cursor_y, cursor_x
                             )
-                            stdscr.move(cursor_y, cursor_x)
-                            stdscr.refresh()
-
-                    elif key == curses.KEY_UP:
-                        cursor_x, cursor_y = self.cursor.up(
-                            cursor_x, cursor_y, current_content
-                        )
-                        self.selection.up(stdscr, cursor_x, cursor_y, current_content)
-                        stdscr.move(cursor_y, cursor_x)
-                        stdscr.refresh()
 
                     elif key == curses.KEY_DOWN:
-                        cursor_x, cursor_y = self.cursor.down(
-                            cursor_x, cursor_y, current_content
-                        )
-                        self.selection.down(stdscr, cursor_x, cursor_y, current_content)
-                        stdscr.move(cursor_y, cursor_x)
-                        stdscr.refresh()
+                        with self.lock:
+                            cursor_x, cursor_y = self.cursor.down(
+                                cursor_x, cursor_y, current_content
+                            )
+                            self.display_text(
+                                stdscr, current_content, cursor_y, cursor_x
+                            )
+                            self.selection.down(
+                                stdscr, cursor_x, cursor_y, current_content
+                            )
+                            self.display_text(
+                                stdscr, current_content, cursor_y, cursor_x
+                            )
 
                     elif key in (curses.KEY_BACKSPACE, 8, 127):
                         start_y = self.selection.get_start_selection_y()
@@ -422,66 +505,55 @@ class Editor:
                         end_y = self.selection.get_end_selection_y()
                         end_x = self.selection.get_end_selection_x()
 
-                        self.delete_piece(
-                            current_content, start_y, start_x, end_y, end_x
-                        )
-                        self.sender.send_delete_message(
-                            websocket,
-                            filename,
-                            start_y,
-                            start_x,
-                            end_y,
-                            end_x,
-                            1,
-                            event_loop,
-                            self.user_id,
-                        )
-                        self.display_text(stdscr, current_content, cursor_y, cursor_x)
+                        with self.lock:
+                            self.typing.flush()
+                            self.delete_piece(
+                                current_content, start_y, start_x, end_y, end_x
+                            )
+                            self.renderer.touch(start_y)
+                            self.renderer.shift(start_y + 1, start_y - end_y)
+                            self.sender.send_delete_message(
+                                websocket,
+                                filename,
+                                start_y,
+                                start_x,
+                                end_y,
+                                end_x,
+                                1,
+                                event_loop,
+                                self.user_id,
+                            )
+                            self.display_text(
+                                stdscr, current_content, cursor_y, cursor_x
+                            )
 
                     elif key == 21:  # ctrl + u копирование
                         text = "\n".join(self.selection.get_clipboard())
                         pyperclip.copy(text)
 
             elif key == 22:  # ctrl + v вставка
-                self.insert_text(
-                    websocket,
-                    filename,
-                    current_content,
-                    cursor_y,
-                    cursor_x,
-                    event_loop,
-                )
-                self.display_text(stdscr, current_content, cursor_y, cursor_x)
+                with self.lock:
+                    self.typing.flush()
+                    self.insert_text(
+                        websocket,
+                        filename,
+                        current_content,
+                        cursor_y,
+                        cursor_x,
+                        event_loop,
+                    )
+                    self.display_text(stdscr, current_content, cursor_y, cursor_x)
 
             elif key == 24:  # ctrl + x отмена действия
-                self.sender.cancel_changes(
-                    websocket, filename, event_loop, self.user_id
-                )
+                with self.lock:
+                    self.typing.flush()
+                    self.sender.cancel_changes(
+                        websocket, filename, event_loop, self.user_id
+                    )
 
             if (time.time() - last_input_time) > 1:
-                self.sender.send_edit_message(
-                    websocket,
-                    filename,
-                    inserted_text,
-                    start_y,
-                    start_x,
-                    event_loop,
-                    self.user_id,
-                )
-                self.sender.send_delete_message(
-                    websocket,
-                    filename,
-                    end_y,
-                    end_x,
-                    start_y,
-                    start_x,
-                    count_delete_char,
-                    event_loop,
-                    self.user_id,
-                )
-                inserted_text.clear()
-                start_x, start_y = None, None
-                count_delete_char = 0
+                with self.lock:
+                    self.typing.flush()
 
         update_task.cancel()
         stop_event.set()
@@ -1,10 +1,71 @@
 import asyncio
+import copy
+from collections import deque
 from Shared.protocol import Protocol
 
 
 class MessageSender:
-    @staticmethod
+    def __init__(self, codec: str = "json"):
+        self.codec = codec
+        self.revisions = None
+        self.replica = None
+        # where operations held back by the in-flight window go once acked
+        self.websocket = None
+        self.envelope = {}
+        # (websocket, data) in the order the edits were made
+        self.outbox = deque()
+        self.sending = asyncio.Lock()
+
+    def encode(self, data: dict):
+        return Protocol.encode(Protocol.create_response("EDIT_FILE", data), self.codec)
+
+    def send(self, websocket, data: dict, event_loop):
+        # the editor keeps reusing its buffers once the call returns
+        data = copy.deepcopy(data)
+        self.queue(websocket, data)
+        asyncio.run_coroutine_threadsafe(self.drain(), event_loop)
+
+    def queue(self, websocket, data: dict):
+        # called with the editor's lock held, right after the edit was applied
+        # locally, so the replica and the pending operations see local and
+        # remote edits in the order they were made
+        if self.replica is not None:
+            # CRDT documents send the operation made by the replica instead
+            data["operation"] = self.replica.local_operation(data["operation"])
+            if data["operation"] is None:
+                return
+        if self.revisions is None:
+            self.outbox.append((websocket, data))
+            return
+        self.websocket = websocket
+        self.envelope = {
+            key: value for key, value in data.items() if key != "operation"
+        }
+        self.release(self.revisions.submit(data["operation"]))
+
+    async def submit(self, websocket, data: dict):
+        self.queue(websocket, data)
+        await self.drain()
+
+    def acknowledge(self, entry: dict):
+        if self.revisions is not None:
+            self.release(self.revisions.ack(entry["revision"], entry.get("seq")))
+
+    def release(self, operations):
+        self.outbox.extend(
+            (self.websocket, dict(self.envelope, operation=operation))
+            for operation in operations
+        )
+
+    async def drain(self):
+        # one drain at a time, so frames leave in the order they were queued
+        async with self.sending:
+            while self.outbox:
+                websocket, data = self.outbox.popleft()
+                await websocket.send(self.encode(data))
+
     def send_edit_message(
+        self,
         websocket,
         filename: str,
         inserted_text: list[str],
@@ -14,8 +75,8 @@ class MessageSender:
         user_id: str,
     ):
         if inserted_text:
-            message = Protocol.create_message(
-                "EDIT_FILE",
+            self.send(
+                websocket,
                 {
                     "filename": filename,
                     "operation": {
@@ -28,11 +89,11 @@ class MessageSender:
                     },
                     "user_id": user_id,
                 },
+                event_loop,
             )
-            asyncio.run_coroutine_threadsafe(websocket.send(message), event_loop)
 
-    @staticmethod
     def send_delete_message(
+        self,
         websocket,
         filename: str,
         start_y: int,
@@ -44,8 +105,8 @@ class MessageSender:
         user_id: str,
     ):
         if count > 0:
-            message = Protocol.create_message(
-                "EDIT_FILE",
+            self.send(
+                websocket,
                 {
                     "filename": filename,
                     "operation": {
@@ -56,11 +117,11 @@ class MessageSender:
                     },
                     "user_id": user_id,
                 },
+                event_loop,
             )
-            asyncio.run_coroutine_threadsafe(websocket.send(message), event_loop)
 
-    @staticmethod
     def send_new_line(
+        self,
         websocket,
         filename: str,
         start_y: int,
@@ -68,8 +129,8 @@ class MessageSender:
         event_loop,
         user_id: str,
     ):
-        message = Protocol.create_message(
-            "EDIT_FILE",
+        self.send(
+            websocket,
             {
                 "filename": filename,
                 "operation": {
@@ -78,13 +139,12 @@ class MessageSender:
                 },
                 "user_id": user_id,
             },
+            event_loop,
         )
-        asyncio.run_coroutine_threadsafe(websocket.send(message), event_loop)
 
-    @staticmethod
-    def cancel_changes(websocket, filename: str, event_loop, user_id: str):
-        message = Protocol.create_message(
-            "EDIT_FILE",
+    def cancel_changes(self, websocket, filename: str, event_loop, user_id: str):
+        self.send(
+            websocket,
             {
                 "filename": filename,
                 "operation": {
@@ -93,5 +153,5 @@ class MessageSender:
                 },
                 "user_id": user_id,
             },
+            event_loop,
         )
-        asyncio.run_coroutine_threadsafe(websocket.send(message), event_loop)
@@ -0,0 +1,146 @@
+import curses
+import time
+from collections import deque
+from .viewport import Viewport
+
+
+def shifted(rows: set[int], y: int, count: int) -> set[int]:
+    # line numbers after `count` lines were inserted at y, or removed from it
+    # when negative; removed lines are dropped
+    moved = set()
+    for row in rows:
+        if row < y:
+            moved.add(row)
+        elif count > 0 or row >= y - count:
+            moved.add(row + count)
+    return moved
+
+
+class Renderer:
+    # repaints only the screen rows that edits touched since the last frame;
+    # lines added or removed, and scrolling, move the rows already on screen
+    # with the terminal's insert/delete line instead of redrawing them. Only
+    # lines inside the viewport are ever written
+    def __init__(self, viewport: Viewport = None):
+        self.viewport = viewport if viewport is not None else Viewport()
+        self.full = True
+        # document lines to repaint and (line, count) shifts since last frame
+        self.dirty: set[int] = set()
+        self.shifts: list[tuple[int, int]] = []
+        # top, left, height and width of the viewport the screen shows
+        self.shown = None
+        self.frames = 0
+        self.cells = 0
+        self.frame_times = deque(maxlen=1024)
+
+    def invalidate(self):
+        self.full = True
+        self.dirty.clear()
+        self.shifts.clear()
+
+    def touch(self, start: int, end: int = None):
+        if self.full:
+            return
+        end = start if end is None else end
+        if end - start >= self.viewport.height:
+            self.invalidate()
+            return
+        self.dirty.update(range(start, end + 1))
+
+    def shift(self, y: int, count: int):
+        # `count` lines inserted at line y, or removed from it when negative
+        if self.full or not count:
+            return
+        if abs(count) >= self.viewport.height:
+            self.invalidate()
+            return
+        self.shifts.append((y, count))
+        self.dirty = shifted(self.dirty, y, count)
+        if count > 0:
+            self.touch(y, y + count - 1)
+
+    def damage(self, operation):
+        # what a positional operation does to the screen, before it is applied
+        kind = operation["op_type"]
+        if kind == "resync":
+            self.invalidate()
+            return
+        if kind not in ("insert", "insert_text", "delete", "new line"):
+            return
+        y = operation["start_pos"]["y"]
+        if kind == "new line":
+            added = 1
+        elif kind == "delete":
+            added = y - operation["end_pos"]["y"]
+        else:
+            text = operation["text" if kind == "insert" else "insert_text"]
+            added = max(len(text or []) - 1, 0)
+        self.touch(y)
+        self.shift(y + 1, added)
+
+    def scroll(self, stdscr) -> set[int]:
+        # replays the shifts and the viewport's vertical scroll on the rows
+        # on screen; returns the lines that moved into view
+        top, _, height, _ = self.shown
+        exposed = set()
+        for y, count in self.shifts:
+            if y >= top + height:
+                continue
+            row = max(y - top, 0)
+            stdscr.move(row, 0)
+            stdscr.insdelln(count)
+            exposed = shifted(exposed, y, count)
+            if count > 0:
+                exposed.update(range(top + row, top + row + count))
+            else:
+                exposed.update(range(top + height + count, top + height))
+        distance = self.viewport.top - top
+        if distance:
+            stdscr.move(0, 0)
+            stdscr.insdelln(-distance)
+            if distance > 0:
+                exposed.update(
+                    range(self.viewport.bottom() - distance, self.viewport.bottom())
+                )
+            else:
+                exposed.update(range(self.viewport.top, self.viewport.top - distance))
+        return exposed
+
+    def render(self, stdscr, lines: list[str], cursor_y: int, cursor_x: int):
+        viewport = self.viewport
+        viewport.follow(cursor_y, cursor_x)
+        shown = (viewport.top, viewport.left, viewport.height, viewport.width)
+        if self.shown is None or shown[1:] != self.shown[1:]:
+            self.full = True
+        elif abs(viewport.top - self.shown[0]) >= viewport.height:
+            self.full = True
+
+        if self.full:
+            stdscr.erase()
+            rows = viewport.lines(len(lines))
+        else:
+            rows = sorted(filter(viewport.visible, self.dirty | self.scroll(stdscr)))
+        for y in rows:
+            row = y - viewport.top
+            stdscr.move(row, 0)
+            stdscr.clrtoeol()
+            if y < len(lines):
+                placed = viewport.clip(y, 0, lines[y])
+                if placed is not None and placed[2]:
+                    stdscr.addstr(*placed)
+                    self.cells += len(placed[2])
+        stdscr.move(*viewport.screen(cursor_y, cursor_x))
+        stdscr.noutrefresh()
+        curses.doupdate()
+
+        self.shown = shown
+        self.full = False
+        self.dirty.clear()
+        self.shifts.clear()
+        self.frames += 1
+        self.frame_times.append(time.monotonic())
+
+    def fps(self) -> int:
+        # frames drawn during the last second
+        now = time.monotonic()
+        return sum(1 for at in self.frame_times if now - at < 1)
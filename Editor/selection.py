@@ -1,9 +1,11 @@
 import curses
 from .container import Container
+from .viewport import Viewport
 
 
 class Selection:
-    def __init__(self):
+    def __init__(self, viewport: Viewport = None):
+        self.viewport = viewport if viewport is not None else Viewport()
         self.container_x = Container()
         self.container_y = Container()
         self.clipboard = []
@@ -15,6 +17,17 @@ class Selection:
         self.start_selection_y = start_y
         self.start_selection_x = start_x
 
+    # document coordinates; what falls outside the viewport is not drawn
+    def draw(self, stdscr, y: int, x: int, text: str, *attributes):
+        placed = self.viewport.clip(y, x, text)
+        if placed is not None:
+            stdscr.addstr(*placed, *attributes)
+
+    def draw_char(self, stdscr, y: int, x: int, char: str, *attributes):
+        placed = self.viewport.clip(y, x, char)
+        if placed is not None and placed[2]:
+            stdscr.addch(*placed, *attributes)
+
     def clear_clipboard(self):
         self.clipboard = []
         self.clipboard_y = 0
@@ -67,7 +80,8 @@ class Selection:
     def left(self, stdscr, cursor_x: int, cursor_y: int, text: list[str]):
         if self.container_y.is_empty():
             if self.container_x.is_empty():
-                stdscr.addch(
+                self.draw_char(
+                    stdscr,
                     cursor_y,
                     cursor_x,
                     text[cursor_y][cursor_x],
@@ -77,7 +91,8 @@ class Selection:
                 self.container_x.add("Left")
 
             elif self.container_x.get_last() == "Left":  # Continue selecting left
-                stdscr.addch(
+                self.draw_char(
+                    stdscr,
                     cursor_y,
                     cursor_x,
                     text[cursor_y][cursor_x],
@@ -90,24 +105,27 @@ class Selection:
 
             elif self.container_x.get_last() == "Right":  # Undo selection right
                 self.container_x.pop_last()
-                stdscr.addch(cursor_y, cursor_x, text[cursor_y][cursor_x])
+                self.draw_char(stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x])
                 self.clipboard[self.clipboard_y] = self.clipboard[self.clipboard_y][:-1]
 
         elif self.container_y.get_last() == "Up":
-            stdscr.addch(cursor_y, cursor_x, text[cursor_y][cursor_x], curses.A_REVERSE)
+            self.draw_char(
+                stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x], curses.A_REVERSE
+            )
             self.clipboard[self.clipboard_y] = (
                 text[cursor_y][cursor_x] + self.clipboard[self.clipboard_y]
             )
 
         elif self.container_y.get_last() == "Down":
-            stdscr.addch(cursor_y, cursor_x, text[cursor_y][cursor_x])
+            self.draw_char(stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x])
             self.clipboard[self.clipboard_y] = self.clipboard[self.clipboard_y][:-1]
         self.end_selection_y, self.end_selection_x = cursor_y, cursor_x
 
     def right(self, stdscr, cursor_x: int, cursor_y: int, text: list[str]):
         if self.container_y.is_empty():
             if self.container_x.is_empty():
-                stdscr.addch(
+                self.draw_char(
+                    stdscr,
                     cursor_y,
                     cursor_x,
                     text[cursor_y][cursor_x],
@@ -117,7 +135,8 @@ class Selection:
                 self.container_x.add("Right")
 
             elif self.container_x.get_last() == "Right":  # выделение вправо
-                stdscr.addch(
+                self.draw_char(
+                    stdscr,
                     cursor_y,
                     cursor_x,
                     text[cursor_y][cursor_x],
@@ -128,25 +147,28 @@ class Selection:
 
             elif self.container_x.get_last() == "Left":  # отмена выделения влево
                 self.container_x.pop_last()
-                stdscr.addch(cursor_y, cursor_x, text[cursor_y][cursor_x])
+                self.draw_char(stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x])
                 self.clipboard[self.clipboard_y] = self.clipboard[self.clipboard_y][1:]
 
         elif self.container_y.get_last() == "Up":
-            stdscr.addch(cursor_y, cursor_x, text[cursor_y][cursor_x])
+            self.draw_char(stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x])
             self.clipboard[self.clipboard_y] = self.clipboard[self.clipboard_y][1:]
 
         elif self.container_y.get_last() == "Down":
-            stdscr.addch(cursor_y, cursor_x, text[cursor_y][cursor_x], curses.A_REVERSE)
+            self.draw_char(
+                stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x], curses.A_REVERSE
+            )
             self.clipboard[self.clipboard_y] += text[cursor_y][cursor_x]
 
         self.end_selection_y, self.end_selection_x = cursor_y, cursor_x
 
     def up(self, stdscr, cursor_x: int, cursor_y: int, text: list[str]):
         if self.container_y.is_empty():
-            stdscr.addstr(
-                cursor_y, cursor_x, text[cursor_y][cursor_x:], curses.A_REVERSE
+            self.draw(
+                stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x:], curses.A_REVERSE
             )
-            stdscr.addstr(
+            self.draw(
+                stdscr,
                 self.start_selection_y,
                 0,
                 text[self.start_selection_y][: self.start_selection_x],
@@ -164,10 +186,11 @@ class Selection:
             self.container_y.add("Up")
 
         elif self.container_y.get_last() == "Up":
-            stdscr.addstr(
-                cursor_y, cursor_x, text[cursor_y][cursor_x:], curses.A_REVERSE
+            self.draw(
+                stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x:], curses.A_REVERSE
             )
-            stdscr.addstr(
+            self.draw(
+                stdscr,
                 self.end_selection_y,
                 0,
                 text[self.end_selection_y][: self.end_selection_x],
@@ -181,8 +204,8 @@ class Selection:
 
         elif self.container_y.get_last() == "Down":
             self.container_y.pop_last()
-            stdscr.addstr(self.end_selection_y, 0, text[self.end_selection_y])
-            stdscr.addstr(cursor_y, cursor_x, text[cursor_y][cursor_x:])
+            self.draw(stdscr, self.end_selection_y, 0, text[self.end_selection_y])
+            self.draw(stdscr, cursor_y, cursor_x, text[cursor_y][cursor_x:])
             self.clipboard.pop(-1)
             self.clipboard[-1] = (
                 ""
@@ -199,13 +222,14 @@ class Selection:
 
     def down(self, stdscr, cursor_x: int, cursor_y: int, text: list[str]):
         if self.container_y.is_empty():
-            stdscr.addstr(
+            self.draw(
+                stdscr,
                 self.start_selection_y,
                 self.start_selection_x,
                 text[self.start_selection_y][self.start_selection_x :],
                 curses.A_REVERSE,
             )
-            stdscr.addstr(cursor_y, 0, text[cursor_y][:cursor_x], curses.A_REVERSE)
+            self.draw(stdscr, cursor_y, 0, text[cursor_y][:cursor_x], curses.A_REVERSE)
 
             if self.container_x.is_empty():
                 self.clipboard.append(
@@ -221,13 +245,14 @@ class Selection:
             self.clipboard_y += 1
 
         elif self.container_y.get_last() == "Down":
-            stdscr.addstr(
+            self.draw(
+                stdscr,
                 self.end_selection_y,
                 self.end_selection_x,
                 text[self.end_selection_y][self.end_selection_x :],
                 curses.A_REVERSE,
             )
-            stdscr.addstr(cursor_y, 0, text[cursor_y][:cursor_x], curses.A_REVERSE)
+            self.draw(stdscr, cursor_y, 0, text[cursor_y][:cursor_x], curses.A_REVERSE)
             self.clipboard[-1] += text[self.end_selection_y][self.end_selection_x :]
             self.clipboard.append(text[cursor_y][:cursor_x])
             self.container_y.add("Down")
@@ -235,8 +260,8 @@ class Selection:
 
         elif self.container_y.get_last() == "Up":
             self.container_y.pop_last()
-            stdscr.addstr(self.end_selection_y, 0, text[self.end_selection_y])
-            stdscr.addstr(cursor_y, 0, text[cursor_y][:cursor_x])
+            self.draw(stdscr, self.end_selection_y, 0, text[self.end_selection_y])
+            self.draw(stdscr, cursor_y, 0, text[cursor_y][:cursor_x])
             self.clipboard.pop(0)
             # self.clipboard[0] = text[cursor_y][cursor_x:]
             self.clipboard[0] = (
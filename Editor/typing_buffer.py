@@ -0,0 +1,63 @@
+class TypingBuffer:
+    # characters typed, or erased with backspace, since the last flush. They
+    # are already in the editor's content and go out as one insert or one
+    # delete, which must happen before any remote operation is applied
+    def __init__(self, sender, user_id):
+        self.sender = sender
+        self.user_id = user_id
+        self.websocket = None
+        self.filename = None
+        self.event_loop = None
+        self.clear()
+
+    def open(self, websocket, filename: str, event_loop):
+        self.websocket = websocket
+        self.filename = filename
+        self.event_loop = event_loop
+
+    def clear(self):
+        self.start_y, self.start_x = None, None
+        self.end_y, self.end_x = None, None
+        self.inserted_text: list[str] = []
+        self.deleted = 0
+
+    def type(self, y: int, x: int, char: str):
+        if self.deleted:
+            self.flush()
+        if not self.inserted_text:
+            self.start_y, self.start_x = y, x
+            self.inserted_text.append(char)
+        else:
+            self.inserted_text[0] += char
+
+    def erase(self, y: int, x: int, end_y: int, end_x: int):
+        # a backspace at (y, x) left the cursor at (end_y, end_x)
+        if self.inserted_text:
+            self.flush()
+        if self.start_y is None:
+            self.start_y, self.start_x = y, x
+        self.end_y, self.end_x = end_y, end_x
+        self.deleted += 1
+
+    def flush(self):
+        self.sender.send_edit_message(
+            self.websocket,
+            self.filename,
+            self.inserted_text,
+            self.start_y,
+            self.start_x,
+            self.event_loop,
+            self.user_id,
+        )
+        self.sender.send_delete_message(
+            self.websocket,
+            self.filename,
+            self.end_y,
+            self.end_x,
+            self.start_y,
+            self.start_x,
+            self.deleted,
+            self.event_loop,
+            self.user_id,
+        )
+        self.clear()
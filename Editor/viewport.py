@@ -0,0 +1,44 @@
+class Viewport:
+    # the part of the document on screen: `height` lines from `top` and
+    # `width` columns from `left`
+    def __init__(self, height: int = 24, width: int = 80, top: int = 0, left: int = 0):
+        self.height = height
+        self.width = width
+        self.top = top
+        self.left = left
+
+    def resize(self, height: int, width: int):
+        self.height = max(height, 1)
+        self.width = max(width, 1)
+
+    def bottom(self) -> int:
+        return self.top + self.height
+
+    def lines(self, line_count: int) -> range:
+        return range(self.top, min(self.bottom(), line_count))
+
+    def visible(self, y: int) -> bool:
+        return self.top <= y < self.bottom()
+
+    def follow(self, cursor_y: int, cursor_x: int):
+        # scrolls just enough to bring the cursor on screen
+        if cursor_y < self.top:
+            self.top = cursor_y
+        elif cursor_y >= self.bottom():
+            self.top = cursor_y - self.height + 1
+        if cursor_x < self.left:
+            self.left = cursor_x
+        elif cursor_x >= self.left + self.width:
+            self.left = cursor_x - self.width + 1
+
+    def clip(self, y: int, x: int, text: str):
+        # screen row, column and the part of `text` written at document
+        # position (y, x) that fits, or None when it is all off screen
+        if not self.visible(y) or x >= self.left + self.width:
+            return None
+        cut = max(self.left - x, 0)
+        column = x + cut - self.left
+        return y - self.top, column, text[cut : cut + self.width - column]
+
+    def screen(self, y: int, x: int) -> tuple[int, int]:
+        return y - self.top, x - self.left
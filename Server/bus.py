@@ -0,0 +1,175 @@
+import asyncio
+import copy
+import json
+from .log import get_logger
+
+logger = get_logger("bus")
+
+
+class LocalBus:
+    # In-process bus shared by several Server instances. Messages on all
+    # channels are delivered by one task in publish order, to every
+    # subscriber including the publisher, so all nodes see one total order.
+    def __init__(self):
+        self.subscribers = {}
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    async def subscribe(self, channel: str, callback) -> int:
+        callbacks = self.subscribers.setdefault(channel, [])
+        peers = len(callbacks)
+        callbacks.append(callback)
+        return peers
+
+    async def unsubscribe(self, channel: str, callback):
+        callbacks = self.subscribers.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self.subscribers.pop(channel, None)
+
+    async def publish(self, channel: str, message: dict):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.deliver())
+        self.queue.put_nowait((channel, message))
+
+    async def deliver(self):
+        while True:
+            channel, message = await self.queue.get()
+            for callback in list(self.subscribers.get(channel, [])):
+                try:
+                    # each node gets its own copy, as it would over the wire
+                    await callback(copy.deepcopy(message))
+                except Exception:
+                    logger.exception("bus subscriber for %s failed", channel)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+class TcpBroker:
+    # Line-delimited JSON relay. A connection sends {"op": "sub"|"unsub",
+    # "channel"} or {"op": "pub", "channel", "message"}; every subscriber of
+    # the channel, the publisher included, gets {"op": "msg", ...} in the
+    # order the broker received the publishes.
+    def __init__(self):
+        self.channels = {}
+        self.server = None
+
+    async def start(self, host: str = "localhost", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        subscribed = set()
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                channel = request["channel"]
+                if request["op"] == "sub":
+                    members = self.channels.setdefault(channel, set())
+                    peers = len(members - {writer})
+                    members.add(writer)
+                    subscribed.add(channel)
+                    self.write(
+                        writer, {"op": "subscribed", "channel": channel, "peers": peers}
+                    )
+                elif request["op"] == "unsub":
+                    self.channels.get(channel, set()).discard(writer)
+                    subscribed.discard(channel)
+                elif request["op"] == "pub":
+                    frame = json.dumps(
+                        {"op": "msg", "channel": channel, "message": request["message"]}
+                    )
+                    for member in list(self.channels.get(channel, ())):
+                        member.write(frame.encode() + b"\n")
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logger.info("bus connection dropped: %s", e)
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    @staticmethod
+    def write(writer, message: dict):
+        writer.write(json.dumps(message).encode() + b"\n")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class TcpBus:
+    def __init__(self, host: str = "localhost", port: int = 8700):
+        self.host = host
+        self.port = port
+        self.subscribers = {}
+        self.subscribing = {}
+        self.reader = None
+        self.writer = None
+        self.task = None
+
+    async def connect(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+            self.task = asyncio.get_running_loop().create_task(self.receive())
+        return self
+
+    async def send(self, message: dict):
+        await self.connect()
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+
+    async def subscribe(self, channel: str, callback) -> int:
+        callbacks = self.subscribers.setdefault(channel, [])
+        callbacks.append(callback)
+        if len(callbacks) > 1:
+            return len(callbacks) - 1
+        future = asyncio.get_running_loop().create_future()
+        self.subscribing[channel] = future
+        await self.send({"op": "sub", "channel": channel})
+        return await future
+
+    async def unsubscribe(self, channel: str, callback):
+        callbacks = self.subscribers.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks and self.subscribers.pop(channel, None) is not None:
+            await self.send({"op": "unsub", "channel": channel})
+
+    async def publish(self, channel: str, message: dict):
+        await self.send({"op": "pub", "channel": channel, "message": message})
+
+    async def receive(self):
+        try:
+            while line := await self.reader.readline():
+                frame = json.loads(line)
+                if frame["op"] == "subscribed":
+                    future = self.subscribing.pop(frame["channel"], None)
+                    if future is not None and not future.done():
+                        future.set_result(frame["peers"])
+                    continue
+                for callback in list(self.subscribers.get(frame["channel"], [])):
+                    try:
+                        await callback(frame["message"])
+                    except Exception:
+                        logger.exception(
+                            "bus subscriber for %s failed", frame["channel"]
+                        )
+        except asyncio.CancelledError:
+            pass
+        except ConnectionError as e:
+            logger.warning("bus connection lost: %s", e)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,88 @@
+import time
+from collections import deque
+from .metrics import MetricsRegistry
+
+
+class CommandStats:
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, elapsed: float, failed: bool):
+        self.count += 1
+        self.errors += failed
+        self.total += elapsed
+        self.samples.append(elapsed)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 3),
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+        }
+
+
+class CommandRegistry:
+    def __init__(self, window: int = 1024, metrics: MetricsRegistry = None):
+        self.window = window
+        self.handlers = {}
+        self.stats: dict[str, CommandStats] = {}
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        self.latency = metrics.histogram(
+            "command_duration_seconds", "Time spent handling a command", ["command"]
+        )
+        self.failures = metrics.counter(
+            "command_errors_total", "Commands whose handler raised", ["command"]
+        )
+
+    def __contains__(self, command):
+        return command in self.handlers
+
+    def register(self, command: str, handler=None):
+        if handler is None:
+            # decorator form: @registry.register("COMMAND")
+            def decorator(func):
+                self.register(command, func)
+                return func
+
+            return decorator
+        self.handlers[command] = handler
+        self.stats.setdefault(command, CommandStats(self.window))
+        self.latency.labels(command)
+        return handler
+
+    def unregister(self, command: str):
+        self.handlers.pop(command, None)
+
+    async def dispatch(self, command: str, *args):
+        stats = self.stats[command]
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await self.handlers[command](*args)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.record(elapsed, failed)
+            self.latency.labels(command).observe(elapsed)
+            if failed:
+                self.failures.labels(command).inc()
+
+    def summary(self) -> dict:
+        return {
+            command: stats.summary()
+            for command, stats in self.stats.items()
+            if stats.count
+        }
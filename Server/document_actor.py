@@ -0,0 +1,77 @@
+import asyncio
+from .log import get_logger
+
+logger = get_logger("actors")
+
+
+class DocumentActor:
+    def __init__(self, filename: str, owner):
+        self.filename = filename
+        self.owner = owner
+        self.inbox = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        while True:
+            batch = [await self.inbox.get()]
+            while len(batch) < self.owner.max_batch and not self.inbox.empty():
+                batch.append(self.inbox.get_nowait())
+            try:
+                await self.owner.process(self.filename, batch)
+                self.owner.record_batch(len(batch))
+            except Exception:
+                logger.exception("error applying batch for %s", self.filename)
+            finally:
+                for _ in batch:
+                    self.inbox.task_done()
+
+
+class DocumentActors:
+    def __init__(self, process, max_batch: int = 256):
+        self.process = process
+        self.max_batch = max_batch
+        self.actors: dict[str, DocumentActor] = {}
+        self.batches = 0
+        self.operations = 0
+        self.largest_batch = 0
+
+    def submit(self, filename: str, websocket, user_id, operation):
+        actor = self.actors.get(filename)
+        if actor is None:
+            actor = self.actors[filename] = DocumentActor(filename, self)
+        actor.inbox.put_nowait((websocket, user_id, operation))
+
+    def pending(self, filename: str) -> int:
+        actor = self.actors.get(filename)
+        return actor.inbox.qsize() if actor is not None else 0
+
+    async def join(self, filename: str = None):
+        filenames = [filename] if filename is not None else list(self.actors)
+        for name in filenames:
+            actor = self.actors.get(name)
+            if actor is not None:
+                await actor.inbox.join()
+
+    async def stop(self, filename: str):
+        await self.join(filename)
+        actor = self.actors.pop(filename, None)
+        if actor is not None:
+            actor.task.cancel()
+
+    async def stop_all(self):
+        for filename in list(self.actors):
+            await self.stop(filename)
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.operations += size
+        self.largest_batch = max(self.largest_batch, size)
+
+    def metrics(self) -> dict:
+        return {
+            "documents": len(self.actors),
+            "pending": sum(actor.inbox.qsize() for actor in self.actors.values()),
+            "batches": self.batches,
+            "operations": self.operations,
+            "largest_batch": self.largest_batch,
+        }
@@ -1,40 +1,82 @@
+import codecs
 import os
 import json
+from .log import get_logger
+from .metadata_store import SqliteMetadataStore
+
+logger = get_logger("file_manager")
 
 
 class FileManager:
-    def __init__(self, base_dir="./Server/server_files"):
+    def __init__(self, base_dir="./Server/server_files", metadata_db=None):
         self.base_dir = base_dir
         self.user_info_dir = "./Server/clients_information/clients_info.json"
         self.clients_base_dir = "./Server/clients_information/clients_base.json"
+        self.user_info = None
+        self.grantees: dict[str, dict[str, set]] = {}
+        self.registered_users: dict[str, None] = {}
+        self.own_files: dict[str, list[str]] = {}
+        self.metadata = None
+        self.history_marks: dict[str, tuple[tuple, dict[int, int]]] = {}
         if not os.path.exists(base_dir):
             os.makedirs(base_dir)
-
-    def get_files(self, user_id):
-        user_folder = user_id + "'s_files"
-        print("getting files in", user_folder)
-        files = []
-        directory = os.path.join(self.base_dir, user_folder)
-
-        additional_files = self.load_user_information()
-
-        file_host_pairs = set()
-        for user, user_data in additional_files.items():
-            for host, host_data in user_data["host_access"].items():
+        if metadata_db is not None:
+            self.metadata = SqliteMetadataStore(metadata_db)
+            if not self.metadata.is_imported():
+                self.metadata.import_json(self.clients_base_dir, self.user_info_dir)
+        self.load_index()
+
+    def load_index(self):
+        if self.metadata is not None:
+            self.user_info = self.metadata.load_user_information()
+        else:
+            self.user_info = self.load_user_information()
+        self.grantees = {}
+        for user, user_data in self.user_info.items():
+            for host, host_data in user_data.get("host_access", {}).items():
                 for file_name in host_data["files"]:
-                    file_host_pairs.add((file_name, host))
+                    self.grantees.setdefault(host, {}).setdefault(file_name, set()).add(
+                        user
+                    )
+
+        if self.metadata is not None:
+            self.registered_users = dict.fromkeys(self.metadata.load_users())
+        else:
+            clients_base = []
+            if os.path.exists(self.clients_base_dir):
+                clients_base = self.load_json(self.clients_base_dir)
+            self.registered_users = dict.fromkeys(
+                user["User ID"] for user in clients_base if "User ID" in user
+            )
+        self.own_files = {}
 
-        try:
-            files = os.listdir(directory)
-        except OSError:
-            return files + list(file_host_pairs)
+    def index(self):
+        if self.user_info is None:
+            self.load_index()
+        return self.user_info
 
-        return files + list(file_host_pairs)
+    def get_own_files(self, user_id):
+        if user_id not in self.own_files:
+            directory = os.path.join(self.base_dir, user_id + "'s_files")
+            try:
+                self.own_files[user_id] = os.listdir(directory)
+            except OSError:
+                return []
+        return self.own_files[user_id]
+
+    def get_files(self, user_id):
+        host_access = self.index().get(str(user_id), {}).get("host_access", {})
+        file_host_pairs = [
+            (file_name, host)
+            for host, host_data in host_access.items()
+            for file_name in host_data["files"]
+        ]
+        return list(self.get_own_files(user_id)) + file_host_pairs
 
     def open_file(self, user_id, filename: str):
         user_folder = user_id + "'s_files"
         filepath = os.path.join(self.base_dir, user_folder, filename)
-        print(f"path to file: {filepath}")
+        logger.debug("path to file: %s", filepath)
         if not os.path.exists(filepath):
             return False, None
         try:
@@ -48,14 +90,15 @@ class FileManager:
         user_folder = user_id + "'s_files"
         filepath = os.path.join(self.base_dir, user_folder, filename)
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        print("USER_FOLDER=", user_folder)
-        print("FILEPATH=", filepath)
+        logger.debug("creating %s", filepath)
 
         if os.path.exists(filepath):
             return False, "File already exists"
         try:
             with open(filepath, "w") as f:
                 f.write("")
+            if user_id in self.own_files:
+                self.own_files[user_id].append(filename)
             return True, None
         except Exception as e:
             return False, str(e)
@@ -67,12 +110,14 @@ class FileManager:
             return False, "File does not exist"
         try:
             os.remove(filepath)
+            if filename in self.own_files.get(user_id, []):
+                self.own_files[user_id].remove(filename)
             return True, None
         except Exception as e:
             return False, str(e)
 
     def save_file(self, user_id, filename: str, content: list[str]):
-        user_info = self.load_user_information()
+        user_info = self.index()
         user_folder = user_id + "'s_files"
         filepath = os.path.join(self.base_dir, user_folder, filename)
 
@@ -101,12 +146,8 @@ class FileManager:
         return {}
 
     def validate_access(self, user_id, host_id, filename):
-        user_info = self.load_user_information()
-        host_access = user_info.get(str(user_id), {}).get("host_access", {})
-        if (
-            str(host_id) not in host_access
-            or filename not in host_access[str(host_id)]["files"]
-        ):
+        self.index()
+        if str(user_id) not in self.grantees.get(str(host_id), {}).get(filename, ()):
             return (
                 False,
                 None,
@@ -118,7 +159,7 @@ class FileManager:
         return True, filepath, None
 
     def remove_access(self, user_id, host_id, filename):
-        user_info = self.load_user_information()
+        user_info = self.index()
 
         if str(user_id) not in user_info:
             return f"User {user_id} does not have any access records."
@@ -135,20 +176,23 @@ class FileManager:
             return f'User {user_id} does not have access to file "{filename}" from host {host_id}.'
 
         user_info[str(user_id)]["host_access"][str(host_id)]["files"].remove(filename)
+        self.grantees[str(host_id)][filename].discard(str(user_id))
 
         if not user_info[str(user_id)]["host_access"][str(host_id)]["files"]:
             del user_info[str(user_id)]["host_access"][str(host_id)]
 
-        self.save_user_information(user_info)
+        if self.metadata is not None:
+            self.metadata.remove_grant(str(user_id), str(host_id), filename)
+        else:
+            self.save_user_information(user_info)
 
         return f'Access to file "{filename}" for user {user_id} from host {host_id} removed.'
 
     def grant_access(self, user_id, host_id, filename):
-        clients_base = self.load_json(self.clients_base_dir)
-        user_info = self.load_user_information()
+        user_info = self.index()
         host_files = self.get_files(host_id)
 
-        if not any(user.get("User ID") == host_id for user in clients_base):
+        if host_id not in self.registered_users:
             return f"File does not exist for host: {host_id}"
 
         if filename not in host_files:
@@ -167,8 +211,14 @@ class FileManager:
             user_info[str(user_id)]["host_access"][str(host_id)]["files"].append(
                 filename
             )
+            self.grantees.setdefault(str(host_id), {}).setdefault(filename, set()).add(
+                str(user_id)
+            )
 
-        self.save_user_information(user_info)
+        if self.metadata is not None:
+            self.metadata.add_grant(str(user_id), str(host_id), filename)
+        else:
+            self.save_user_information(user_info)
 
         return f'Access granted to file "{filename}" for user: {user_id}'
 
@@ -177,11 +227,16 @@ class FileManager:
             json.dump(user_info, f, indent=4)
 
     def append_user(self, user_id):
-        user_base = self.load_json(self.clients_base_dir)
+        self.index()
+        if user_id in self.registered_users:
+            return
+        self.registered_users[user_id] = None
 
-        if not any(user.get("User ID") == user_id for user in user_base):
-            user_base.append({"User ID": user_id})
+        if self.metadata is not None:
+            self.metadata.add_user(user_id)
+            return
 
+        user_base = [{"User ID": user} for user in self.registered_users]
         with open(self.clients_base_dir, "w") as f:
             json.dump(user_base, f, indent=4)
 
@@ -192,7 +247,7 @@ class FileManager:
                 info = json.load(f)
                 return info
             except json.JSONDecodeError:
-                print(f"Error decoding JSON from file: {filepath}")
+                logger.error("error decoding JSON from file: %s", filepath)
         return []
 
     @staticmethod
@@ -214,10 +269,94 @@ class FileManager:
                     history = json.load(file)
                     return history
                 except json.JSONDecodeError:
-                    print(f"Error decoding JSON from file: {history_file}")
+                    logger.error("error decoding JSON from file: %s", history_file)
                     return {}
         return {}
 
+    @staticmethod
+    def iter_history(filename: str, chunk_size: int = 65536):
+        for _, entry in FileManager.history_from(filename, chunk_size=chunk_size):
+            yield entry
+
+    @staticmethod
+    def history_from(filename: str, offset: int = 0, chunk_size: int = 65536):
+        # yields (offset, entry) pairs, `offset` being the byte position in the
+        # file right after the entry, where a later read can seek to resume,
+        # or None when the file is not a plain JSON array
+        filename = filename.removesuffix(".txt")
+        history_file = f"./Server/files_change_history/{filename}.json"
+
+        if not os.path.exists(history_file):
+            return
+
+        decoder = json.JSONDecoder()
+        text = codecs.getincrementaldecoder("utf-8")()
+        with open(history_file, "rb") as file:
+            file.seek(offset)
+            buffer = text.decode(file.read(chunk_size))
+            if not offset:
+                stripped = buffer.lstrip()
+                if not stripped.startswith("["):
+                    history = FileManager.load_history(filename)
+                    if isinstance(history, list):
+                        yield from ((None, entry) for entry in history)
+                    return
+                opening = buffer[: len(buffer) - len(stripped) + 1]
+                offset += len(opening.encode())
+                buffer = stripped[1:]
+
+            position = 0
+            while True:
+                start = position
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if buffer.startswith("]", position):
+                    return
+                try:
+                    entry, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    chunk = file.read(chunk_size)
+                    if not chunk:
+                        logger.error("error decoding JSON from file: %s", history_file)
+                        return
+                    buffer = buffer[start:] + text.decode(chunk)
+                    position = 0
+                    continue
+                offset += len(buffer[start:position].encode())
+                yield offset, entry
+
+    def history_entries(self, filename: str, cursor: int = 0, chunk_size: int = 65536):
+        # yields (cursor, entry) pairs, the cursor counting entries like the
+        # in-memory history of an open document does. Where a page stopped is
+        # remembered as a byte offset so the next page seeks straight to it
+        name = filename.removesuffix(".txt")
+        history_file = f"./Server/files_change_history/{name}.json"
+        try:
+            stat = os.stat(history_file)
+        except FileNotFoundError:
+            return
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        marked = self.history_marks.get(name)
+        if marked is None or marked[0] != version:
+            marked = self.history_marks[name] = (version, {})
+        marks = marked[1]
+
+        offset = marks.get(cursor)
+        index = cursor if offset is not None else 0
+        entries = self.history_from(filename, offset or 0, chunk_size)
+        try:
+            for offset, entry in entries:
+                index += 1
+                if index > cursor:
+                    yield index, entry
+        finally:
+            entries.close()
+            if offset is not None and index > cursor:
+                while len(marks) >= 64:
+                    marks.pop(next(iter(marks)))
+                marks[index] = offset
+
     @staticmethod
     def delete_history(filename: str):
         filename = filename.removesuffix(".txt")
@@ -229,15 +368,5 @@ class FileManager:
             pass
 
     def get_all_registered_users(self):
-        if not os.path.exists(self.clients_base_dir):
-            print(f"Clients base file not found at {self.clients_base_dir}")
-            return []
-        try:
-            with open(self.clients_base_dir, "r") as file:
-                data = json.load(file)
-
-            user_ids = [user.get("User ID") for user in data if "User ID" in user]
-            return user_ids
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error reading file {self.clients_base_dir}: {e}")
-            return []
+        self.index()
+        return list(self.registered_users)
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+
+def parse_time(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class HistoryFilter:
+    def __init__(
+        self,
+        user_id=None,
+        since=None,
+        until=None,
+        op_type=None,
+        start_line=None,
+        end_line=None,
+    ):
+        self.user_id = user_id
+        self.since = parse_time(since)
+        self.until = parse_time(until)
+        self.op_type = op_type
+        self.start_line = start_line
+        self.end_line = end_line
+
+    @classmethod
+    def from_request(cls, filters):
+        filters = filters or {}
+        return cls(
+            user_id=filters.get("user_id"),
+            since=filters.get("since"),
+            until=filters.get("until"),
+            op_type=filters.get("op_type"),
+            start_line=filters.get("start_line"),
+            end_line=filters.get("end_line"),
+        )
+
+    def matches(self, entry) -> bool:
+        operation = entry.get("operation", {})
+        if self.user_id is not None and entry.get("user_id") != self.user_id:
+            return False
+        if self.op_type is not None and operation.get("op_type") != self.op_type:
+            return False
+        if self.since is not None or self.until is not None:
+            # entry times are str(datetime)
+            time = parse_time(entry.get("time"))
+            if time is None:
+                return False
+            if self.since is not None and time < self.since:
+                return False
+            if self.until is not None and time > self.until:
+                return False
+
+        if self.start_line is not None or self.end_line is not None:
+            first = (operation.get("start_pos") or {}).get("y")
+            if first is None:
+                return False
+            last = (operation.get("end_pos") or {}).get("y")
+            last = first if last is None else last
+            if self.start_line is not None and last < self.start_line:
+                return False
+            if self.end_line is not None and first > self.end_line:
+                return False
+        return True
+
+
+def positioned(entries: list, cursor: int = 0):
+    # (cursor, entry) pairs of an in-memory history, the cursor being the
+    # index of the entry after
+    return ((index + 1, entries[index]) for index in range(cursor, len(entries)))
+
+
+def history_pages(entries, limit=200, page_size=50, history_filter=None):
+    # `entries` yields (cursor, entry) pairs starting where the client left
+    # off; the cursor sent back with a page resumes right after its last scan
+    history_filter = history_filter or HistoryFilter()
+    page, total = [], 0
+
+    for cursor, entry in entries:
+        if not history_filter.matches(entry):
+            continue
+        page.append(entry)
+        total += 1
+        if total >= limit:
+            yield page, cursor, True
+            return
+        if len(page) >= page_size:
+            yield page, cursor, False
+            page = []
+
+    yield page, None, True
@@ -0,0 +1,101 @@
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT = "texteditor"
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+class DeferredQueueHandler(QueueHandler):
+    # the stdlib QueueHandler formats the message in the calling thread;
+    # leave %-style arguments to the listener thread instead
+    def prepare(self, record):
+        return record
+
+
+class SampledLogger:
+    # for per-operation events: keeps every `every`-th record and at most
+    # `per_second` records a second, and says how many were skipped
+    def __init__(self, logger, every: int = 1, per_second: float = None):
+        self.logger = logger
+        self.every = every
+        self.per_second = per_second
+        self.seen = 0
+        self.skipped = 0
+        self.window = 0
+        self.window_count = 0
+
+    def log(self, level: int, message: str, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        self.seen += 1
+        if self.seen % self.every:
+            self.skipped += 1
+            return
+        if self.per_second is not None:
+            window = int(time.monotonic())
+            if window != self.window:
+                self.window, self.window_count = window, 0
+            if self.window_count >= self.per_second:
+                self.skipped += 1
+                return
+            self.window_count += 1
+        if self.skipped:
+            message += " (%d similar skipped)"
+            args += (self.skipped,)
+            self.skipped = 0
+        self.logger.log(level, message, *args)
+
+    def debug(self, message: str, *args):
+        self.log(logging.DEBUG, message, *args)
+
+    def info(self, message: str, *args):
+        self.log(logging.INFO, message, *args)
+
+
+def sampled(name: str, every: int = 1, per_second: float = None) -> SampledLogger:
+    return SampledLogger(get_logger(name), every, per_second)
+
+
+def setup_logging(level="INFO", stream=None, filename=None, levels=None):
+    # records are queued on the event loop thread and formatted and written
+    # by the listener thread
+    global listener
+    shutdown_logging()
+
+    handlers = []
+    if filename is not None:
+        handlers.append(logging.FileHandler(filename))
+    if stream is not None or filename is None:
+        handlers.append(logging.StreamHandler(stream or sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(FORMAT))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger(ROOT)
+    root.handlers = [DeferredQueueHandler(records)]
+    root.setLevel(level)
+    root.propagate = False
+    for name, module_level in (levels or {}).items():
+        get_logger(name).setLevel(module_level)
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import sys
+
+
+class SqliteMetadataStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY
+                );
+                CREATE TABLE IF NOT EXISTS grants (
+                    user_id TEXT NOT NULL,
+                    host_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    PRIMARY KEY (user_id, host_id, filename)
+                );
+                CREATE INDEX IF NOT EXISTS grants_by_host
+                    ON grants (host_id, filename);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """)
+
+    def is_imported(self) -> bool:
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'json_imported'"
+        ).fetchone()
+        return row is not None
+
+    def import_json(self, clients_base_path: str, user_info_path: str):
+        users, user_info = [], {}
+        if os.path.exists(clients_base_path):
+            with open(clients_base_path, "r") as f:
+                users = [user["User ID"] for user in json.load(f) if "User ID" in user]
+        if os.path.exists(user_info_path):
+            with open(user_info_path, "r") as f:
+                user_info = json.load(f)
+
+        grants = [
+            (user, host, file_name)
+            for user, user_data in user_info.items()
+            for host, host_data in user_data.get("host_access", {}).items()
+            for file_name in host_data["files"]
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+                [(user,) for user in users],
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO grants (user_id, host_id, filename) "
+                "VALUES (?, ?, ?)",
+                grants,
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)",
+                (f"{len(users)} users, {len(grants)} grants",),
+            )
+        return len(users), len(grants)
+
+    def load_users(self) -> list[str]:
+        rows = self.connection.execute("SELECT user_id FROM users ORDER BY rowid")
+        return [user_id for (user_id,) in rows]
+
+    def load_user_information(self) -> dict:
+        user_info = {}
+        rows = self.connection.execute(
+            "SELECT user_id, host_id, filename FROM grants ORDER BY rowid"
+        )
+        for user_id, host_id, filename in rows:
+            host_access = user_info.setdefault(user_id, {"host_access": {}})
+            host_access["host_access"].setdefault(host_id, {"files": []})[
+                "files"
+            ].append(filename)
+        return user_info
+
+    def add_user(self, user_id):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,)
+            )
+
+    def add_grant(self, user_id, host_id, filename):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO grants (user_id, host_id, filename) "
+                "VALUES (?, ?, ?)",
+                (user_id, host_id, filename),
+            )
+
+    def remove_grant(self, user_id, host_id, filename):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM grants WHERE user_id = ? AND host_id = ? AND filename = ?",
+                (user_id, host_id, filename),
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    db_path = (
+        sys.argv[1] if len(sys.argv) > 1 else "./Server/clients_information/metadata.db"
+    )
+    store = SqliteMetadataStore(db_path)
+    users, grants = store.import_json(
+        "./Server/clients_information/clients_base.json",
+        "./Server/clients_information/clients_info.json",
+    )
+    print(f"Imported {users} users and {grants} grants into {db_path}")
+    store.close()
@@ -0,0 +1,272 @@
+import asyncio
+import bisect
+import math
+from abc import ABC, abstractmethod
+from .log import get_logger
+
+logger = get_logger("metrics")
+
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_label_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{format_label_value(value)}"' for name, value in pairs)
+        + "}"
+    )
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class GaugeValue:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield name + "_bucket", labels + [("le", bound)], cumulative
+        yield name + "_bucket", labels + [("le", math.inf)], self.count
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        if not self.labelnames:
+            self.default = self.labels()
+
+    @abstractmethod
+    def new_value(self):
+        pass
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children[values] = self.new_value()
+        return child
+
+    def remove(self, *values):
+        self.children.pop(values, None)
+
+    def collect(self):
+        for values, child in list(self.children.items()):
+            yield from child.samples(self.name, list(zip(self.labelnames, values)))
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, labels, value in self.collect():
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_value(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        # callback gauges are computed at scrape time: a number, or a dict
+        # of label tuple -> number for labelled gauges
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def new_value(self):
+        return GaugeValue()
+
+    def set(self, value):
+        self.default.set(value)
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+    def dec(self, amount=1):
+        self.default.dec(amount)
+
+    def collect(self):
+        if self.callback is None:
+            yield from super().collect()
+            return
+        values = self.callback()
+        if not self.labelnames:
+            yield self.name, [], values
+            return
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.default.observe(value)
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "texteditor"):
+        self.prefix = prefix
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric_class, name, *args, **kwargs):
+        name = f"{self.prefix}_{name}" if self.prefix else name
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = metric_class(name, *args, **kwargs)
+        elif not isinstance(metric, metric_class):
+            raise ValueError(f"{name} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), callback=None) -> Gauge:
+        return self.register(Gauge, name, documentation, labelnames, callback)
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram, name, documentation, labelnames, buckets)
+
+    def get(self, name):
+        return self.metrics.get(f"{self.prefix}_{name}" if self.prefix else name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, registry: MetricsRegistry, path: str = "/metrics"):
+        self.registry = registry
+        self.path = path
+        self.server = None
+
+    async def start(self, host: str = "localhost", port: int = 9100) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == self.path:
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError as e:
+            logger.debug("metrics request failed: %s", e)
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .log import get_logger
+
+logger = get_logger("op_log")
+
+
+class OperationLog:
+    def __init__(self, log_path: str, snapshot_path: str, fsync: bool = False):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self._file = None
+
+        snapshot = self.read_snapshot()
+        self.snapshot_seq = snapshot["seq"] if snapshot else 0
+        self.last_seq = self.snapshot_seq
+        for record in self.read_records():
+            self.last_seq = max(self.last_seq, record["seq"])
+        self.since_snapshot = self.last_seq - self.snapshot_seq
+
+    def append(self, record: dict) -> int:
+        return self.append_many([record])
+
+    def append_many(self, records: list[dict]) -> int:
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.log_path, "a", encoding="utf-8")
+            lines = []
+            for record in records:
+                self.last_seq += 1
+                lines.append(json.dumps({"seq": self.last_seq, **record}) + "\n")
+            self.since_snapshot += len(records)
+            self._file.write("".join(lines))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            return self.last_seq
+
+    def read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error("error reading snapshot %s: %s", self.snapshot_path, e)
+            return None
+
+    def read_records(self, after_seq: int = 0):
+        if not os.path.exists(self.log_path):
+            return []
+        records = []
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn write at the end of the log after a crash
+                    continue
+                if record["seq"] > after_seq:
+                    records.append(record)
+        return records
+
+    def write_snapshot(
+        self,
+        seq: int,
+        content: list[str],
+        history: list,
+        clean: bool = False,
+        crdt: dict = None,
+    ):
+        snapshot = {"seq": seq, "clean": clean, "content": content, "history": history}
+        if crdt is not None:
+            snapshot["crdt"] = crdt
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        with self.lock:
+            self.snapshot_seq = max(self.snapshot_seq, seq)
+
+    def compact(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+            if not os.path.exists(self.log_path):
+                return
+            size = os.path.getsize(self.log_path)
+            keep_after = self.snapshot_seq
+
+        tmp_path = self.log_path + ".compact"
+        with open(self.log_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for line in src.read(size).splitlines(keepends=True):
+                try:
+                    if json.loads(line)["seq"] > keep_after:
+                        dst.write(line)
+                except json.JSONDecodeError:
+                    continue
+
+            with self.lock:
+                if self._file is not None:
+                    self._file.flush()
+                src.seek(size)
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                os.replace(tmp_path, self.log_path)
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        self.close()
+        for path in (self.log_path, self.snapshot_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class OperationLogStore:
+    def __init__(
+        self,
+        directory: str = "./Server/files_oplog",
+        snapshot_every: int = 500,
+        fsync: bool = False,
+    ):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.logs: dict[str, OperationLog] = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def log(self, filename: str) -> OperationLog:
+        if filename not in self.logs:
+            os.makedirs(self.directory, exist_ok=True)
+            name = filename.removesuffix(".txt")
+            self.logs[filename] = OperationLog(
+                os.path.join(self.directory, f"{name}.log"),
+                os.path.join(self.directory, f"{name}.snapshot.json"),
+                self.fsync,
+            )
+        return self.logs[filename]
+
+    def append(self, filename: str, record: dict) -> bool:
+        return self.append_many(filename, [record])
+
+    def append_many(self, filename: str, records: list[dict]) -> bool:
+        log = self.log(filename)
+        log.append_many(records)
+        return log.since_snapshot >= self.snapshot_every
+
+    def recover(self, filename: str):
+        log = self.log(filename)
+        snapshot = log.read_snapshot()
+        if snapshot is None:
+            return None, []
+        return snapshot, log.read_records(after_seq=snapshot["seq"])
+
+    def snapshot(
+        self,
+        filename: str,
+        content: list[str],
+        history: list,
+        background=True,
+        clean=False,
+        crdt=None,
+    ):
+        log = self.log(filename)
+        seq = log.last_seq
+        log.since_snapshot = 0
+
+        def job():
+            log.write_snapshot(seq, content, history, clean, crdt)
+            log.compact()
+
+        future = self.executor.submit(job)
+        if not background:
+            future.result()
+        return future
+
+    def release(self, filename: str):
+        if filename in self.logs:
+            self.executor.submit(self.logs[filename].close)
+
+    def delete(self, filename: str):
+        self.executor.submit(self.log(filename).remove).result()
+        self.logs.pop(filename, None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        for log in self.logs.values():
+            log.close()
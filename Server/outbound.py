@@ -0,0 +1,169 @@
+import asyncio
+from collections import deque
+from .log import get_logger
+
+logger = get_logger("outbound")
+
+POLICIES = ("drop", "coalesce", "disconnect")
+
+
+class OutboundQueue:
+    def __init__(self, websocket, maxsize: int, owner):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.owner = owner
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.space.set()
+        self.closed = False
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, frame, key=None) -> bool:
+        if self.closed:
+            return False
+        if len(self.frames) >= self.maxsize and not self.owner.overflow(
+            self, frame, key
+        ):
+            return False
+        self.frames.append((key, frame))
+        self.wake()
+        return True
+
+    async def put_wait(self, frame, key=None):
+        # responses to the client's own requests wait for room instead of
+        # triggering the slow-consumer policy
+        while len(self.frames) >= self.maxsize and not self.closed:
+            self.space.clear()
+            await self.space.wait()
+        if not self.closed:
+            self.frames.append((key, frame))
+            self.wake()
+
+    def replace(self, frames):
+        self.frames = deque(frames)
+        self.wake()
+
+    def wake(self):
+        self.owner.high_water = max(self.owner.high_water, len(self.frames))
+        if len(self.frames) >= self.maxsize:
+            self.space.clear()
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while not self.closed:
+                if not self.frames:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                _, frame = self.frames.popleft()
+                self.space.set()
+                await self.websocket.send(frame)
+                self.owner.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug("writer for %x stopped: %s", id(self.websocket), e)
+            self.close()
+
+    def close(self):
+        self.closed = True
+        self.frames.clear()
+        self.space.set()
+        self.ready.set()
+
+
+class OutboundQueues:
+    def __init__(self, maxsize: int = 256, policy: str = "drop", resync=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.resync = resync
+        self.queues = {}
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.resyncs = 0
+        self.disconnects = 0
+        self.high_water = 0
+
+    def register(self, websocket) -> OutboundQueue:
+        if websocket not in self.queues:
+            self.queues[websocket] = OutboundQueue(websocket, self.maxsize, self)
+        return self.queues[websocket]
+
+    def unregister(self, websocket):
+        queue = self.queues.pop(websocket, None)
+        if queue is not None:
+            queue.close()
+            queue.task.cancel()
+
+    def send(self, websocket, frame, key=None) -> bool:
+        queue = self.queues.get(websocket)
+        if queue is None:
+            return False
+        queue.put(frame, key)
+        return True
+
+    async def send_wait(self, websocket, frame) -> bool:
+        queue = self.queues.get(websocket)
+        if queue is None:
+            return False
+        await queue.put_wait(frame)
+        return True
+
+    def overflow(self, queue: OutboundQueue, frame, key) -> bool:
+        if self.policy == "disconnect" or self.resync is None:
+            self.dropped += len(queue.frames) + 1
+            self.disconnect(queue)
+            return False
+
+        if self.policy == "coalesce" and key is not None:
+            # collapse everything queued for this document into one resync
+            # frame, keeping unrelated frames in order
+            kept = [entry for entry in queue.frames if entry[0] != key]
+            if len(kept) < len(queue.frames):
+                self.coalesced += len(queue.frames) - len(kept) + 1
+                self.resyncs += 1
+                queue.replace(kept + self.resync(queue.websocket, key))
+                return False
+
+        # replies to the client's own requests (key None) are kept: it may
+        # be waiting on them, and a resync does not stand in for them
+        replies = [entry for entry in queue.frames if entry[0] is None]
+        if key is None:
+            replies.append((key, frame))
+        self.dropped += len(queue.frames) + 1 - len(replies)
+        self.resyncs += 1
+        queue.replace(replies + self.resync(queue.websocket, None))
+        return False
+
+    def disconnect(self, queue: OutboundQueue):
+        self.disconnects += 1
+        self.unregister(queue.websocket)
+        asyncio.get_running_loop().create_task(
+            queue.websocket.close(code=1013, reason="slow consumer")
+        )
+
+    def depth(self, websocket) -> int:
+        queue = self.queues.get(websocket)
+        return len(queue) if queue is not None else 0
+
+    def metrics(self) -> dict:
+        depths = [len(queue) for queue in self.queues.values()]
+        return {
+            "clients": len(depths),
+            "queued": sum(depths),
+            "max_depth": max(depths, default=0),
+            "high_water": self.high_water,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "resyncs": self.resyncs,
+            "disconnects": self.disconnects,
+        }
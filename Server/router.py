@@ -0,0 +1,214 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import signal
+import websockets
+from Shared.protocol import Protocol
+
+DOCUMENT_COMMANDS = {
+    "OPEN_FILE",
+    "CLOSE_FILE",
+    "DELETE_FILE",
+    "EDIT_FILE",
+    "SAVE_CONTENT",
+    "GET_HISTORY",
+    "DELETE_HISTORY",
+    "GET_LINES",
+}
+# commands that change the file index or ACLs; once the owning worker has
+# answered, the other workers reload their in-memory index
+INDEX_COMMANDS = {
+    "LOGIN",
+    "GRANT_ACCESS",
+    "REMOVE_ACCESS",
+    "CREATE_FILE",
+    "DELETE_FILE",
+}
+
+
+def stable_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes, replicas: int = 64):
+        self.replicas = replicas
+        self.ring = []
+        self.nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        for i in range(self.replicas):
+            point = stable_hash(f"{node}#{i}")
+            bisect.insort(self.ring, point)
+            self.nodes[point] = node
+
+    def remove(self, node: str):
+        for i in range(self.replicas):
+            point = stable_hash(f"{node}#{i}")
+            self.ring.remove(point)
+            del self.nodes[point]
+
+    def get(self, key: str) -> str:
+        index = bisect.bisect(self.ring, stable_hash(key)) % len(self.ring)
+        return self.nodes[self.ring[index]]
+
+
+class ClientLink:
+    def __init__(self, router, websocket):
+        self.router = router
+        self.websocket = websocket
+        self.login_frame = None
+        self.upstreams = {}
+        self.pumps = []
+        self.index_requests = {}
+
+    async def upstream(self, uri: str, replay_login=True):
+        if uri not in self.upstreams:
+            upstream = await websockets.connect(uri)
+            if replay_login and self.login_frame is not None:
+                # every worker needs to know who this connection belongs to
+                await upstream.send(self.login_frame)
+                await upstream.recv()
+            self.upstreams[uri] = upstream
+            self.pumps.append(asyncio.create_task(self.pump(uri, upstream)))
+        return self.upstreams[uri]
+
+    async def pump(self, uri: str, upstream):
+        try:
+            async for frame in upstream:
+                await self.websocket.send(frame)
+                if self.index_requests:
+                    command = self.index_requests.pop(
+                        Protocol.parse_response(frame).get("id"), None
+                    )
+                    if command is not None:
+                        await self.router.sync_index(exclude=uri)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def forward(self, frame):
+        request = Protocol.parse_request(frame)
+        command = request["command"]
+        if command in DOCUMENT_COMMANDS:
+            uri = self.router.ring.get(request["data"]["filename"])
+        else:
+            uri = self.router.home
+
+        if command == "LOGIN":
+            self.login_frame = frame
+            # other upstreams reconnect and replay the new login when needed
+            for other_uri in [other for other in self.upstreams if other != uri]:
+                await self.upstreams.pop(other_uri).close()
+        if command in INDEX_COMMANDS and len(self.router.workers) > 1:
+            if request.get("id") is not None:
+                self.index_requests[request["id"]] = command
+
+        self.router.routed[uri] = self.router.routed.get(uri, 0) + 1
+        upstream = await self.upstream(uri, replay_login=command != "LOGIN")
+        await upstream.send(frame)
+        if command in INDEX_COMMANDS and request.get("id") is None:
+            await self.router.sync_index(exclude=uri)
+
+    async def close(self):
+        for upstream in self.upstreams.values():
+            await upstream.close()
+        for pump in self.pumps:
+            pump.cancel()
+
+
+class Router:
+    def __init__(self, workers, replicas: int = 64, control_token: str = None):
+        self.workers = list(workers)
+        self.home = self.workers[0]
+        self.ring = HashRing(self.workers, replicas)
+        self.routed = {}
+        self.control = {}
+        # proves to the workers that SYNC_INDEX comes from the router
+        self.control_token = control_token
+
+    async def handle(self, websocket):
+        link = ClientLink(self, websocket)
+        try:
+            async for frame in websocket:
+                await link.forward(frame)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            await link.close()
+
+    async def sync_index(self, exclude=None):
+        for uri in self.workers:
+            if uri == exclude:
+                continue
+            control = self.control.get(uri)
+            if control is None:
+                control = self.control[uri] = await websockets.connect(uri)
+            await control.send(
+                Protocol.create_message("SYNC_INDEX", {"token": self.control_token})
+            )
+
+    async def close(self):
+        for control in self.control.values():
+            await control.close()
+
+
+def run_worker(
+    port: int, host: str = "localhost", log_level: str = None, **server_options
+):
+    from .log import setup_logging, shutdown_logging
+    from .server import Server
+
+    if log_level is not None:
+        setup_logging(log_level)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    # terminate() from the parent should still flush dirty documents
+    signal.signal(signal.SIGTERM, stop)
+
+    async def main():
+        server = Server(**server_options)
+        try:
+            async with websockets.serve(server.echo, host, port):
+                await asyncio.Future()
+        finally:
+            await server.actors.stop_all()
+            server.shutdown()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_logging()
+
+
+def start_workers(count: int, base_port: int, host: str = "localhost", **options):
+    processes = []
+    for i in range(count):
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(base_port + i, host),
+            kwargs=options,
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+    return processes, [f"ws://{host}:{base_port + i}" for i in range(count)]
+
+
+async def wait_for_workers(uris, timeout: float = 10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    for uri in uris:
+        while True:
+            try:
+                async with websockets.connect(uri):
+                    break
+            except OSError:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise
+                await asyncio.sleep(0.05)
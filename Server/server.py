@@ -1,215 +1,749 @@
 import json
 import websockets
 import asyncio
+import hmac
+import time
+import uuid
+from itertools import count
+from .commands import CommandRegistry
+from .document_actor import DocumentActors
 from .file_manager import FileManager
+from .history_query import HistoryFilter, history_pages, positioned
+from .log import get_logger
+from .metrics import MetricsRegistry, MetricsServer
+from .op_log import OperationLogStore
+from .outbound import OutboundQueues
 from .session_manager import SessionManager
+from .tracing import Tracer
+from .write_behind import WriteBehind
 from Shared.protocol import Protocol
 
+logger = get_logger("server")
+
 
 class Server:
-    def __init__(self):
-        self.file_manager = FileManager()
-        self.session_manager = SessionManager()
+    def __init__(
+        self,
+        flush_delay=1.0,
+        flush_max_ops=100,
+        oplog_dir="./Server/files_oplog",
+        snapshot_every=500,
+        metadata_db=None,
+        outbound_queue_size=256,
+        slow_consumer_policy="drop",
+        max_batch=256,
+        admin_users=None,
+        control_token=None,
+        bus=None,
+        node_id=None,
+        bus_sync_timeout=2.0,
+        bus_apply_timeout=10.0,
+        metrics_port=None,
+        tracer=None,
+        chunk_lines=1000,
+    ):
+        self.file_manager = FileManager(metadata_db=metadata_db)
+        self.op_log = OperationLogStore(oplog_dir, snapshot_every)
+        self.codecs = {}
+        self.metrics = MetricsRegistry()
+        self.metrics_port = metrics_port
+        self.metrics_server = MetricsServer(self.metrics)
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.session_manager = SessionManager(
+            op_log=self.op_log,
+            codecs=self.codecs,
+            metrics=self.metrics,
+            tracer=self.tracer,
+            # members on other nodes are not known here, so with a bus CRDT
+            # tombstones are only dropped when a document is reloaded
+            tombstone_limit=1024 if bus is None else None,
+        )
+        self.outbound = OutboundQueues(
+            outbound_queue_size,
+            slow_consumer_policy,
+            resync=self.session_manager.resync_frames,
+        )
+        self.session_manager.outbound = self.outbound
+        self.write_behind = WriteBehind(
+            self.save_document, max_delay=flush_delay, max_ops=flush_max_ops
+        )
+        self.actors = DocumentActors(self.apply_batch, max_batch)
         self.clients = set()
         self.user_sessions = {}
         self.history_changes = {}
+        self.chunk_lines = chunk_lines
+        self.loading = {}
+        # users allowed to query server statistics; nobody by default
+        self.admin_users = set(admin_users or ())
+        # shared with the router, which alone may send SYNC_INDEX
+        self.control_token = control_token
+        self.bus = bus
+        self.node_id = node_id or uuid.uuid4().hex
+        self.bus_sync_timeout = bus_sync_timeout
+        self.bus_apply_timeout = bus_apply_timeout
+        self.channels = {}
+        self.batch_ids = count()
+        self.pending_batches = {}
+        self.connections = self.metrics.counter(
+            "connections_total", "Accepted client connections"
+        )
+        self.disconnections = self.metrics.counter(
+            "disconnections_total", "Closed client connections"
+        )
+        self.metrics.gauge(
+            "connected_clients",
+            "Currently connected clients",
+            callback=self.client_count,
+        )
+        self.save_latency = self.metrics.histogram(
+            "save_file_seconds", "Time to write a document to disk"
+        )
+        self.saved_bytes = self.metrics.counter(
+            "save_file_bytes_total", "Bytes written when saving documents"
+        )
+        self.metrics.gauge(
+            "history_entries",
+            "History length of each open document",
+            ["filename"],
+            callback=self.history_lengths,
+        )
+        self.commands = CommandRegistry(metrics=self.metrics)
+        for command in (
+            "PING",
+            "LOGIN",
+            "GET_FILES",
+            "GRANT_ACCESS",
+            "REMOVE_ACCESS",
+            "OPEN_FILE",
+            "CLOSE_FILE",
+            "CREATE_FILE",
+            "DELETE_FILE",
+            "EDIT_FILE",
+            "SAVE_CONTENT",
+            "GET_HISTORY",
+            "DELETE_HISTORY",
+            "GET_REGISTERED_USERS",
+            "GET_STATS",
+            "SYNC_INDEX",
+            "GET_LINES",
+        ):
+            self.commands.register(command, getattr(self, f"handle_{command.lower()}"))
 
     async def start(self, host="localhost", port=8765):
-        async with websockets.serve(self.echo, host, port):
-            print(f"Server started on ws://{host}:{port}")
-            await asyncio.Future()
+        if self.metrics_port is not None:
+            await self.metrics_server.start(host, self.metrics_port)
+            logger.info("metrics on http://%s:%d/metrics", host, self.metrics_port)
+        try:
+            async with websockets.serve(self.echo, host, port):
+                logger.info("server started on ws://%s:%d", host, port)
+                await asyncio.Future()
+        finally:
+            await self.actors.stop_all()
+            await self.metrics_server.close()
+            self.shutdown()
+            self.tracer.close()
+
+    def shutdown(self):
+        self.write_behind.flush_all()
+        for filename in list(self.session_manager.open_files):
+            self.session_manager.checkpoint(filename, self.history_changes)
+        self.op_log.shutdown()
+
+    def save_document(self, user_id, filename) -> bool:
+        # False when the document is no longer open; raises when the write fails
+        content = self.session_manager.get_content(filename)
+        if content is None:
+            return False
+        with self.tracer.span("save_file", filename=filename) as span:
+            started = time.perf_counter()
+            saved, error = self.file_manager.save_file(user_id, filename, content)
+            if not saved:
+                raise OSError(f"could not save {filename}: {error}")
+            self.save_latency.observe(time.perf_counter() - started)
+            size = content.byte_count()
+            self.saved_bytes.inc(size)
+            span.set_attribute("bytes", size)
+        return True
+
+    def client_count(self) -> int:
+        return len(self.clients)
+
+    def history_lengths(self) -> dict:
+        return {
+            filename: len(history or [])
+            for filename, history in list(self.history_changes.items())
+        }
+
+    async def apply_batch(self, filename, batch):
+        if self.bus is not None and filename in self.channels:
+            # applied when the bus hands the batch back, in the same order on
+            # every node subscribed to the document
+            batch_id = next(self.batch_ids)
+            done = asyncio.get_running_loop().create_future()
+            self.pending_batches[batch_id] = (batch, done)
+            with self.tracer.span(
+                "publish_batch", parent=None, filename=filename, operations=len(batch)
+            ):
+                try:
+                    await self.bus.publish(
+                        f"doc:{filename}",
+                        {
+                            "type": "ops",
+                            "node": self.node_id,
+                            "batch": batch_id,
+                            "ops": [
+                                {"user_id": user_id, "operation": operation}
+                                for _, user_id, operation in batch
+                            ],
+                        },
+                    )
+                    await asyncio.wait_for(asyncio.shield(done), self.bus_apply_timeout)
+                except (asyncio.TimeoutError, OSError) as e:
+                    # the bus is gone, so nothing will hand the batch back; the
+                    # senders resync instead of the actor waiting forever
+                    if self.pending_batches.pop(batch_id, None) is not None:
+                        logger.warning(
+                            "batch for %s not returned by the bus: %r", filename, e
+                        )
+                        await self.reject_batch(filename, batch)
+                    else:
+                        # handed back just now and still being applied
+                        await done
+            return
+        await self.apply_local(filename, batch)
+
+    async def apply_local(self, filename, batch):
+        # actor and bus tasks outlive the request that started them, so each
+        # batch starts its own trace
+        with self.tracer.span(
+            "apply_batch", parent=None, filename=filename, operations=len(batch)
+        ):
+            updates = self.session_manager.apply_batch(
+                filename, batch, self.history_changes
+            )
+            _, user_id, _ = batch[-1]
+            self.write_behind.mark_dirty(filename, user_id, ops=len(batch))
+            with self.tracer.span("share_update", updates=len(updates)) as span:
+                sent = await self.session_manager.share_batch(filename, updates)
+                span.set_attribute("recipients", sent)
+
+    async def reject_batch(self, filename, batch):
+        updates = []
+        for websocket in dict.fromkeys(websocket for websocket, _, _ in batch):
+            user_id = next(user for sender, user, _ in batch if sender is websocket)
+            updates.extend(self.session_manager.reject(filename, websocket, user_id))
+        if updates:
+            await self.session_manager.share_batch(filename, updates)
+
+    async def join_channel(self, filename):
+        if self.bus is None or filename in self.channels:
+            return
+        channel = self.channels[filename] = {
+            "token": uuid.uuid4().hex,
+            "requested": False,
+            "buffer": [],
+            "synced": asyncio.get_running_loop().create_future(),
+        }
+
+        async def callback(message):
+            await self.on_bus_message(filename, message)
+
+        channel["callback"] = callback
+        peers = await self.bus.subscribe(f"doc:{filename}", callback)
+        if not peers:
+            channel["synced"].set_result(None)
+            return
+        await self.bus.publish(
+            f"doc:{filename}",
+            {"type": "sync_request", "node": self.node_id, "token": channel["token"]},
+        )
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(channel["synced"]), self.bus_sync_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "no snapshot for %s from peers, using stored content", filename
+            )
+            await self.finish_sync(filename, channel)
+
+    async def leave_channel(self, filename):
+        channel = self.channels.pop(filename, None)
+        if channel is not None:
+            await self.bus.unsubscribe(f"doc:{filename}", channel["callback"])
+
+    async def channel_ready(self, filename):
+        channel = self.channels.get(filename)
+        if channel is not None:
+            await asyncio.shield(channel["synced"])
+
+    async def on_bus_message(self, filename, message):
+        channel = self.channels.get(filename)
+        if channel is None:
+            return
+        kind = message["type"]
+        if kind == "ops":
+            if channel["synced"].done():
+                await self.apply_bus_ops(filename, message)
+            elif channel["requested"]:
+                channel["buffer"].append(message)
+            # ops ordered before our own sync request are in the snapshot
+        elif kind == "sync_request":
+            if message["node"] == self.node_id:
+                channel["requested"] = message["token"] == channel["token"]
+            elif (
+                channel["synced"].done() and filename in self.session_manager.open_files
+            ):
+                await self.bus.publish(
+                    f"doc:{filename}",
+                    {
+                        "type": "snapshot",
+                        "to": message["node"],
+                        "token": message["token"],
+                        "content": self.session_manager.get_content(filename).slice(),
+                        "history": list(self.history_changes.get(filename) or []),
+                        "revisions": self.session_manager.revisions[filename].state(),
+                        "crdt": self.session_manager.crdt_state(filename),
+                    },
+                )
+        elif kind == "snapshot":
+            if (
+                message["to"] == self.node_id
+                and message["token"] == channel["token"]
+                and not channel["synced"].done()
+            ):
+                self.session_manager.update_content(
+                    filename, message["content"], message.get("crdt")
+                )
+                self.session_manager.restore_revisions(filename, message["revisions"])
+                self.history_changes[filename] = message["history"]
+                await self.finish_sync(filename, channel)
+
+    async def finish_sync(self, filename, channel):
+        if channel["synced"].done():
+            return
+        channel["synced"].set_result(None)
+        buffered, channel["buffer"] = channel["buffer"], []
+        for message in buffered:
+            await self.apply_bus_ops(filename, message)
+
+    async def apply_bus_ops(self, filename, message):
+        pending = None
+        if message["node"] == self.node_id:
+            pending = self.pending_batches.pop(message["batch"], None)
+        if pending is not None:
+            batch, done = pending
+        else:
+            batch = [(None, op["user_id"], op["operation"]) for op in message["ops"]]
+        try:
+            if filename in self.session_manager.open_files:
+                await self.apply_local(filename, batch)
+        finally:
+            if pending is not None and not done.done():
+                done.set_result(None)
+
+    async def leave_session(self, filename, websocket):
+        self.stop_loading(websocket, filename)
+        log = self.session_manager.revisions.get(filename)
+        if log is not None:
+            log.forget(self.client_key(websocket))
+        if self.session_manager.sessions.get(filename) == {websocket}:
+            self.write_behind.flush(filename)
+            self.session_manager.checkpoint(filename, self.history_changes)
+        self.session_manager.stop_session(filename, websocket)
+        if filename not in self.session_manager.sessions:
+            await self.leave_channel(filename)
 
     async def echo(self, websocket):
         self.clients.add(websocket)
-        print(f"New client connected: {websocket}. Total users: {len(self.clients)}")
+        self.connections.inc()
+        self.outbound.register(websocket)
+        logger.info(
+            "client %x connected from %s, %d connected",
+            id(websocket),
+            getattr(websocket, "remote_address", None),
+            len(self.clients),
+        )
         try:
             async for message in websocket:
-                request = Protocol.parse_request(message)
-                await self.handle_request(request, websocket)
+                with self.tracer.span("request") as span:
+                    with self.tracer.span("parse_request", bytes=len(message)):
+                        request = Protocol.parse_request(message)
+                    span.set_attribute("command", request["command"])
+                    await self.handle_request(request, websocket)
         except (
             websockets.ConnectionClosedOK,
             websockets.ConnectionClosedError,
         ) as e:
-            print(f"Connection closed: {e}")
+            logger.debug("connection %x closed: %s", id(websocket), e)
         finally:
             self.clients.remove(websocket)
-            print(f"Client disconnected: {websocket}. Total users: {len(self.clients)}")
+            self.disconnections.inc()
+            self.outbound.unregister(websocket)
+            self.codecs.pop(websocket, None)
+            for filename, members in list(self.session_manager.sessions.items()):
+                if websocket in members:
+                    await self.actors.join(filename)
+                    await self.leave_session(filename, websocket)
+            logger.info(
+                "client %x disconnected, %d connected", id(websocket), len(self.clients)
+            )
+
+    async def send(self, websocket, response, request_id=None):
+        if request_id is not None:
+            response = {**response, "id": request_id}
+        codec = self.codecs.get(websocket)
+        if codec is None:
+            frame = json.dumps(response)
+        else:
+            frame = Protocol.encode(response, codec)
+        if not await self.outbound.send_wait(websocket, frame):
+            await websocket.send(frame)
+
+    async def send_history(self, websocket, filename, data, request_id=None):
+        cursor = data.get("cursor") or 0
+        if filename in self.history_changes:
+            entries = positioned(self.history_changes[filename] or [], cursor)
+        else:
+            entries = self.file_manager.history_entries(filename, cursor)
+
+        pages = history_pages(
+            entries,
+            limit=data.get("limit", 200),
+            page_size=data.get("page_size", 50),
+            history_filter=HistoryFilter.from_request(data.get("filters")),
+        )
+        for page, cursor, done in pages:
+            await self.send(
+                websocket,
+                Protocol.create_response(
+                    "GET_HISTORY",
+                    {
+                        "status": "success",
+                        "history": page,
+                        "cursor": cursor,
+                        "done": done,
+                    },
+                ),
+                request_id,
+            )
 
     async def handle_request(self, request, websocket):
         user_id = (
             self.user_sessions[websocket] if websocket in self.user_sessions else None
         )
         command = request["command"]
-        response = None
+        if command not in self.commands:
+            response = Protocol.create_response("ERROR", {"error": "Unknown command"})
+        else:
+            response = await self.commands.dispatch(
+                command, request, websocket, user_id
+            )
 
-        if command == "PING":
-            return
+        if response:
+            with self.tracer.span("send_response"):
+                await self.send(websocket, response, request.get("id"))
 
-        elif command == "LOGIN":
-            username = request["data"]["username"]
-            user_id = username
-            self.user_sessions[websocket] = user_id
-            self.file_manager.append_user(user_id)
-            print(f"Client {username} logged in with user_id: {user_id}")
-
-            response = Protocol.create_response(
-                "LOGIN", {"status": "success", "user_id": user_id}
-            )
-
-        elif command == "GET_FILES":
-            files = self.file_manager.get_files(user_id)
-            if not files:
-                files = ["No files to show."]
-            response = Protocol.create_response("GET_FILES", {"files": files})
-
-        elif command == "GRANT_ACCESS":
-            host_id = request["data"]["user"]
-            filename = request["data"]["filename"]
-            answer = self.file_manager.grant_access(host_id, user_id, filename)
-            response = Protocol.create_response("GRANT_ACCESS", {"answer": answer})
-
-        elif command == "REMOVE_ACCESS":
-            host_id = request["data"]["user"]
-            filename = request["data"]["filename"]
-            answer = self.file_manager.remove_access(host_id, user_id, filename)
-            response = Protocol.create_response("REMOVE_ACCESS", {"answer": answer})
-
-        elif command == "OPEN_FILE":
-            filename = request["data"]["filename"]
-            user_id = request["data"]["user_id"]
-            host_id = request["data"]["host_id"]
-            print(f"opening file for user {user_id} and host {host_id}")
-
-            if user_id != host_id:
-                success, host_path, error = self.file_manager.validate_access(
-                    user_id, host_id, filename
-                )
-                print(
-                    f"validation for {user_id} and host {host_id}: status - {success}, error - {error}"
-                )
-                if not success:
-                    return await websocket.send(
-                        json.dumps(Protocol.create_response("ERROR", {"error": error}))
-                    )
+    async def handle_ping(self, request, websocket, user_id):
+        return None
 
-            if filename not in self.session_manager.open_files:
-                success, content = self.file_manager.open_file(host_id, filename)
-                self.history_changes[filename] = self.file_manager.load_history(
-                    filename
-                )
+    async def handle_login(self, request, websocket, user_id):
+        username = request["data"]["username"]
+        user_id = username
+        self.user_sessions[websocket] = user_id
+        self.file_manager.append_user(user_id)
+        logger.info("client %x logged in as %s", id(websocket), user_id)
 
-                if success:
-                    self.session_manager.start_session(filename, websocket)
-                    self.session_manager.update_content(filename, content)
-                    response = Protocol.create_response(
-                        "OPEN_FILE", {"status": "success", "content": content}
-                    )
-                else:
-                    response = Protocol.create_response(
-                        "ERROR", {"error": "File not found"}
-                    )
-            else:
-                content = self.session_manager.open_files[filename]
-                self.session_manager.start_session(filename, websocket)
-                self.session_manager.update_content(filename, content)
-                response = Protocol.create_response(
-                    "OPEN_FILE", {"status": "success", "content": content}
-                )
+        codec = Protocol.negotiate(request["data"].get("codecs"))
+        response = Protocol.create_response(
+            "LOGIN", {"status": "success", "user_id": user_id, "codec": codec}
+        )
+        # the LOGIN answer itself is always JSON, the client switches after it
+        await self.send(websocket, response, request.get("id"))
+        if codec != "json":
+            self.codecs[websocket] = codec
 
-        elif command == "CLOSE_FILE":
-            filename = request["data"]["filename"]
-            self.session_manager.stop_session(filename, websocket)
-            if filename in self.history_changes:
-                self.file_manager.save_history(filename, self.history_changes[filename])
-                self.history_changes.pop(filename)
+    async def handle_get_files(self, request, websocket, user_id):
+        files = self.file_manager.get_files(user_id)
+        if not files:
+            files = ["No files to show."]
+        return Protocol.create_response("GET_FILES", {"files": files})
+
+    async def handle_grant_access(self, request, websocket, user_id):
+        host_id = request["data"]["user"]
+        filename = request["data"]["filename"]
+        answer = self.file_manager.grant_access(host_id, user_id, filename)
+        return Protocol.create_response("GRANT_ACCESS", {"answer": answer})
+
+    async def handle_remove_access(self, request, websocket, user_id):
+        host_id = request["data"]["user"]
+        filename = request["data"]["filename"]
+        answer = self.file_manager.remove_access(host_id, user_id, filename)
+        return Protocol.create_response("REMOVE_ACCESS", {"answer": answer})
+
+    async def handle_open_file(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        user_id = request["data"]["user_id"]
+        host_id = request["data"]["host_id"]
+        logger.debug("opening %s for %s (host %s)", filename, user_id, host_id)
+
+        if user_id != host_id:
+            success, host_path, error = self.file_manager.validate_access(
+                user_id, host_id, filename
+            )
+            if not success:
+                logger.info("%s denied access to %s: %s", user_id, filename, error)
+                return Protocol.create_response("ERROR", {"error": error})
+
+        await self.actors.join(filename)
+        if filename not in self.session_manager.open_files:
+            success, content = self.file_manager.open_file(host_id, filename)
+            self.history_changes[filename] = self.file_manager.load_history(filename)
 
-        elif command == "CREATE_FILE":
-            filename = request["data"]["filename"]
-            success, error = self.file_manager.create_file(user_id, filename)
             if success:
-                response = Protocol.create_response(
-                    "CREATE_FILE", {"status": "success"}
+                self.session_manager.start_session(filename, websocket)
+                self.session_manager.update_content(filename, content)
+                recovered = self.session_manager.recover(filename, self.history_changes)
+                if recovered is not None:
+                    content = recovered
+                if self.bus is not None:
+                    await self.join_channel(filename)
+                    content = self.session_manager.get_content(filename).slice()
+                response = await self.open_file_response(
+                    websocket, filename, content, request
                 )
             else:
                 response = Protocol.create_response(
-                    "CREATE_FILE", {"status": "error", "error": error}
+                    "ERROR", {"error": "File not found"}
                 )
+        else:
+            await self.channel_ready(filename)
+            content = self.session_manager.get_content(filename).slice()
+            self.session_manager.start_session(filename, websocket)
+            response = await self.open_file_response(
+                websocket, filename, content, request
+            )
+        return response
 
-        elif command == "DELETE_FILE":
-            filename = request["data"]["filename"]
-            self.session_manager.stop_session(request["data"]["filename"], websocket)
-            success, error = self.file_manager.delete_file(user_id, filename)
-            if success:
-                response = Protocol.create_response(
-                    "DELETE_FILE", {"status": "success"}
-                )
-            else:
-                response = Protocol.create_response(
-                    "DELETE_FILE", {"status": "error", "error": error}
+    async def open_file_response(self, websocket, filename, content, request):
+        revision = self.session_manager.revision(filename)
+        crdt = self.session_manager.crdt_state(filename)
+        if crdt is not None:
+            # replicas need the whole sequence, ids and tombstones included
+            return Protocol.create_response(
+                "OPEN_FILE",
+                {
+                    "status": "success",
+                    "content": content,
+                    "revision": revision,
+                    "mode": "crdt",
+                    "crdt": crdt,
+                },
+            )
+        viewport = request["data"].get("viewport")
+        if viewport is None or len(content) <= viewport:
+            return Protocol.create_response(
+                "OPEN_FILE",
+                {"status": "success", "content": content, "revision": revision},
+            )
+
+        # first screenful now, the rest from the snapshot in the background;
+        # later frames reuse the request id and the last one has done=True
+        await self.send(
+            websocket,
+            Protocol.create_response(
+                "OPEN_FILE",
+                {
+                    "status": "success",
+                    "content": content[:viewport],
+                    "revision": revision,
+                    "start": 0,
+                    "line_count": len(content),
+                    "done": False,
+                },
+            ),
+            request.get("id"),
+        )
+        chunk_lines = request["data"].get("chunk_lines") or self.chunk_lines
+        self.stop_loading(websocket, filename)
+        self.loading[(websocket, filename)] = asyncio.create_task(
+            self.stream_lines(
+                websocket, filename, content, viewport, chunk_lines, request.get("id")
+            )
+        )
+
+    async def stream_lines(
+        self, websocket, filename, content, start, chunk_lines, request_id=None
+    ):
+        try:
+            for begin in range(start, len(content), chunk_lines):
+                end = begin + chunk_lines
+                await self.send(
+                    websocket,
+                    Protocol.create_response(
+                        "OPEN_FILE",
+                        {
+                            "status": "success",
+                            "content": content[begin:end],
+                            "start": begin,
+                            "done": end >= len(content),
+                        },
+                    ),
+                    request_id,
                 )
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self.loading.get((websocket, filename)) is asyncio.current_task():
+                del self.loading[(websocket, filename)]
 
-        elif command == "EDIT_FILE":
-            user_id = self.user_sessions[websocket]
-            filename = request["data"]["filename"]
-            operation = request["data"]["operation"]
+    def stop_loading(self, websocket, filename):
+        task = self.loading.pop((websocket, filename), None)
+        if task is not None:
+            task.cancel()
 
-            self.session_manager.start_session(filename, websocket)
-            new_operation = self.session_manager.apply_operation(
-                filename, user_id, operation, self.history_changes
+    async def handle_close_file(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        await self.actors.join(filename)
+        self.write_behind.flush(filename)
+        await self.leave_session(filename, websocket)
+        if filename in self.history_changes:
+            self.file_manager.save_history(filename, self.history_changes[filename])
+            if filename not in self.session_manager.sessions:
+                self.history_changes.pop(filename)
+
+    async def handle_create_file(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        mode = request["data"].get("mode", "ordered")
+        if mode not in ("ordered", "crdt"):
+            return Protocol.create_response(
+                "CREATE_FILE", {"status": "error", "error": f"Unknown mode {mode}"}
             )
-            content = self.session_manager.get_content(filename)
+        success, error = self.file_manager.create_file(user_id, filename)
+        if success:
+            if mode == "crdt":
+                self.session_manager.create_crdt(filename)
+            return Protocol.create_response("CREATE_FILE", {"status": "success"})
+        return Protocol.create_response(
+            "CREATE_FILE", {"status": "error", "error": error}
+        )
 
-            self.file_manager.save_file(user_id, filename, content)
+    async def handle_delete_file(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        await self.actors.stop(filename)
+        self.stop_loading(websocket, filename)
+        self.session_manager.stop_session(request["data"]["filename"], websocket)
+        if filename not in self.session_manager.sessions:
+            await self.leave_channel(filename)
+        self.write_behind.discard(filename)
+        success, error = self.file_manager.delete_file(user_id, filename)
+        if success:
+            self.op_log.delete(filename)
+            return Protocol.create_response("DELETE_FILE", {"status": "success"})
+        return Protocol.create_response(
+            "DELETE_FILE", {"status": "error", "error": error}
+        )
 
-            if new_operation is None:
-                await self.session_manager.share_update(
-                    filename, operation, websocket, user_id
-                )
-            else:
-                await self.session_manager.share_update(
-                    filename, new_operation, websocket=None, user_id=user_id
-                )
+    async def handle_edit_file(self, request, websocket, user_id):
+        user_id = self.user_sessions[websocket]
+        filename = request["data"]["filename"]
+        operation = request["data"]["operation"]
+        if "revision" in operation:
+            operation["client"] = self.client_key(websocket)
 
-        elif command == "SAVE_CONTENT":
-            filename = request["data"]["filename"]
-            content = self.session_manager.get_content(filename)
+        self.session_manager.start_session(filename, websocket)
+        self.actors.submit(filename, websocket, user_id, operation)
 
-            self.file_manager.save_file(user_id, filename, content)
+    def client_key(self, websocket) -> str:
+        # names the connection in revision logs on every node of the bus
+        return f"{self.node_id}:{id(websocket):x}"
 
-        elif command == "GET_HISTORY":
-            filename = request["data"]["filename"]
-            try:
-                history = self.file_manager.load_history(filename)
-                response = Protocol.create_response(
-                    "GET_HISTORY", {"status": "success", "history": history}
-                )
-            except Exception as e:
-                response = Protocol.create_response(
-                    "GET_HISTORY", {"status": "error", "error": str(e)}
-                )
+    async def handle_save_content(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        await self.actors.join(filename)
+        self.write_behind.flush(filename)
+
+    async def handle_get_history(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        try:
+            await self.send_history(
+                websocket, filename, request["data"], request.get("id")
+            )
+        except Exception as e:
+            return Protocol.create_response(
+                "GET_HISTORY", {"status": "error", "error": str(e)}
+            )
 
-        elif command == "DELETE_HISTORY":
-            filename = request["data"]["filename"]
-            self.file_manager.delete_history(filename)
+    async def handle_delete_history(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        self.file_manager.delete_history(filename)
 
-        elif command == "GET_REGISTERED_USERS":
-            try:
-                users = self.file_manager.get_all_registered_users()
-                response = Protocol.create_response(
-                    "GET_REGISTERED_USERS",
-                    {"status": "success", "users": users},
-                )
-            except Exception as e:
-                response = Protocol.create_response(
-                    "GET_REGISTERED_USERS",
-                    {"status": "error", "error": str(e)},
-                )
+    async def handle_get_registered_users(self, request, websocket, user_id):
+        try:
+            users = self.file_manager.get_all_registered_users()
+            return Protocol.create_response(
+                "GET_REGISTERED_USERS",
+                {"status": "success", "users": users},
+            )
+        except Exception as e:
+            return Protocol.create_response(
+                "GET_REGISTERED_USERS",
+                {"status": "error", "error": str(e)},
+            )
 
-        else:
-            response = Protocol.create_response("ERROR", {"error": "Unknown command"})
+    async def handle_get_lines(self, request, websocket, user_id):
+        filename = request["data"]["filename"]
+        if websocket not in self.session_manager.sessions.get(filename, ()):
+            return Protocol.create_response(
+                "GET_LINES", {"status": "error", "error": "File is not open"}
+            )
+        await self.actors.join(filename)
+        document = self.session_manager.get_content(filename)
+        start = max(0, request["data"].get("start", 0))
+        end = request["data"].get("end")
+        return Protocol.create_response(
+            "GET_LINES",
+            {
+                "status": "success",
+                "start": start,
+                "lines": document.slice(start, end),
+                "line_count": document.line_count(),
+            },
+        )
 
-        if response:
-            await websocket.send(json.dumps(response))
+    async def handle_sync_index(self, request, websocket, user_id):
+        token = (request.get("data") or {}).get("token")
+        if (
+            self.control_token is None
+            or not isinstance(token, str)
+            or not hmac.compare_digest(token, self.control_token)
+        ):
+            logger.warning("SYNC_INDEX refused from client %x", id(websocket))
+            return Protocol.create_response("ERROR", {"error": "Access denied"})
+        self.file_manager.load_index()
+
+    async def handle_get_stats(self, request, websocket, user_id):
+        if user_id not in self.admin_users:
+            return Protocol.create_response(
+                "GET_STATS", {"status": "error", "error": "Access denied"}
+            )
+        return Protocol.create_response(
+            "GET_STATS",
+            {
+                "status": "success",
+                "commands": self.commands.summary(),
+                "actors": self.actors.metrics(),
+                "outbound": self.outbound.metrics(),
+                "broadcast": {
+                    "frames_encoded": self.session_manager.frames_encoded,
+                    "encodes_saved": self.session_manager.encodes_saved,
+                },
+                "write_behind": {
+                    "flushes": self.write_behind.flushes,
+                    "coalesced_ops": self.write_behind.coalesced_ops,
+                },
+            },
+        )
 
 
 if __name__ == "__main__":
@@ -1,138 +1,412 @@
 import datetime
+import time
+from .log import get_logger, sampled
+from .metrics import MetricsRegistry
+from .tracing import Tracer
+from Shared.crdt import OPERATIONS as CRDT_OPERATIONS, CrdtDocument
+from Shared.document import Document, RopeDocument
+from Shared.ot import RevisionLog
 from Shared.protocol import Protocol
 
-
-def safe_list_get(lst, idx, default):
-    try:
-        return lst[idx]
-    except IndexError:
-        return default
+logger = get_logger("session")
+# per-operation events, at most 20 lines a second
+operation_log = sampled("session.operations", per_second=20)
+broadcast_log = sampled("session.broadcast", per_second=20)
+# CRDT site of the operations the server makes itself
+SERVER_SITE = "server"
 
 
 class SessionManager:
-    def __init__(self):
+    def __init__(
+        self,
+        document_class=RopeDocument,
+        op_log=None,
+        codecs=None,
+        metrics=None,
+        tracer=None,
+        revision_window=1024,
+        tombstone_limit=1024,
+    ):
         self.sessions = {}
-        self.open_files: dict[str, list[str]] = {}
+        self.codecs = codecs if codecs is not None else {}
+        self.frames_encoded = 0
+        self.encodes_saved = 0
+        self.outbound = None
+        self.pending_records = None
+        self.document_class = document_class
+        self.op_log = op_log
+        self.open_files: dict[str, Document] = {}
+        self.revision_window = revision_window
+        self.revisions: dict[str, RevisionLog] = {}
+        # per document and member: the latest revision the member is known to
+        # have seen, below which tombstones can be collected
+        self.replicas: dict[str, dict] = {}
+        self.tombstone_limit = tombstone_limit
+        self.tracer = tracer if tracer is not None else Tracer()
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        self.apply_latency = metrics.histogram(
+            "apply_operation_seconds", "Time to apply one operation", ["op_type"]
+        )
+        self.fanout_latency = metrics.histogram(
+            "broadcast_seconds", "Time to fan an update out to a session"
+        )
+        self.recipients = metrics.counter(
+            "broadcast_recipients_total", "Frames handed to session members"
+        )
+        metrics.gauge(
+            "open_documents", "Documents held in memory", callback=self.open_documents
+        )
+        metrics.gauge(
+            "document_bytes",
+            "Size of each open document",
+            ["filename"],
+            callback=self.document_sizes,
+        )
 
     def start_session(self, filename: str, websocket):
         if filename not in self.sessions:
-            print(f"start session in {filename}")
+            logger.debug("start session in %s", filename)
             self.sessions[filename] = set()
         self.sessions[filename].add(websocket)
-        print(
-            f"User {websocket} joined session for {filename}. Current session: {self.sessions[filename]}"
+        logger.debug(
+            "client %x joined %s (%d members)",
+            id(websocket),
+            filename,
+            len(self.sessions[filename]),
         )
 
         if filename not in self.open_files:
-            self.open_files[filename] = [""]
+            self.open_files[filename] = self.document_class([""])
+            self.revisions[filename] = RevisionLog(window=self.revision_window)
+        self.replicas.setdefault(filename, {}).setdefault(
+            websocket, self.revision(filename)
+        )
 
     def stop_session(self, filename: str, websocket):
         if filename in self.open_files:
             if websocket in self.sessions[filename]:
-                print(f"User {websocket} leaving session for {filename}")
+                logger.debug("client %x leaving %s", id(websocket), filename)
                 self.sessions[filename].discard(websocket)
+                self.replicas.get(filename, {}).pop(websocket, None)
                 if not self.sessions[filename]:
-                    print(f"No users left in session for {filename}. Removing session.")
+                    logger.debug("no members left in %s, closing session", filename)
                     del self.sessions[filename]
                     self.open_files.pop(filename)
+                    self.revisions.pop(filename, None)
+                    self.replicas.pop(filename, None)
+                    if self.op_log is not None:
+                        self.op_log.release(filename)
 
-    def update_content(self, filename: str, content: list[str]):
+    def update_content(self, filename: str, content: list[str], crdt=None):
         if filename in self.open_files:
-            self.open_files[filename] = content
+            if crdt is not None:
+                document = CrdtDocument.from_state(crdt, SERVER_SITE)
+            else:
+                document = self.document_class(content)
+            self.open_files[filename] = document
+
+    def create_crdt(self, filename: str):
+        # a document's mode lives in its snapshot, so a new CRDT file starts
+        # with an empty one
+        if self.op_log is not None:
+            self.op_log.snapshot(
+                filename,
+                [""],
+                [],
+                background=False,
+                clean=True,
+                crdt=CrdtDocument().state(),
+            )
+
+    def crdt_state(self, filename: str):
+        document = self.open_files.get(filename)
+        if isinstance(document, CrdtDocument):
+            return document.state()
+        return None
 
     def apply_operation(self, filename: str, user_id, operation, history):
-        print(f"apply operation {operation['op_type']} in file: {filename}")
+        operation_log.debug("apply %s in %s", operation["op_type"], filename)
         current_time = str(datetime.datetime.now())
 
         if filename in self.open_files:
             if operation["op_type"] == "cancel_changes":
                 last_change = history[filename].pop() if history[filename] else None
-                return self.cancel_change(last_change, filename)
-            start_y, start_x = (
-                operation["start_pos"]["y"],
-                operation["start_pos"]["x"],
-            )
-            while len(self.open_files[filename]) <= start_y:
-                self.open_files[filename].append("")
+                new_operation = self.cancel_change(last_change, filename)
+                if new_operation is not None:
+                    self.log_operation(
+                        filename, user_id, current_time, new_operation, history, True
+                    )
+                return new_operation
 
-            if operation["op_type"] == "insert":
-                start_y, start_x = (
-                    operation["start_pos"]["y"],
-                    operation["start_pos"]["x"],
+            self.apply_to_document(self.open_files[filename], operation)
+            if operation["op_type"] in ("insert", "delete"):
+                self.make_history_entry(
+                    filename, history, user_id, current_time, operation
                 )
-                insert_text = operation["text"]
-                end_y = start_y
-                end_x = start_x + len(insert_text[0])
-                close_line = self.open_files[filename][start_y][start_x:]
-
-                for i in range(len(insert_text)):
-                    if i == 0:
-                        self.open_files[filename][start_y] = (
-                            self.open_files[filename][start_y][:start_x]
-                            + insert_text[i]
-                        )
-                    else:
-                        self.open_files[filename].insert(start_y + i, insert_text[i])
-                        end_y += 1
+            self.log_operation(filename, user_id, current_time, operation, history)
 
-                self.open_files[filename][start_y + len(insert_text) - 1] = (
-                    self.open_files[filename][start_y + len(insert_text) - 1]
-                    + close_line
-                )
+    @staticmethod
+    def apply_to_document(document: Document, operation):
+        if operation["op_type"] in CRDT_OPERATIONS:
+            document.apply(operation)
+            return
+        start_y, start_x = (
+            operation["start_pos"]["y"],
+            operation["start_pos"]["x"],
+        )
+        document.pad_to(start_y)
 
-                if end_y != start_y:
-                    end_x = len(insert_text[-1])
+        if operation["op_type"] == "insert":
+            end_y, end_x = document.insert(start_y, start_x, operation["text"])
+            operation["end_pos"] = {"y": end_y, "x": end_x}
 
-                operation["end_pos"]["y"] = end_y
-                operation["end_pos"]["x"] = end_x
+        elif operation["op_type"] == "delete":
+            end_y, end_x = (
+                operation["end_pos"]["y"],
+                operation["end_pos"]["x"],
+            )
+            operation["text"] = document.delete(start_y, start_x, end_y, end_x)
 
-                self.make_history_entry(
-                    filename, history, user_id, current_time, operation
-                )
+        elif operation["op_type"] == "new line":
+            document.insert(start_y, start_x, ["", ""])
 
-            elif operation["op_type"] == "delete":
-                end_y, end_x = (
-                    operation["end_pos"]["y"],
-                    operation["end_pos"]["x"],
-                )
-                deleted_text = []
+    def log_operation(
+        self, filename, user_id, current_time, operation, history, undo=False
+    ):
+        if self.op_log is None:
+            return
+        record = {"user_id": user_id, "time": current_time, "operation": operation}
+        if undo:
+            record["undo"] = True
+        if self.pending_records is not None:
+            self.pending_records.append(record)
+        else:
+            self.write_records(filename, [record], history)
 
-                if start_y == end_y:
-                    deleted_text.append(
-                        self.open_files[filename][start_y][start_x:end_x]
-                    )
-                    self.open_files[filename][start_y] = (
-                        self.open_files[filename][start_y][:start_x]
-                        + self.open_files[filename][start_y][end_x:]
-                    )
-                else:
-                    close_line = self.open_files[filename][end_y][end_x:]
-                    for i in range(end_y, start_y, -1):
-                        if safe_list_get(self.open_files[filename], i, 0) != 0:
-                            deleted_text.append(self.open_files[filename][i][:end_x])
-                            self.open_files[filename].pop(i)
-                    deleted_text.append(self.open_files[filename][start_y][start_x:])
-                    deleted_text.reverse()
-
-                    self.open_files[filename][start_y] = (
-                        self.open_files[filename][start_y][:start_x] + close_line
-                    )
+    def write_records(self, filename, records, history):
+        if not records or self.op_log is None:
+            return
+        if self.op_log.append_many(filename, records):
+            self.op_log.snapshot(
+                filename,
+                self.open_files[filename].slice(),
+                list(history.get(filename, [])),
+                crdt=self.crdt_state(filename),
+            )
 
-                operation["text"] = deleted_text
-                self.make_history_entry(
-                    filename, history, user_id, current_time, operation
+    def revision(self, filename: str) -> int:
+        log = self.revisions.get(filename)
+        return log.revision if log is not None else 0
+
+    def restore_revisions(self, filename: str, state: dict):
+        self.revisions[filename] = RevisionLog.from_state(state, self.revision_window)
+
+    def apply_batch(self, filename: str, batch, history):
+        # updates are (sender, user_id, operation, revision); "ack" operations
+        # only go back to the sender
+        updates = []
+        self.pending_records = []
+        try:
+            for websocket, user_id, operation in batch:
+                started = time.perf_counter()
+                op_type = operation.get("op_type")
+                try:
+                    with self.tracer.span("apply_operation", op_type=op_type):
+                        updates.extend(
+                            self.apply_revision(
+                                filename, websocket, user_id, operation, history
+                            )
+                        )
+                except Exception:
+                    # the rest of the batch still goes out; the sender, which
+                    # already shows its edit, is brought back to the document
+                    logger.exception(
+                        "could not apply %s from %s in %s", op_type, user_id, filename
+                    )
+                    updates.extend(self.reject(filename, websocket, user_id))
+                    continue
+                self.apply_latency.labels(op_type).observe(
+                    time.perf_counter() - started
                 )
+        finally:
+            records, self.pending_records = self.pending_records, None
+            self.write_records(filename, records, history)
+        return updates
+
+    def apply_revision(self, filename: str, websocket, user_id, operation, history):
+        base = operation.pop("revision", None)
+        seq = operation.pop("seq", None)
+        client = operation.pop("client", None)
+        log = self.revisions.get(filename)
+        if log is None:
+            new_operation = self.apply_operation(filename, user_id, operation, history)
+            if new_operation is None:
+                return [(websocket, user_id, operation, None)]
+            return [(None, user_id, new_operation, None)]
+
+        if isinstance(self.open_files[filename], CrdtDocument):
+            return self.apply_crdt(
+                filename, websocket, user_id, operation, base, seq, client, history
+            )
+
+        if operation["op_type"] == "cancel_changes":
+            new_operation = self.apply_operation(filename, user_id, operation, history)
+            if new_operation is None:
+                return []
+            return [(None, user_id, new_operation, log.record([new_operation]))]
+
+        previous = log.clients.get(client)
+        submitted = log.submit(operation, client, base)
+        if submitted is None:
+            logger.warning(
+                "%s is too far behind in %s (revision %d), resyncing",
+                user_id,
+                filename,
+                base,
+            )
+            return self.reject(filename, websocket, user_id)
+        revision, operations = submitted
+        try:
+            for new_operation in operations:
+                self.apply_operation(filename, user_id, new_operation, history)
+        except Exception:
+            log.withdraw(client, previous)
+            raise
+        updates = [
+            (websocket, user_id, new_operation, revision)
+            for new_operation in operations
+        ]
+        if base is not None:
+            ack = self.acknowledgement(seq, operations)
+            updates.append((websocket, user_id, ack, revision))
+        return updates
+
+    def reject(self, filename: str, websocket, user_id):
+        if websocket is None or filename not in self.open_files:
+            return []
+        log = self.revisions.get(filename)
+        revision = log.revision if log is not None else None
+        return [(websocket, user_id, self.resync_operation(filename), revision)]
+
+    def resync_operation(self, filename: str) -> dict:
+        document = self.open_files[filename]
+        operation = {
+            "op_type": "resync",
+            "start_pos": {"y": 0, "x": 0},
+            "text": document.slice(),
+        }
+        if isinstance(document, CrdtDocument):
+            operation["crdt"] = document.state()
+        return operation
 
-            elif operation["op_type"] == "new line":
-                start_y, start_x = (
-                    operation["start_pos"]["y"],
-                    operation["start_pos"]["x"],
+    @staticmethod
+    def acknowledgement(seq, operations) -> dict:
+        # names the operation by the sender's sequence number and tells where
+        # it landed once rebased
+        ack = {"op_type": "ack"}
+        if seq is not None:
+            ack["seq"] = seq
+        for operation in operations:
+            if "start_pos" in operation:
+                ack["start_pos"] = dict(operation["start_pos"])
+                break
+        return ack
+
+    def apply_crdt(
+        self, filename: str, websocket, user_id, operation, base, seq, client, history
+    ):
+        # CRDT operations merge by themselves: they are only numbered, logged
+        # and relayed. Positional ones are made into CRDT operations of the
+        # server's own site; undo is not supported on these documents
+        document = self.open_files[filename]
+        log = self.revisions[filename]
+        revision = log.revision + 1
+        if operation["op_type"] in ("crdt_insert", "crdt_delete"):
+            document.apply(operation, revision)
+        elif operation["op_type"] in ("insert", "delete", "new line"):
+            operation = document.local_operation(operation, revision)
+        else:
+            operation = None
+
+        updates = []
+        if operation is not None:
+            log.record([operation], client)
+            self.log_operation(
+                filename, user_id, str(datetime.datetime.now()), operation, history
+            )
+            updates.append((websocket, user_id, operation, revision))
+        if base is not None:
+            replicas = self.replicas.get(filename, {})
+            if websocket in replicas:
+                replicas[websocket] = max(replicas[websocket], base)
+            ack = self.acknowledgement(seq, [])
+            updates.append((websocket, user_id, ack, log.revision))
+        updates.extend(self.collect_tombstones(filename, history))
+        return updates
+
+    def collect_tombstones(self, filename: str, history):
+        # tombstones every member has seen deleted can no longer be an insert
+        # origin or a delete target, so all replicas drop them together
+        document = self.open_files[filename]
+        if self.tombstone_limit is None or document.tombstones <= self.tombstone_limit:
+            return []
+        log = self.revisions[filename]
+        stable = min(self.replicas.get(filename, {}).values(), default=log.revision)
+        operation = document.collect(stable)
+        if operation is None:
+            return []
+        logger.debug("collected tombstones in %s up to revision %d", filename, stable)
+        self.log_operation(
+            filename, None, str(datetime.datetime.now()), operation, history
+        )
+        return [(None, None, operation, log.record([operation]))]
+
+    def checkpoint(self, filename: str, history, background=True):
+        if self.op_log is None or filename not in self.open_files:
+            return
+        self.op_log.snapshot(
+            filename,
+            self.open_files[filename].slice(),
+            list(history.get(filename, [])),
+            background,
+            clean=True,
+            crdt=self.crdt_state(filename),
+        )
+
+    def recover(self, filename: str, history):
+        if self.op_log is None or filename not in self.open_files:
+            return None
+
+        snapshot, records = self.op_log.recover(filename)
+        crdt = snapshot.get("crdt") if snapshot is not None else None
+        if not records and (snapshot is None or snapshot.get("clean")) and crdt is None:
+            self.checkpoint(filename, history, background=False)
+            return None
+
+        if records:
+            logger.info(
+                "recovering %s: replaying %d logged operations", filename, len(records)
+            )
+        if crdt is not None:
+            document = CrdtDocument.from_state(crdt, SERVER_SITE)
+        else:
+            document = self.document_class(snapshot["content"])
+        self.open_files[filename] = document
+        history[filename] = snapshot["history"]
+        for record in records:
+            operation = record["operation"]
+            self.apply_to_document(document, operation)
+            if record.get("undo"):
+                if history[filename]:
+                    history[filename].pop()
+            elif operation["op_type"] in ("insert", "delete"):
+                self.make_history_entry(
+                    filename, history, record["user_id"], record["time"], operation
                 )
-                new_line = self.open_files[filename][start_y][start_x:]
-                self.open_files[filename][start_y] = self.open_files[filename][start_y][
-                    :start_x
-                ]
-                self.open_files[filename].insert(start_y + 1, new_line)
+        if crdt is not None:
+            # no member holds a replica yet, so every tombstone can go
+            document.collect()
+        return document.slice()
 
     @staticmethod
     def make_history_entry(filename, history, user_id, current_time, operation):
@@ -160,6 +434,7 @@ class SessionManager:
             return
 
         operation = last_change["operation"]
+        document = self.open_files[filename]
 
         if operation["op_type"] == "insert":
             start_y, start_x = (
@@ -167,15 +442,7 @@ class SessionManager:
                 operation["start_pos"]["x"],
             )
             end_y, end_x = operation["end_pos"]["y"], operation["end_pos"]["x"]
-
-            close_line = self.open_files[filename][end_y][end_x:]
-
-            if start_y != end_y:
-                for i in range(end_y, start_y, -1):
-                    self.open_files[filename].pop(i)
-            self.open_files[filename][start_y] = (
-                self.open_files[filename][start_y][:start_x] + close_line
-            )
+            document.delete(start_y, start_x, end_y, end_x)
 
             return {
                 "op_type": "delete",
@@ -189,89 +456,210 @@ class SessionManager:
                 operation["start_pos"]["x"],
             )
             deleted_text = operation["text"]
-            end_y = 0
-            close_line = self.open_files[filename][start_y][start_x:]
-
-            for i in range(len(deleted_text)):
-                end_y = i
-                if i == 0:
-                    self.open_files[filename][start_y] = (
-                        self.open_files[filename][start_y][:start_x] + deleted_text[i]
-                    )
-                else:
-                    self.open_files[filename].insert(start_y + i, deleted_text[i])
+            document.insert(start_y, start_x, deleted_text)
 
-            self.open_files[filename][start_y + end_y] += close_line
             return {
                 "op_type": "insert",
                 "start_pos": {"y": start_y, "x": start_x},
                 "text": deleted_text,
             }
 
-    async def share_update(self, filename: str, operation, websocket, user_id):
+    @classmethod
+    def build_update(cls, filename: str, operation, user_id, revision=None):
+        message = cls.build_operation_update(filename, operation, user_id)
+        if message is not None and revision is not None:
+            message["data"]["revision"] = revision
+        return message
+
+    @staticmethod
+    def build_operation_update(filename: str, operation, user_id):
+        if operation["op_type"] in CRDT_OPERATIONS:
+            return Protocol.create_response(
+                "EDIT_FILE",
+                {"operation": operation, "filename": filename, "user_id": user_id},
+            )
+        if operation["op_type"] == "insert":
+            return Protocol.create_response(
+                "EDIT_FILE",
+                {
+                    "operation": {
+                        "op_type": "insert",
+                        "start_pos": {
+                            "y": operation["start_pos"]["y"],
+                            "x": operation["start_pos"]["x"],
+                        },
+                        "text": operation["text"],
+                    },
+                    "filename": filename,
+                    "user_id": user_id,
+                },
+            )
+        elif operation["op_type"] == "delete":
+            return Protocol.create_response(
+                "EDIT_FILE",
+                {
+                    "operation": {
+                        "op_type": operation["op_type"],
+                        "start_pos": {
+                            "y": operation["start_pos"]["y"],
+                            "x": operation["start_pos"]["x"],
+                        },
+                        "end_pos": {
+                            "y": operation["end_pos"]["y"],
+                            "x": operation["end_pos"]["x"],
+                        },
+                    },
+                    "filename": filename,
+                    "user_id": user_id,
+                },
+            )
+        elif operation["op_type"] == "new line":
+            return Protocol.create_response(
+                "EDIT_FILE",
+                {
+                    "operation": {
+                        "op_type": operation["op_type"],
+                        "start_pos": {
+                            "y": operation["start_pos"]["y"],
+                            "x": operation["start_pos"]["x"],
+                        },
+                    },
+                    "user_id": user_id,
+                },
+            )
+        return None
+
+    async def deliver(self, client, frame, filename: str):
+        if self.outbound is None or not self.outbound.send(client, frame, key=filename):
+            await client.send(frame)
+
+    async def broadcast(self, filename: str, message: dict, exclude=None):
+        # one encoded frame per codec in use, shared by every recipient
+        started = time.perf_counter()
+        frames = {}
+        sent = 0
+        for client in list(self.sessions.get(filename, ())):
+            if client == exclude:
+                continue
+            codec = self.codecs.get(client, "json")
+            if codec not in frames:
+                frames[codec] = Protocol.encode(message, codec)
+                self.frames_encoded += 1
+            await self.deliver(client, frames[codec], filename)
+            sent += 1
+        self.encodes_saved += sent - len(frames)
+        self.record_fanout(started, sent)
+        return sent
+
+    def record_fanout(self, started: float, sent: int):
+        self.fanout_latency.observe(time.perf_counter() - started)
+        self.recipients.inc(sent)
+
+    async def share_batch(self, filename: str, updates):
+        if len(updates) == 1:
+            websocket, user_id, operation, revision = updates[0]
+            if operation["op_type"] not in ("resync", "ack"):
+                return await self.share_update(
+                    filename, operation, websocket, user_id, revision
+                )
+
+        # (sender, private, data): acks and resyncs only go to their sender,
+        # operations to everyone else
+        entries = []
+        for websocket, user_id, operation, revision in updates:
+            if operation["op_type"] == "ack":
+                data = {"ack": True, "revision": revision}
+                data.update(item for item in operation.items() if item[0] != "op_type")
+                entries.append((websocket, True, data))
+            elif operation["op_type"] == "resync":
+                data = {"operation": operation, "revision": revision}
+                entries.append((websocket, True, data))
+            else:
+                message = self.build_update(filename, operation, user_id, revision)
+                if message is not None:
+                    message["data"].pop("filename", None)
+                    entries.append((websocket, False, message["data"]))
+
+        # senders get a frame of their own, everyone else shares the frame
+        # for the full batch
+        senders = {websocket for websocket, _, _ in entries}
+        started = time.perf_counter()
+        frames = {}
+        sent = 0
+        for client in list(self.sessions.get(filename, ())):
+            own = client if client in senders else None
+            key = (self.codecs.get(client, "json"), own)
+            if key not in frames:
+                operations = [
+                    data
+                    for sender, private, data in entries
+                    if (own is not None and sender == own) == private
+                ]
+                frames[key] = None
+                if operations:
+                    message = Protocol.create_response(
+                        "EDIT_BATCH", {"filename": filename, "operations": operations}
+                    )
+                    frames[key] = Protocol.encode(message, key[0])
+                    self.frames_encoded += 1
+            if frames[key] is None:
+                continue
+            await self.deliver(client, frames[key], filename)
+            sent += 1
+        self.encodes_saved += sent - sum(frame is not None for frame in frames.values())
+        self.record_fanout(started, sent)
+        return sent
+
+    def resync_frames(self, websocket, filename=None):
+        if filename is None:
+            filenames = [
+                name for name, members in self.sessions.items() if websocket in members
+            ]
+        else:
+            filenames = [filename]
+        codec = self.codecs.get(websocket, "json")
+        frames = []
+        for name in filenames:
+            if name not in self.open_files:
+                continue
+            operation = self.resync_operation(name)
+            message = Protocol.create_response(
+                "EDIT_FILE",
+                {
+                    "operation": operation,
+                    "filename": name,
+                    "revision": self.revision(name),
+                },
+            )
+            frames.append((name, Protocol.encode(message, codec)))
+        return frames
+
+    async def share_update(
+        self, filename: str, operation, websocket, user_id, revision=None
+    ):
         try:
             if filename not in self.sessions:
                 raise Exception(f"file {filename} is not in current sessions")
 
-            print(
-                f"Sending update for {filename}. Current session: {self.sessions[filename]}"
+            broadcast_log.debug(
+                "sending update for %s to %d members",
+                filename,
+                len(self.sessions[filename]),
             )
-            for client in self.sessions[filename]:
-                if client != websocket:
-                    print(f"Sending update to {client}")
-                    message = ""
-                    if operation["op_type"] == "insert":
-                        message = Protocol.create_message(
-                            "EDIT_FILE",
-                            {
-                                "operation": {
-                                    "op_type": "insert",
-                                    "start_pos": {
-                                        "y": operation["start_pos"]["y"],
-                                        "x": operation["start_pos"]["x"],
-                                    },
-                                    "text": operation["text"],
-                                },
-                                "filename": filename,
-                                "user_id": user_id,
-                            },
-                        )
-                    elif operation["op_type"] == "delete":
-                        message = Protocol.create_message(
-                            "EDIT_FILE",
-                            {
-                                "operation": {
-                                    "op_type": operation["op_type"],
-                                    "start_pos": {
-                                        "y": operation["start_pos"]["y"],
-                                        "x": operation["start_pos"]["x"],
-                                    },
-                                    "end_pos": {
-                                        "y": operation["end_pos"]["y"],
-                                        "x": operation["end_pos"]["x"],
-                                    },
-                                },
-                                "filename": filename,
-                                "user_id": user_id,
-                            },
-                        )
-                    elif operation["op_type"] == "new line":
-                        message = Protocol.create_message(
-                            "EDIT_FILE",
-                            {
-                                "operation": {
-                                    "op_type": operation["op_type"],
-                                    "start_pos": {
-                                        "y": operation["start_pos"]["y"],
-                                        "x": operation["start_pos"]["x"],
-                                    },
-                                },
-                                "user_id": user_id,
-                            },
-                        )
-                    await client.send(message)
+            message = self.build_update(filename, operation, user_id, revision)
+            if message is not None:
+                return await self.broadcast(filename, message, exclude=websocket)
         except Exception as e:
-            print(f"Error sending update to client {user_id}: {e}")
+            logger.warning("error sending update from %s: %s", user_id, e)
+
+    def open_documents(self) -> int:
+        return len(self.open_files)
+
+    def document_sizes(self) -> dict:
+        return {
+            filename: document.byte_count()
+            for filename, document in list(self.open_files.items())
+        }
 
     def get_clients(self):
         return self.sessions.keys()
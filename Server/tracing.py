@@ -0,0 +1,155 @@
+import contextvars
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+current_span = contextvars.ContextVar("current_span", default=None)
+# default for Tracer.span(parent=...): nest under the span active in this context
+INHERIT = object()
+
+
+class Span:
+    __slots__ = (
+        "exporter",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_time",
+        "started",
+        "duration",
+        "token",
+    )
+
+    def __init__(self, exporter, name, parent=None, attributes=None):
+        self.exporter = exporter
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes or {}
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+            self.exporter.export(self)
+
+    def __enter__(self):
+        self.token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.attributes["error"] = repr(exc)
+        current_span.reset(self.token)
+        self.end()
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+class NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class RingBufferExporter:
+    def __init__(self, capacity: int = 4096):
+        self.buffer = deque(maxlen=capacity)
+
+    def export(self, span: Span):
+        self.buffer.append(span)
+
+    def spans(self, trace_id: str = None) -> list[dict]:
+        return [
+            span.to_dict()
+            for span in list(self.buffer)
+            if trace_id is None or span.trace_id == trace_id
+        ]
+
+    def clear(self):
+        self.buffer.clear()
+
+    def close(self):
+        pass
+
+
+class JsonLinesExporter:
+    # spans are queued on the event loop thread and encoded and written by a
+    # background thread, like log records
+    def __init__(self, path: str):
+        self.file = open(path, "a")
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(
+            target=self.write, name="span-exporter", daemon=True
+        )
+        self.thread.start()
+
+    def export(self, span: Span):
+        self.queue.put(span.to_dict())
+
+    def write(self):
+        while (record := self.queue.get()) is not None:
+            self.file.write(json.dumps(record, default=str) + "\n")
+            if self.queue.empty():
+                self.file.flush()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.file.close()
+
+
+class Tracer:
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def span(self, name: str, parent=INHERIT, **attributes):
+        if self.exporter is None:
+            return NOOP_SPAN
+        if parent is INHERIT:
+            parent = current_span.get()
+        return Span(self.exporter, name, parent, attributes)
+
+    def current(self):
+        return current_span.get()
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
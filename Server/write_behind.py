@@ -0,0 +1,81 @@
+import asyncio
+from .log import get_logger
+
+logger = get_logger("write_behind")
+
+
+class DirtyDocument:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.pending_ops = 0
+        self.timer = None
+
+
+class WriteBehind:
+    def __init__(self, save, max_delay: float = 1.0, max_ops: int = 100):
+        self.save = save
+        self.max_delay = max_delay
+        self.max_ops = max_ops
+        self.dirty: dict[str, DirtyDocument] = {}
+        self.flushes = 0
+        self.coalesced_ops = 0
+
+    def mark_dirty(self, filename: str, user_id, ops: int = 1):
+        state = self.dirty.get(filename)
+        if state is None:
+            state = self.dirty[filename] = DirtyDocument(user_id)
+        state.user_id = user_id
+        state.pending_ops += ops
+
+        if state.pending_ops >= self.max_ops or self.max_delay <= 0:
+            self.flush(filename)
+        elif state.timer is None:
+            state.timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self.flush, filename
+            )
+
+    def is_dirty(self, filename: str) -> bool:
+        return filename in self.dirty
+
+    def flush(self, filename: str):
+        state = self.dirty.get(filename)
+        if state is None:
+            return False
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+
+        try:
+            saved = self.save(state.user_id, filename)
+        except Exception:
+            # the edits stay pending and the save is tried again later
+            logger.exception("saving %s failed", filename)
+            self.retry(filename, state)
+            return False
+        if saved is False:
+            # nothing held the content any more; the edits stay pending until
+            # the document is open again
+            logger.warning(
+                "%s is not open, %d edits not saved", filename, state.pending_ops
+            )
+            return False
+        del self.dirty[filename]
+        self.flushes += 1
+        self.coalesced_ops += state.pending_ops - 1
+        return True
+
+    def retry(self, filename: str, state: DirtyDocument):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        state.timer = loop.call_later(max(self.max_delay, 0.1), self.flush, filename)
+
+    def flush_all(self):
+        for filename in list(self.dirty):
+            self.flush(filename)
+
+    def discard(self, filename: str):
+        state = self.dirty.pop(filename, None)
+        if state is not None and state.timer is not None:
+            state.timer.cancel()
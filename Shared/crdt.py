@@ -0,0 +1,544 @@
+from bisect import bisect_right
+from itertools import islice
+from .document import RopeDocument
+
+OPERATIONS = ("crdt_insert", "crdt_delete", "crdt_gc")
+# site of the characters a document was loaded with
+ROOT = ""
+# runs per block of the run index
+BLOCK_SIZE = 64
+
+
+class Run:
+    # characters typed one after the other by a site: ids (site, clock + i),
+    # each one's origin being the character before it. `deleted` is None for
+    # visible text, otherwise the revision the characters were deleted at
+    __slots__ = ("site", "clock", "text", "origin", "deleted", "block")
+
+    def __init__(self, site, clock, text, origin=None, deleted=None):
+        self.site = site
+        self.clock = clock
+        self.text = text
+        self.origin = origin
+        self.deleted = deleted
+        self.block = None
+
+    def end(self) -> int:
+        return self.clock + len(self.text)
+
+    def key(self):
+        return self.clock, self.site
+
+    def split(self, offset: int) -> "Run":
+        right = Run(
+            self.site,
+            self.clock + offset,
+            self.text[offset:],
+            (self.site, self.clock + offset - 1),
+            self.deleted,
+        )
+        self.text = self.text[:offset]
+        return right
+
+    def continued_by(self, other) -> bool:
+        return (
+            other.site == self.site
+            and other.clock == self.end()
+            and other.origin == (self.site, self.end() - 1)
+            and other.deleted == self.deleted
+        )
+
+
+def end_position(y: int, x: int, text: str):
+    lines = text.split("\n")
+    if len(lines) == 1:
+        return y, x + len(text)
+    return y + len(lines) - 1, len(lines[-1])
+
+
+def advance(position, extent):
+    # where text spanning `extent` (lines added, then columns on its last
+    # line) ends when it starts at `position`
+    lines, columns = extent
+    if lines:
+        return position[0] + lines, columns
+    return position[0], position[1] + columns
+
+
+class Block:
+    # consecutive runs; the extent of their visible text is cached so whole
+    # blocks are skipped when looking for a position
+    __slots__ = ("runs", "extent")
+
+    def __init__(self, runs: list):
+        self.runs = runs
+        self.extent = None
+        for run in runs:
+            run.block = self
+
+    def measure(self):
+        if self.extent is None:
+            position = (0, 0)
+            for run in self.runs:
+                if run.deleted is None:
+                    position = end_position(*position, run.text)
+            self.extent = position
+        return self.extent
+
+
+class CrdtDocument(RopeDocument):
+    # RGA sequence of characters ("\n" included) kept as runs; inserts and
+    # deletes commute, so replicas converge whatever order ops arrive in.
+    # The lines seen through the Document API are a projection of the
+    # visible runs, updated by every op. Runs are kept in blocks, and in a
+    # per-site index sorted by clock, so finding a character by id or by
+    # position does not walk every run.
+    def __init__(self, lines=None, site=ROOT):
+        self.site = site
+        super().__init__(lines)
+
+    def _load(self, lines: list[str]):
+        super()._load(lines)
+        self.clock = 0
+        self.tombstones = 0
+        # inserts whose origin and deletes whose characters have not
+        # arrived yet
+        self.waiting: list[dict] = []
+        self.orphans: list[tuple] = []
+        text = "\n".join(lines)
+        self._build([Run(ROOT, 1, text)] if text else [])
+        self.clock = len(text)
+
+    @property
+    def runs(self) -> list[Run]:
+        return [run for block in self.blocks for run in block.runs]
+
+    def state(self) -> dict:
+        return {
+            "clock": self.clock,
+            "runs": [
+                [run.site, run.clock, run.text, run.origin, run.deleted]
+                for run in self.runs
+            ],
+            "waiting": list(self.waiting),
+            "orphans": [list(orphan) for orphan in self.orphans],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, site=ROOT):
+        runs = [
+            Run(run_site, clock, text, tuple(origin) if origin else None, deleted)
+            for run_site, clock, text, origin, deleted in state["runs"]
+        ]
+        visible = "".join(run.text for run in runs if run.deleted is None)
+        document = cls(visible.split("\n"), site)
+        document.clock = state["clock"]
+        document._build(runs)
+        document.waiting = list(state.get("waiting", ()))
+        document.orphans = [tuple(orphan) for orphan in state.get("orphans", ())]
+        document.tombstones = sum(
+            len(run.text) for run in runs if run.deleted is not None
+        )
+        return document
+
+    # local edits: applied here and returned as the op to send
+
+    def local_operation(self, operation, revision=None):
+        kind = operation["op_type"]
+        if kind not in ("insert", "delete", "new line"):
+            return operation
+        y, x = operation["start_pos"]["y"], operation["start_pos"]["x"]
+        if kind == "new line":
+            return self.local_insert(y, x, ["", ""])
+        if kind == "insert":
+            return self.local_insert(y, x, operation["text"])
+        end = operation["end_pos"]
+        return self.local_delete(y, x, end["y"], end["x"], revision)
+
+    def local_insert(self, y: int, x: int, text: list[str]):
+        value = "\n".join(text or [])
+        if not value:
+            return None
+        following = self._boundary(y, x)
+        origin = None
+        for run in self._before(following):
+            if run.deleted is None:
+                origin = [run.site, run.end() - 1]
+                break
+        operation = {
+            "op_type": "crdt_insert",
+            "id": [self.site, self.clock + 1],
+            "origin": origin,
+            "text": value,
+        }
+        self.apply(operation)
+        return operation
+
+    def local_delete(
+        self, start_y: int, start_x: int, end_y: int, end_x: int, revision=None
+    ):
+        start = self._boundary(start_y, start_x)
+        end = self._boundary(end_y, end_x)
+        ranges = []
+        for run in self._from(start):
+            if run is end:
+                break
+            if run.deleted is not None:
+                continue
+            if (
+                ranges
+                and ranges[-1][0] == run.site
+                and sum(ranges[-1][1:]) == run.clock
+            ):
+                ranges[-1][2] += len(run.text)
+            else:
+                ranges.append([run.site, run.clock, len(run.text)])
+        if not ranges:
+            self._compact()
+            return None
+        operation = {"op_type": "crdt_delete", "ranges": ranges}
+        self.apply(operation, revision)
+        return operation
+
+    def insert(self, y: int, x: int, text: list[str]):
+        self.local_insert(y, x, text)
+        return end_position(y, x, "\n".join(text)) if text else (y, x)
+
+    def delete(self, start_y: int, start_x: int, end_y: int, end_x: int) -> list[str]:
+        end_y = min(end_y, self.line_count() - 1)
+        deleted = self.slice(start_y, end_y + 1)
+        deleted[-1] = deleted[-1][:end_x]
+        deleted[0] = deleted[0][start_x:]
+        self.local_delete(start_y, start_x, end_y, end_x)
+        return deleted
+
+    def pad_to(self, y: int):
+        missing = y + 1 - self.line_count()
+        if missing > 0:
+            last = self.line_count() - 1
+            self.local_insert(last, len(self.line_at(last)), [""] * (missing + 1))
+
+    # remote and local ops alike
+
+    def apply(self, operation, revision=None) -> list[dict]:
+        # returns the positional insert/delete ops that bring a plain list of
+        # lines along with the visible text
+        kind = operation["op_type"]
+        effects = []
+        if kind == "crdt_insert":
+            effects = self._integrate(operation)
+        elif kind == "crdt_delete":
+            stamp = revision if revision is not None else 0
+            effects = self._remove([tuple(r) + (stamp,) for r in operation["ranges"]])
+        elif kind == "crdt_gc":
+            self._purge(operation["ranges"])
+        self._compact()
+        return effects
+
+    def collect(self, stable=None):
+        # drops tombstones deleted at or before `stable` (all of them when
+        # None); the returned op makes the other replicas do the same
+        ranges = [
+            [run.site, run.clock, len(run.text)]
+            for run in self.runs
+            if run.deleted is not None and (stable is None or run.deleted <= stable)
+        ]
+        if not ranges:
+            return None
+        operation = {"op_type": "crdt_gc", "ranges": ranges}
+        self._purge(ranges)
+        self._compact()
+        return operation
+
+    # the run index
+
+    def _build(self, runs: list[Run]):
+        self.blocks = [
+            Block(runs[i : i + BLOCK_SIZE]) for i in range(0, len(runs), BLOCK_SIZE)
+        ]
+        # site: (clocks, runs), both sorted by clock
+        self.ids = {}
+        # blocks whose runs changed since the last _compact
+        self.touched = set()
+        for run in runs:
+            self._index(run)
+
+    def _index(self, run: Run):
+        clocks, runs = self.ids.setdefault(run.site, ([], []))
+        index = bisect_right(clocks, run.clock)
+        clocks.insert(index, run.clock)
+        runs.insert(index, run)
+
+    def _unindex(self, run: Run):
+        clocks, runs = self.ids[run.site]
+        index = bisect_right(clocks, run.clock) - 1
+        del clocks[index]
+        del runs[index]
+
+    def _touch(self, block: Block):
+        block.extent = None
+        self.touched.add(block)
+
+    def _insert(self, run: Run, following: Run = None):
+        # puts `run` in front of `following`, or last when None
+        if following is None:
+            if not self.blocks:
+                self.blocks.append(Block([]))
+            block = self.blocks[-1]
+            block.runs.append(run)
+        else:
+            block = following.block
+            block.runs.insert(block.runs.index(following), run)
+        run.block = block
+        self._index(run)
+        self._touch(block)
+
+    def _split(self, run: Run, offset: int) -> Run:
+        right = run.split(offset)
+        block = run.block
+        block.runs.insert(block.runs.index(run) + 1, right)
+        right.block = block
+        self._index(right)
+        self.touched.add(block)
+        return right
+
+    def _from(self, run: Run):
+        # `run` and the runs after it, in order; nothing when None
+        if run is None:
+            return
+        block = run.block
+        yield from block.runs[block.runs.index(run) :]
+        for block in islice(self.blocks, self.blocks.index(block) + 1, None):
+            yield from block.runs
+
+    def _next(self, run: Run):
+        runs = self._from(run)
+        next(runs)
+        return next(runs, None)
+
+    def _before(self, run: Run):
+        # the runs before `run` (all of them when None), nearest first
+        if run is None:
+            count, head = len(self.blocks), []
+        else:
+            block = run.block
+            count, head = self.blocks.index(block), block.runs[: block.runs.index(run)]
+        yield from reversed(head)
+        for block in reversed(self.blocks[:count]):
+            yield from reversed(block.runs)
+
+    def _compact(self):
+        # re-merges runs that splits left continuing each other, and keeps
+        # blocks between BLOCK_SIZE / 2 and 2 * BLOCK_SIZE runs
+        if not self.touched:
+            return
+        blocks = []
+        for block in self.blocks:
+            if block in self.touched:
+                block.runs = self._merged(block.runs)
+            if not block.runs:
+                continue
+            previous = blocks[-1] if blocks else None
+            if previous is not None and (
+                len(previous.runs) < BLOCK_SIZE // 2
+                or len(block.runs) < BLOCK_SIZE // 2
+            ):
+                for run in block.runs:
+                    run.block = previous
+                previous.runs = self._merged(previous.runs + block.runs)
+                previous.extent = None
+                block = previous
+            else:
+                blocks.append(block)
+            if len(block.runs) > 2 * BLOCK_SIZE:
+                runs = block.runs
+                blocks[-1:] = [
+                    Block(runs[i : i + BLOCK_SIZE])
+                    for i in range(0, len(runs), BLOCK_SIZE)
+                ]
+        self.blocks = blocks
+        self.touched = set()
+
+    def _merged(self, runs: list[Run]) -> list[Run]:
+        merged = []
+        for run in runs:
+            if merged and merged[-1].continued_by(run):
+                merged[-1].text += run.text
+                self._unindex(run)
+            else:
+                merged.append(run)
+        return merged
+
+    def _find(self, site, clock):
+        clocks, runs = self.ids.get(site, ((), ()))
+        index = bisect_right(clocks, clock) - 1
+        if index >= 0 and clock < runs[index].end():
+            return runs[index], clock - runs[index].clock
+        return None
+
+    def _position(self, run: Run):
+        # (y, x) of the first character of `run`, or of the end when None
+        target = run.block if run is not None else None
+        position = (0, 0)
+        for block in self.blocks:
+            if block is target:
+                break
+            position = advance(position, block.measure())
+        else:
+            return position
+        for other in target.runs:
+            if other is run:
+                break
+            if other.deleted is None:
+                position = end_position(*position, other.text)
+        return position
+
+    def _boundary(self, y: int, x: int):
+        # splits runs so that the visible text before (y, x) is all in the
+        # runs before the one returned (None when that is all of them)
+        position = (0, 0)
+        for block in self.blocks:
+            end = advance(position, block.measure())
+            if end <= (y, x):
+                position = end
+                continue
+            for run in block.runs:
+                if run.deleted is not None:
+                    continue
+                if position >= (y, x):
+                    return run
+                end = end_position(*position, run.text)
+                if (y, x) < end:
+                    offset = 0
+                    if y > position[0]:
+                        for _ in range(y - position[0]):
+                            offset = run.text.index("\n", offset) + 1
+                        line_start = offset
+                    else:
+                        line_start = offset - position[1]
+                    line_end = run.text.find("\n", offset)
+                    if line_end < 0:
+                        line_end = len(run.text)
+                    offset = min(line_start + x, line_end)
+                    if offset <= 0:
+                        return run
+                    if offset < len(run.text):
+                        return self._split(run, offset)
+                    return self._next(run)
+                position = end
+        return None
+
+    def _integrate(self, operation) -> list[dict]:
+        site, clock = operation["id"]
+        if self._find(site, clock) is not None:
+            return []
+        origin = operation["origin"]
+        # the first run, unless the origin says otherwise
+        following = next((run for block in self.blocks for run in block.runs), None)
+        if origin is not None:
+            found = self._find(*origin)
+            if found is None:
+                self.waiting.append(operation)
+                return []
+            run, offset = found
+            if offset + 1 < len(run.text):
+                following = self._split(run, offset + 1)
+            else:
+                following = self._next(run)
+            origin = tuple(origin)
+        # concurrent inserts after the same character: higher ids go first
+        key = (clock, site)
+        if following is not None and following.key() > key:
+            following = next(
+                (run for run in self._from(following) if run.key() <= key), None
+            )
+
+        text = operation["text"]
+        self.clock = max(self.clock, clock + len(text) - 1)
+        y, x = self._position(following)
+        run = Run(site, clock, text, origin)
+        previous = next(self._before(following), None)
+        if previous is not None and previous.continued_by(run):
+            # typing at the end of a run just grows it
+            previous.text += text
+            self._touch(previous.block)
+        else:
+            self._insert(run, following)
+        super().insert(y, x, text.split("\n"))
+        effects = [
+            {
+                "op_type": "insert",
+                "start_pos": {"y": y, "x": x},
+                "text": text.split("\n"),
+            }
+        ]
+
+        if self.orphans:
+            orphans, self.orphans = self.orphans, []
+            effects.extend(self._remove(orphans))
+        if self.waiting:
+            waiting, self.waiting = self.waiting, []
+            for operation in waiting:
+                effects.extend(self._integrate(operation))
+        return effects
+
+    def _isolate(self, site, clock, length):
+        # yields the runs holding exactly the characters (site, clock) to
+        # (site, clock + length), splitting runs as needed
+        end = clock + length
+        clocks, runs = self.ids.get(site, ((), ()))
+        index = max(bisect_right(clocks, clock) - 1, 0)
+        while index < len(runs) and runs[index].clock < end:
+            run = runs[index]
+            index += 1
+            if run.end() <= clock:
+                continue
+            if run.clock < clock:
+                # the right part is next in the index
+                self._split(run, clock - run.clock)
+                continue
+            if run.end() > end:
+                self._split(run, end - run.clock)
+            yield run
+
+    def _remove(self, ranges) -> list[dict]:
+        effects = []
+        for site, clock, length, stamp in ranges:
+            covered = 0
+            for run in self._isolate(site, clock, length):
+                covered += len(run.text)
+                if run.deleted is not None:
+                    continue
+                y, x = self._position(run)
+                end_y, end_x = end_position(y, x, run.text)
+                super().delete(y, x, end_y, end_x)
+                run.deleted = stamp
+                self._touch(run.block)
+                self.tombstones += len(run.text)
+                effects.append(
+                    {
+                        "op_type": "delete",
+                        "start_pos": {"y": y, "x": x},
+                        "end_pos": {"y": end_y, "x": end_x},
+                    }
+                )
+            if covered < length:
+                self.orphans.append((site, clock, length, stamp))
+        return effects
+
+    def _purge(self, ranges):
+        doomed = []
+        for site, clock, length in ranges:
+            doomed.extend(
+                run
+                for run in self._isolate(site, clock, length)
+                if run.deleted is not None
+            )
+        for run in doomed:
+            if run.block is None:
+                continue
+            self.tombstones -= len(run.text)
+            run.block.runs.remove(run)
+            self._touch(run.block)
+            self._unindex(run)
+            run.block = None
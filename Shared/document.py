@@ -0,0 +1,274 @@
+import random
+from abc import ABC, abstractmethod
+
+CHUNK_SIZE = 256
+
+
+class Document(ABC):
+    def __init__(self, lines=None):
+        lines = list(lines) if lines is not None else [""]
+        # UTF-8 size with a newline after every line, kept up to date by
+        # the edits below so it never needs a scan
+        self._bytes = sum(len(line.encode()) + 1 for line in lines)
+        self._load(lines)
+
+    @abstractmethod
+    def line_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def line_at(self, y: int) -> str:
+        pass
+
+    @abstractmethod
+    def slice(self, start: int = 0, end: int = None) -> list[str]:
+        pass
+
+    def byte_count(self) -> int:
+        return self._bytes
+
+    @abstractmethod
+    def _load(self, lines: list[str]):
+        pass
+
+    @abstractmethod
+    def _set_line(self, y: int, line: str):
+        pass
+
+    @abstractmethod
+    def _insert_lines(self, y: int, lines: list[str]):
+        pass
+
+    @abstractmethod
+    def _delete_lines(self, start: int, end: int):
+        pass
+
+    def pad_to(self, y: int):
+        missing = y + 1 - self.line_count()
+        if missing > 0:
+            self._insert_lines(self.line_count(), [""] * missing)
+            self._bytes += missing
+
+    def insert(self, y: int, x: int, text: list[str]):
+        if not text:
+            return y, x
+        self._bytes += len("\n".join(text).encode())
+        line = self.line_at(y)
+        head, tail = line[:x], line[x:]
+        if len(text) == 1:
+            self._set_line(y, head + text[0] + tail)
+            return y, x + len(text[0])
+
+        self._set_line(y, head + text[0])
+        self._insert_lines(y + 1, text[1:-1] + [text[-1] + tail])
+        return y + len(text) - 1, len(text[-1])
+
+    def delete(self, start_y: int, start_x: int, end_y: int, end_x: int) -> list[str]:
+        end_y = min(end_y, self.line_count() - 1)
+        if start_y == end_y:
+            line = self.line_at(start_y)
+            self._set_line(start_y, line[:start_x] + line[end_x:])
+            self._bytes -= len(line[start_x:end_x].encode())
+            return [line[start_x:end_x]]
+
+        first, last = self.line_at(start_y), self.line_at(end_y)
+        deleted = [first[start_x:]] + self.slice(start_y + 1, end_y) + [last[:end_x]]
+        self._set_line(start_y, first[:start_x] + last[end_x:])
+        self._delete_lines(start_y + 1, end_y + 1)
+        self._bytes -= len("\n".join(deleted).encode())
+        return deleted
+
+    def __len__(self):
+        return self.line_count()
+
+    def __iter__(self):
+        return iter(self.slice())
+
+    def __eq__(self, other):
+        if isinstance(other, (Document, list)):
+            return self.slice() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.line_count()} lines)"
+
+
+class ListDocument(Document):
+    def _load(self, lines: list[str]):
+        self._lines = lines
+
+    def line_count(self) -> int:
+        return len(self._lines)
+
+    def line_at(self, y: int) -> str:
+        return self._lines[y]
+
+    def slice(self, start: int = 0, end: int = None) -> list[str]:
+        return self._lines[start:end]
+
+    def _set_line(self, y: int, line: str):
+        self._lines[y] = line
+
+    def _insert_lines(self, y: int, lines: list[str]):
+        self._lines[y:y] = lines
+
+    def _delete_lines(self, start: int, end: int):
+        del self._lines[start:end]
+
+
+class _Chunk:
+    __slots__ = ("lines", "size", "priority", "left", "right")
+
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self.size = len(lines)
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _update(node):
+    node.size = len(node.lines) + _size(node.left) + _size(node.right)
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _split(node, index: int):
+    if node is None:
+        return None, None
+
+    left_size = _size(node.left)
+    if index <= left_size:
+        left, node.left = _split(node.left, index)
+        _update(node)
+        return left, node
+
+    own_end = left_size + len(node.lines)
+    if index >= own_end:
+        node.right, right = _split(node.right, index - own_end)
+        _update(node)
+        return node, right
+
+    offset = index - left_size
+    tail = _Chunk(node.lines[offset:])
+    node.lines = node.lines[:offset]
+    right = _merge(tail, node.right)
+    node.right = None
+    _update(node)
+    return node, right
+
+
+def _build(lines: list[str]):
+    root = None
+    for i in range(0, len(lines), CHUNK_SIZE):
+        root = _merge(root, _Chunk(lines[i : i + CHUNK_SIZE]))
+    return root
+
+
+class RopeDocument(Document):
+    # Implicit treap over chunks of lines: locating, inserting and deleting
+    # lines is O(log n) in the number of chunks, edits inside one line only
+    # touch that line's string.
+
+    def _load(self, lines: list[str]):
+        self._root = _build(lines)
+
+    def line_count(self) -> int:
+        return _size(self._root)
+
+    def _locate(self, index: int, path: list = None):
+        node = self._root
+        while node is not None:
+            if path is not None:
+                path.append(node)
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+                continue
+            index -= left_size
+            if index < len(node.lines) or node.right is None:
+                return node, index
+            index -= len(node.lines)
+            node = node.right
+        return None, index
+
+    def line_at(self, y: int) -> str:
+        if y < 0:
+            y += self.line_count()
+        if not 0 <= y < self.line_count():
+            raise IndexError("line index out of range")
+        node, offset = self._locate(y)
+        return node.lines[offset]
+
+    def slice(self, start: int = 0, end: int = None) -> list[str]:
+        count = self.line_count()
+        start, end, _ = slice(start, end).indices(count)
+        result = []
+        if start < end:
+            self._collect(self._root, start, end, result)
+        return result
+
+    def _collect(self, node, start: int, end: int, result: list[str]):
+        if node is None or start >= end:
+            return
+        left_size = _size(node.left)
+        if start < left_size:
+            self._collect(node.left, start, min(end, left_size), result)
+        own_end = left_size + len(node.lines)
+        if start < own_end and end > left_size:
+            result.extend(
+                node.lines[max(start - left_size, 0) : min(end, own_end) - left_size]
+            )
+        if end > own_end:
+            self._collect(node.right, max(start - own_end, 0), end - own_end, result)
+
+    def _set_line(self, y: int, line: str):
+        node, offset = self._locate(y)
+        node.lines[offset] = line
+
+    def _insert_lines(self, y: int, lines: list[str]):
+        if not lines:
+            return
+        path = []
+        node, offset = self._locate(y, path)
+        if node is not None and len(node.lines) + len(lines) <= 2 * CHUNK_SIZE:
+            node.lines[offset:offset] = lines
+            for parent in path:
+                parent.size += len(lines)
+            return
+
+        left, right = _split(self._root, y)
+        self._root = _merge(_merge(left, _build(lines)), right)
+
+    def _delete_lines(self, start: int, end: int):
+        if start >= end:
+            return
+        path = []
+        node, offset = self._locate(start, path)
+        if offset + (end - start) <= len(node.lines):
+            del node.lines[offset : offset + end - start]
+            for parent in path:
+                parent.size -= end - start
+            return
+
+        left, rest = _split(self._root, start)
+        _, right = _split(rest, end - start)
+        self._root = _merge(left, right)
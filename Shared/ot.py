@@ -0,0 +1,259 @@
+from collections import deque
+from itertools import islice
+from .crdt import OPERATIONS as CRDT_OPERATIONS
+
+POSITIONAL = ("insert", "delete", "new line")
+
+
+def point(position) -> tuple[int, int]:
+    return position["y"], position["x"]
+
+
+def inserted_text(operation) -> list[str]:
+    if operation["op_type"] == "new line":
+        return ["", ""]
+    return operation["text"] or []
+
+
+def insert_end(start, text):
+    if len(text) == 1:
+        return start[0], start[1] + len(text[0])
+    return start[0] + len(text) - 1, len(text[-1])
+
+
+def shift_by_insert(position, start, text, after: bool):
+    # a position exactly at the insertion point only moves past the text when
+    # `after` is set
+    if not text or position < start or (position == start and not after):
+        return position
+    end = insert_end(start, text)
+    if position[0] == start[0]:
+        return end[0], end[1] + position[1] - start[1]
+    return position[0] + end[0] - start[0], position[1]
+
+
+def shift_by_delete(position, start, end):
+    if position <= start:
+        return position
+    if position < end:
+        return start
+    if position[0] == end[0]:
+        return start[0], start[1] + position[1] - end[1]
+    return position[0] - (end[0] - start[0]), position[1]
+
+
+def moved(operation, start, end=None):
+    operation = dict(operation)
+    operation["start_pos"] = {"y": start[0], "x": start[1]}
+    if end is not None:
+        operation["end_pos"] = {"y": end[0], "x": end[1]}
+    return operation
+
+
+def transform(operation, other, first: bool = False) -> list[dict]:
+    # rewrites `operation` to apply after `other`; `first` decides whose text
+    # goes in front when both insert at the same place
+    if operation["op_type"] not in POSITIONAL or other["op_type"] not in POSITIONAL:
+        return [operation]
+    start = point(operation["start_pos"])
+    other_start = point(other["start_pos"])
+
+    if other["op_type"] == "delete":
+        other_end = point(other["end_pos"])
+        if operation["op_type"] != "delete":
+            return [moved(operation, shift_by_delete(start, other_start, other_end))]
+        start = shift_by_delete(start, other_start, other_end)
+        end = shift_by_delete(point(operation["end_pos"]), other_start, other_end)
+        return [moved(operation, start, end)] if start != end else []
+
+    text = inserted_text(other)
+    if operation["op_type"] != "delete":
+        return [moved(operation, shift_by_insert(start, other_start, text, not first))]
+    end = point(operation["end_pos"])
+    if start >= end:
+        return []
+    if start < other_start < end:
+        # the inserted text survives: delete what is after it, then before it
+        tail_end = shift_by_insert(end, other_start, text, False)
+        return [
+            moved(operation, insert_end(other_start, text), tail_end),
+            moved(operation, start, other_start),
+        ]
+    return [
+        moved(
+            operation,
+            shift_by_insert(start, other_start, text, True),
+            shift_by_insert(end, other_start, text, False),
+        )
+    ]
+
+
+def transform_lists(left, right, left_first: bool):
+    # for two sequences made against the same state, returns left rewritten to
+    # apply after right and right rewritten to apply after left
+    if not left or not right:
+        return list(left), list(right)
+    if len(left) == 1 and len(right) == 1:
+        return (
+            transform(left[0], right[0], left_first),
+            transform(right[0], left[0], not left_first),
+        )
+    if len(left) > 1:
+        head, right = transform_lists(left[:1], right, left_first)
+        tail, right = transform_lists(left[1:], right, left_first)
+        return head + tail, right
+    left, head = transform_lists(left, right[:1], left_first)
+    left, tail = transform_lists(left, right[1:], left_first)
+    return left, head + tail
+
+
+class RevisionLog:
+    # server side: every submitted operation gets the next revision and the
+    # last `window` of them are kept to rebase operations made against an
+    # older revision
+    def __init__(self, revision: int = 0, window: int = 1024, entries=(), clients=None):
+        self.revision = revision
+        self.entries = deque(entries, maxlen=window)
+        # per client: the revision after its last operation and what others
+        # did since the client's base, already moved past the client's own
+        # operations still in flight
+        self.clients = clients if clients is not None else {}
+
+    def oldest(self) -> int:
+        return self.revision - len(self.entries)
+
+    def submit(self, operation, client=None, base=None):
+        # returns the new revision and the operations to apply, or None when
+        # the client is further behind than the log reaches
+        if base is None or client is None:
+            return self.record([operation]), [operation]
+        start, unseen = self.clients.get(client, (base, []))
+        if not self.oldest() <= start <= self.revision or base > self.revision:
+            self.clients.pop(client, None)
+            return None
+        skip = len(self.entries) - (self.revision - start)
+        for revision, sender, ops in islice(self.entries, skip, None):
+            if sender != client:
+                unseen = unseen + [(revision, ops)]
+        unseen = [(revision, ops) for revision, ops in unseen if revision > base]
+        operations = [operation]
+        for index, (revision, ops) in enumerate(unseen):
+            operations, ops = transform_lists(operations, ops, False)
+            unseen[index] = (revision, ops)
+        revision = self.record(operations, client)
+        self.clients[client] = (revision, unseen)
+        return revision, operations
+
+    def record(self, operations, client=None) -> int:
+        self.revision += 1
+        self.entries.append((self.revision, client, operations))
+        return self.revision
+
+    def withdraw(self, client, previous):
+        # takes back the last submission, which could not be applied;
+        # `previous` is what the log held for the client before it
+        self.entries.pop()
+        self.revision -= 1
+        if previous is None:
+            self.clients.pop(client, None)
+        else:
+            self.clients[client] = previous
+
+    def forget(self, client):
+        self.clients.pop(client, None)
+
+    def state(self) -> dict:
+        return {
+            "revision": self.revision,
+            "entries": [list(entry) for entry in self.entries],
+            "clients": {
+                client: [start, [list(pair) for pair in unseen]]
+                for client, (start, unseen) in self.clients.items()
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, window: int = 1024):
+        return cls(
+            state["revision"],
+            window,
+            (tuple(entry) for entry in state["entries"]),
+            {
+                client: (start, [tuple(pair) for pair in unseen])
+                for client, (start, unseen) in state["clients"].items()
+            },
+        )
+
+
+class PendingOperations:
+    # client side: operations not acknowledged yet, kept rebased on top of
+    # everything received from the server since. Each local edit gets a
+    # sequence number and at most `window` are in flight; the rest wait here,
+    # already applied locally, and go out as acks come back
+    def __init__(self, revision: int = 0, window: int = None):
+        self.revision = revision
+        self.window = window
+        self.seq = 0
+        # [seq, operations, sent, base revision]; once sent, an entry holds
+        # what became of one message, as each message is acked on its own
+        self.pending: list[list] = []
+
+    def in_flight(self) -> int:
+        return len({entry[0] for entry in self.pending if entry[2]})
+
+    def submit(self, operation) -> list[dict]:
+        # returns the operations that can be sent now, tagged with their
+        # base revision and sequence number
+        if operation["op_type"] not in POSITIONAL + CRDT_OPERATIONS:
+            return [operation]
+        self.seq += 1
+        # CRDT operations keep the revision they were made at: their ids
+        # refer to what the replica held then
+        base = self.revision if operation["op_type"] in CRDT_OPERATIONS else None
+        self.pending.append([self.seq, [dict(operation)], False, base])
+        return self.release()
+
+    def release(self) -> list[dict]:
+        ready = []
+        in_flight = self.in_flight()
+        index = 0
+        while index < len(self.pending):
+            seq, operations, sent, base = self.pending[index]
+            if sent:
+                index += 1
+                continue
+            if self.window is not None and in_flight >= self.window:
+                break
+            # remote operations may have split the edit, or cancelled it out
+            base = self.revision if base is None else base
+            self.pending[index : index + 1] = [
+                [seq, [operation], True, base] for operation in operations
+            ]
+            index += len(operations)
+            in_flight += bool(operations)
+            ready.extend(
+                dict(operation, revision=base, seq=seq) for operation in operations
+            )
+        return ready
+
+    def ack(self, revision: int, seq: int = None) -> list[dict]:
+        # returns what the freed window lets out
+        self.revision = revision
+        for index, entry in enumerate(self.pending):
+            if not entry[2]:
+                break
+            if seq is None or entry[0] == seq:
+                del self.pending[index]
+                break
+        return self.release()
+
+    def receive(self, operation, revision: int) -> list[dict]:
+        operations = [operation]
+        for entry in self.pending:
+            operations, entry[1] = transform_lists(operations, entry[1], True)
+        self.revision = revision
+        return operations
+
+    def reset(self, revision: int):
+        self.pending = []
+        self.revision = revision
@@ -1,19 +1,338 @@
 import json
 
+COMMANDS = [
+    "PING",
+    "LOGIN",
+    "GET_FILES",
+    "GRANT_ACCESS",
+    "REMOVE_ACCESS",
+    "OPEN_FILE",
+    "CLOSE_FILE",
+    "CREATE_FILE",
+    "DELETE_FILE",
+    "EDIT_FILE",
+    "SAVE_CONTENT",
+    "GET_HISTORY",
+    "DELETE_HISTORY",
+    "GET_REGISTERED_USERS",
+    "ERROR",
+    "EDIT_BATCH",
+    "GET_STATS",
+    "SYNC_INDEX",
+    "GET_LINES",
+]
+OP_TYPES = [
+    "insert",
+    "delete",
+    "new line",
+    "cancel_changes",
+    "insert_text",
+    "resync",
+    "crdt_insert",
+    "crdt_delete",
+    "crdt_gc",
+]
+
+FILENAME, USER_ID, OP_TYPE, START_POS, END_POS, TEXT, EXTRAS, OPERATION = (
+    1 << i for i in range(8)
+)
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message)
+
+    def decode(self, frame) -> dict:
+        return json.loads(frame)
+
+
+class BinaryCodec:
+    # Frame layout: one opcode byte (index in COMMANDS + 1, 0 for commands
+    # outside the table and whole-message JSON), a varint request id (id + 1,
+    # 0 when the message has none), then the payload. EDIT_FILE payloads are
+    # packed as a flags byte, varint positions and length-prefixed UTF-8
+    # strings; fields that do not fit the packed layout travel in a JSON
+    # "extras" blob so the round trip is lossless. Other commands carry
+    # their data as compact JSON.
+    name = "binary"
+
+    def encode(self, message: dict) -> bytes:
+        command = message["command"]
+        data = message.get("data") or {}
+        request_id = message.get("id")
+        if (
+            command not in COMMANDS
+            or set(message) - {"command", "data", "id"}
+            or not (request_id is None or (type(request_id) is int and request_id >= 0))
+        ):
+            return b"\x00" + _compact_json(message)
+
+        header = bytearray([COMMANDS.index(command) + 1])
+        _write_nullable_int(header, request_id)
+        if command == "EDIT_FILE":
+            return bytes(header) + self._encode_edit(data)
+        if command == "EDIT_BATCH":
+            return bytes(header) + self._encode_batch(data)
+        return bytes(header) + _compact_json(data)
+
+    def decode(self, frame: bytes) -> dict:
+        if frame[0] == 0:
+            return json.loads(frame[1:])
+        command = COMMANDS[frame[0] - 1]
+        request_id, offset = _read_nullable_int(frame, 1)
+        if command == "EDIT_FILE":
+            message = {"command": command, "data": self._decode_edit(frame, offset)}
+        elif command == "EDIT_BATCH":
+            message = {"command": command, "data": self._decode_batch(frame, offset)}
+        else:
+            payload = frame[offset:]
+            message = {
+                "command": command,
+                "data": json.loads(payload) if payload else {},
+            }
+        if request_id is not None:
+            message["id"] = request_id
+        return message
+
+    def _encode_edit(self, data: dict) -> bytes:
+        data = dict(data)
+        has_operation = "operation" in data
+        operation = data.pop("operation", None)
+        flags = 0
+        out = bytearray()
+
+        if isinstance(data.get("filename"), str):
+            flags |= FILENAME
+            _write_str(out, data.pop("filename"))
+        if "user_id" in data and (
+            data["user_id"] is None or isinstance(data["user_id"], str)
+        ):
+            flags |= USER_ID
+            _write_nullable_str(out, data.pop("user_id"))
+
+        if isinstance(operation, dict):
+            flags |= OPERATION
+            operation = dict(operation)
+            if operation.get("op_type") in OP_TYPES:
+                flags |= OP_TYPE
+                out.append(OP_TYPES.index(operation.pop("op_type")))
+            if _is_position(operation.get("start_pos"), nullable=False):
+                flags |= START_POS
+                position = operation.pop("start_pos")
+                _write_varint(out, position["y"])
+                _write_varint(out, position["x"])
+            if _is_position(operation.get("end_pos"), nullable=True):
+                flags |= END_POS
+                position = operation.pop("end_pos")
+                _write_nullable_int(out, position["y"])
+                _write_nullable_int(out, position["x"])
+            if "text" in operation and _is_text(operation["text"]):
+                flags |= TEXT
+                text = operation.pop("text")
+                if text is None:
+                    _write_varint(out, 0)
+                else:
+                    _write_varint(out, len(text) + 1)
+                    for line in text:
+                        _write_str(out, line)
+
+        extras = {}
+        if data:
+            extras["d"] = data
+        if isinstance(operation, dict) and operation:
+            extras["o"] = operation
+        elif has_operation and not isinstance(operation, dict):
+            extras["o!"] = operation
+        if extras:
+            flags |= EXTRAS
+            out += _compact_json(extras)
+        return bytes([flags]) + bytes(out)
+
+    def _encode_batch(self, data: dict) -> bytes:
+        # marker byte 1: varint count, length-prefixed packed EDIT_FILE
+        # payloads, then the remaining fields as JSON; marker 0: plain JSON
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not all(
+            isinstance(entry, dict) for entry in operations
+        ):
+            return b"\x00" + _compact_json(data)
+        out = bytearray(b"\x01")
+        _write_varint(out, len(operations))
+        for entry in operations:
+            packed = self._encode_edit(entry)
+            _write_varint(out, len(packed))
+            out += packed
+        out += _compact_json({k: v for k, v in data.items() if k != "operations"})
+        return bytes(out)
+
+    def _decode_batch(self, frame: bytes, offset: int) -> dict:
+        if frame[offset] == 0:
+            return json.loads(frame[offset + 1 :])
+        count, offset = _read_varint(frame, offset + 1)
+        operations = []
+        for _ in range(count):
+            length, offset = _read_varint(frame, offset)
+            operations.append(self._decode_edit(frame[offset : offset + length], 0))
+            offset += length
+        data = json.loads(frame[offset:])
+        data["operations"] = operations
+        return data
+
+    def _decode_edit(self, frame: bytes, offset: int) -> dict:
+        flags = frame[offset]
+        offset += 1
+        data = {}
+        operation = {}
+
+        if flags & FILENAME:
+            data["filename"], offset = _read_str(frame, offset)
+        if flags & USER_ID:
+            data["user_id"], offset = _read_nullable_str(frame, offset)
+        if flags & OP_TYPE:
+            operation["op_type"] = OP_TYPES[frame[offset]]
+            offset += 1
+        if flags & START_POS:
+            y, offset = _read_varint(frame, offset)
+            x, offset = _read_varint(frame, offset)
+            operation["start_pos"] = {"y": y, "x": x}
+        if flags & END_POS:
+            y, offset = _read_nullable_int(frame, offset)
+            x, offset = _read_nullable_int(frame, offset)
+            operation["end_pos"] = {"y": y, "x": x}
+        if flags & TEXT:
+            count, offset = _read_varint(frame, offset)
+            if count == 0:
+                operation["text"] = None
+            else:
+                text = []
+                for _ in range(count - 1):
+                    line, offset = _read_str(frame, offset)
+                    text.append(line)
+                operation["text"] = text
+        if flags & EXTRAS:
+            extras = json.loads(frame[offset:])
+            data.update(extras.get("d", {}))
+            operation.update(extras.get("o", {}))
+            if "o!" in extras:
+                data["operation"] = extras["o!"]
+
+        if flags & OPERATION:
+            data["operation"] = operation
+        return data
+
+
+def _compact_json(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _is_position(position, nullable: bool) -> bool:
+    if not isinstance(position, dict) or set(position) != {"y", "x"}:
+        return False
+    return all(
+        (nullable and value is None) or (type(value) is int and value >= 0)
+        for value in position.values()
+    )
+
+
+def _is_text(text) -> bool:
+    return text is None or (
+        isinstance(text, list) and all(isinstance(line, str) for line in text)
+    )
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(frame: bytes, offset: int):
+    value = shift = 0
+    while True:
+        byte = frame[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _write_nullable_int(out: bytearray, value):
+    _write_varint(out, 0 if value is None else value + 1)
+
+
+def _read_nullable_int(frame: bytes, offset: int):
+    value, offset = _read_varint(frame, offset)
+    return (None if value == 0 else value - 1), offset
+
+
+def _write_str(out: bytearray, value: str):
+    encoded = value.encode()
+    _write_varint(out, len(encoded))
+    out += encoded
+
+
+def _read_str(frame: bytes, offset: int):
+    length, offset = _read_varint(frame, offset)
+    return frame[offset : offset + length].decode(), offset + length
+
+
+def _write_nullable_str(out: bytearray, value):
+    if value is None:
+        _write_varint(out, 0)
+        return
+    encoded = value.encode()
+    _write_varint(out, len(encoded) + 1)
+    out += encoded
+
+
+def _read_nullable_str(frame: bytes, offset: int):
+    length, offset = _read_varint(frame, offset)
+    if length == 0:
+        return None, offset
+    return frame[offset : offset + length - 1].decode(), offset + length - 1
+
 
 class Protocol:
+    codecs = {"json": JsonCodec(), "binary": BinaryCodec()}
+    preferred_codecs = ["binary", "json"]
+
     @staticmethod
     def create_message(command, data=None):
         return json.dumps({"command": command, "data": data or {}})
 
     @staticmethod
     def parse_request(message):
-        return json.loads(message)
+        return Protocol.decode(message)
 
     @staticmethod
     def parse_response(message):
-        return json.loads(message)
+        return Protocol.decode(message)
 
     @staticmethod
     def create_response(command, data):
         return {"command": command, "data": data}
+
+    @staticmethod
+    def register_codec(codec):
+        Protocol.codecs[codec.name] = codec
+
+    @staticmethod
+    def negotiate(offered):
+        for name in offered or []:
+            if name in Protocol.codecs:
+                return name
+        return "json"
+
+    @staticmethod
+    def encode(message: dict, codec: str = "json"):
+        return Protocol.codecs[codec].encode(message)
+
+    @staticmethod
+    def decode(frame):
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            return Protocol.codecs["binary"].decode(bytes(frame))
+        return Protocol.codecs["json"].decode(frame)
@@ -0,0 +1,93 @@
+import argparse
+import json
+import time
+
+from Shared.protocol import Protocol
+
+
+def sample_messages():
+    return [
+        Protocol.create_response(
+            "EDIT_FILE",
+            {
+                "filename": "notes.txt",
+                "operation": {
+                    "op_type": "insert",
+                    "start_pos": {"y": 120, "x": 14},
+                    "length": 1,
+                    "text": ["a"],
+                    "end_pos": {"y": 120, "x": 15},
+                    "user_id": "5f0c2a",
+                },
+                "user_id": "5f0c2a",
+            },
+        ),
+        Protocol.create_response(
+            "EDIT_FILE",
+            {
+                "filename": "notes.txt",
+                "operation": {
+                    "op_type": "delete",
+                    "start_pos": {"y": 120, "x": 14},
+                    "end_pos": {"y": 120, "x": 15},
+                    "text": None,
+                },
+                "user_id": "5f0c2a",
+            },
+        ),
+        Protocol.create_response(
+            "EDIT_FILE",
+            {
+                "filename": "notes.txt",
+                "operation": {"op_type": "new line", "start_pos": {"y": 121, "x": 0}},
+                "user_id": "5f0c2a",
+            },
+        ),
+    ]
+
+
+def bench(codec: str, messages: list, iterations: int) -> dict:
+    frames = [Protocol.encode(message, codec) for message in messages]
+    total_ops = iterations * len(messages)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            Protocol.encode(message, codec)
+    encode_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for frame in frames:
+            Protocol.decode(frame)
+    decode_time = time.perf_counter() - started
+
+    return {
+        "codec": codec,
+        "bytes_per_op": sum(len(frame) for frame in frames) / len(frames),
+        "encode_us_per_op": encode_time / total_ops * 1e6,
+        "decode_us_per_op": decode_time / total_ops * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wire codec micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    messages = sample_messages()
+    results = [bench(codec, messages, args.iterations) for codec in Protocol.codecs]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'codec':<8} {'bytes/op':>10} {'encode us/op':>14} {'decode us/op':>14}")
+    for result in results:
+        print(
+            f"{result['codec']:<8} {result['bytes_per_op']:>10.1f} "
+            f"{result['encode_us_per_op']:>14.2f} {result['decode_us_per_op']:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import Editor.editor as editor_module
+import Editor.renderer as renderer_module
+from Editor.editor import Editor
+from Server.session_manager import SessionManager
+from Shared.protocol import Protocol
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "bench_document.json")
+WORDS = "the quick brown fox jumps over lazy dog lorem ipsum dolor sit amet".split()
+
+
+def synthetic_lines(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(0, 12))) for _ in range(count)]
+
+
+def position(rng, lines_count: int, margin: int = 0):
+    return rng.randrange(max(1, lines_count - margin)), rng.randint(0, 8)
+
+
+class NullScreen:
+    def clear(self):
+        pass
+
+    def erase(self):
+        pass
+
+    def clrtoeol(self):
+        pass
+
+    def insdelln(self, count):
+        pass
+
+    def addstr(self, y, x, text):
+        pass
+
+    def move(self, y, x):
+        pass
+
+    def noutrefresh(self):
+        pass
+
+
+class ScriptedSocket:
+    # feeds pre-encoded frames to listen_for_update, then ends its loop
+    def __init__(self, frames):
+        self.frames = iter(frames)
+
+    async def recv(self):
+        try:
+            return next(self.frames)
+        except StopIteration:
+            raise asyncio.CancelledError
+
+    async def send(self, frame):
+        pass
+
+
+class ServerCase:
+    filename = "bench.txt"
+
+    def __init__(self, lines, seed):
+        self.manager = SessionManager()
+        self.manager.open_files[self.filename] = self.manager.document_class(lines)
+        self.history = {self.filename: []}
+        self.rng = random.Random(seed)
+        self.lines = len(lines)
+
+    def apply(self, operation):
+        return self.manager.apply_operation(
+            self.filename, "bench", operation, self.history
+        )
+
+
+def server_typing(lines, seed):
+    case = ServerCase(lines, seed)
+
+    def run():
+        y, x = position(case.rng, case.lines)
+        case.apply({"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": ["a"]})
+
+    return run
+
+
+def server_paste(lines, seed):
+    case = ServerCase(lines, seed)
+    text = synthetic_lines(20, seed)
+
+    def run():
+        y, x = position(case.rng, case.lines)
+        case.apply({"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": text})
+
+    return run
+
+
+def server_range_delete(lines, seed):
+    case = ServerCase(lines + [""] * 8, seed)
+    document = case.manager.open_files[case.filename]
+
+    def run():
+        # every delete joins three lines; top the document back up untimed
+        if document.line_count() < case.lines // 2 + 8:
+            document.insert(0, 0, [""] * (case.lines - document.line_count() + 1))
+            return False
+        y, x = position(case.rng, document.line_count(), margin=8)
+        case.apply(
+            {
+                "op_type": "delete",
+                "start_pos": {"y": y, "x": x},
+                "end_pos": {"y": y + 3, "x": 2},
+            }
+        )
+
+    return run
+
+
+def server_undo(lines, seed):
+    case = ServerCase(lines, seed)
+    undo = {"op_type": "cancel_changes", "start_pos": {"y": 0, "x": 0}}
+
+    def run():
+        # undo needs something to cancel; only the cancel itself is timed
+        if not case.history[case.filename]:
+            for _ in range(256):
+                y, x = position(case.rng, case.lines)
+                case.apply(
+                    {"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": ["ab"]}
+                )
+            return False
+        case.apply(dict(undo))
+
+    return run
+
+
+def client_listen_for_update(lines, seed):
+    editor = Editor(None, "bench")
+    content = list(lines)
+    rng = random.Random(seed)
+    screen = NullScreen()
+    # no terminal to flush to when running headless
+    renderer_module.curses = SimpleNamespace(doupdate=lambda: None)
+
+    def run():
+        y, x = position(rng, len(content))
+        frame = Protocol.encode(
+            Protocol.create_response(
+                "EDIT_FILE",
+                {
+                    "filename": "bench.txt",
+                    "operation": {
+                        "op_type": "insert",
+                        "start_pos": {"y": y, "x": min(x, len(content[y]))},
+                        "text": ["a"],
+                    },
+                    "user_id": "peer",
+                },
+            )
+        )
+        asyncio.run(editor.listen_for_update(ScriptedSocket([frame]), screen, content))
+
+    return run
+
+
+def client_delete_piece(lines, seed):
+    content = list(lines) + [""] * 8
+    rng = random.Random(seed)
+
+    def run():
+        if len(content) < len(lines) // 2 + 8:
+            content.extend(lines[: len(lines) - len(content) + 8])
+            return False
+        y, _ = position(rng, len(content), margin=8)
+        if rng.random() < 0.5:
+            Editor.delete_piece(content, y, 0, y, min(3, len(content[y])))
+        else:
+            Editor.delete_piece(content, y, 0, y + 1, 0)
+
+    return run
+
+
+def client_insert_text(lines, seed):
+    content = list(lines)
+    rng = random.Random(seed)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    editor = Editor(loop, "bench")
+    paste = "\n".join(synthetic_lines(5, seed))
+    websocket = ScriptedSocket([])
+    # no clipboard when running headless
+    editor_module.pyperclip = SimpleNamespace(paste=lambda: paste)
+
+    def run():
+        y, _ = position(rng, len(content))
+        editor.insert_text(websocket, "bench.txt", content, y, 0, loop)
+
+    return run
+
+
+CASES = {
+    "server_typing": server_typing,
+    "server_paste": server_paste,
+    "server_range_delete": server_range_delete,
+    "server_undo": server_undo,
+    "client_listen_for_update": client_listen_for_update,
+    "client_delete_piece": client_delete_piece,
+    "client_insert_text": client_insert_text,
+}
+
+
+def measure(run, min_time: float, max_ops: int):
+    timed = 0.0
+    ops = 0
+    while ops < max_ops and (timed < min_time or ops == 0):
+        started = time.perf_counter()
+        counted = run()
+        elapsed = time.perf_counter() - started
+        if counted is not False:
+            timed += elapsed
+            ops += 1
+    return timed, ops
+
+
+def allocations(run, ops: int):
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        done = 0
+        while done < ops:
+            if run() is not False:
+                done += 1
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (after - before) / ops, peak - before
+
+
+def bench(name: str, size: int, lines: list[str], args) -> dict:
+    run = CASES[name](lines, args.seed)
+    timed, ops = measure(run, args.min_time, args.max_ops)
+    retained, peak = allocations(run, max(1, min(ops, args.alloc_ops)))
+    return {
+        "case": name,
+        "lines": size,
+        "ops": ops,
+        "us_per_op": round(timed / ops * 1e6, 3),
+        "retained_bytes_per_op": round(retained, 1),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold: float):
+    previous = {(entry["case"], entry["lines"]): entry for entry in baseline}
+    regressions = []
+    for result in results:
+        entry = previous.get((result["case"], result["lines"]))
+        if entry is None:
+            continue
+        change = result["us_per_op"] / entry["us_per_op"] - 1
+        result["baseline_us_per_op"] = entry["us_per_op"]
+        result["change"] = round(change, 3)
+        if change > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document operation micro-benchmarks")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=CASES)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per case")
+    parser.add_argument("--max-ops", type=int, default=20000)
+    parser.add_argument("--alloc-ops", type=int, default=200)
+    parser.add_argument(
+        "--baseline", nargs="?", const=BASELINE, help="compare against this JSON"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="slowdown flagged as regression"
+    )
+    parser.add_argument("--save", nargs="?", const=BASELINE, help="write results here")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        lines = synthetic_lines(size, args.seed)
+        for name in args.cases:
+            results.append(bench(name, size, lines, args))
+            if not args.json:
+                result = results[-1]
+                print(
+                    f"{result['case']:<26} {size:>9} lines {result['us_per_op']:>12.2f}"
+                    f" us/op {result['retained_bytes_per_op']:>10.1f} B/op retained"
+                    f" {result['peak_kib']:>9.1f} KiB peak"
+                )
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    for result in regressions:
+        print(
+            f"REGRESSION {result['case']} at {result['lines']} lines: "
+            f"{result['us_per_op']} us/op vs {result['baseline_us_per_op']} "
+            f"({result['change']:+.0%})"
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import websockets
+
+from Server.router import start_workers, wait_for_workers
+from Server.session_manager import SessionManager
+from Shared.document import ListDocument
+from Shared.protocol import Protocol
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+OP_MIX = (("insert", 0.8), ("delete", 0.1), ("new line", 0.1))
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Tracker:
+    # every insert carries a unique token; receivers look up when it was sent
+    def __init__(self):
+        self.sent = {}
+        self.latencies = []
+        self.expected = 0
+        self.received = 0
+        self.done = asyncio.Event()
+        self.finished = False
+
+    def send(self, token: str, receivers: int):
+        if receivers:
+            self.sent[token] = [time.perf_counter(), receivers]
+            self.expected += receivers
+
+    def receive(self, token: str):
+        entry = self.sent.get(token)
+        if entry is None:
+            return
+        self.latencies.append(time.perf_counter() - entry[0])
+        self.received += 1
+        entry[1] -= 1
+        if not entry[1]:
+            del self.sent[token]
+        if self.finished and self.received >= self.expected:
+            self.done.set()
+
+
+class SimulatedClient:
+    def __init__(self, index, filename, host, members, codec, args, tracker):
+        self.index = index
+        self.filename = filename
+        self.host = host
+        self.members = members
+        self.requested_codec = codec
+        # LOGIN always goes out as JSON, the server answers with the codec
+        self.codec = "json"
+        self.args = args
+        self.tracker = tracker
+        self.random = random.Random(args.seed * 100003 + index)
+        self.document = ListDocument([""])
+        self.sent = 0
+        self.websocket = None
+        self.reader = None
+
+    async def request(self, command, data):
+        await self.send(command, data)
+        while True:
+            message = Protocol.parse_response(await self.websocket.recv())
+            if message["command"] in (command, "ERROR"):
+                return message
+
+    async def send(self, command, data):
+        frame = Protocol.encode(Protocol.create_response(command, data), self.codec)
+        await self.websocket.send(frame)
+
+    async def connect(self, uri):
+        self.websocket = await websockets.connect(uri, max_queue=None)
+        login = await self.request(
+            "LOGIN", {"username": self.host, "codecs": [self.requested_codec]}
+        )
+        self.codec = login["data"].get("codec", "json")
+
+    async def open(self):
+        response = await self.request(
+            "OPEN_FILE",
+            {"filename": self.filename, "user_id": self.host, "host_id": self.host},
+        )
+        self.document = ListDocument(list(response["data"].get("content") or [""]))
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        try:
+            async for frame in self.websocket:
+                message = Protocol.parse_response(frame)
+                if message.get("command") == "EDIT_BATCH":
+                    for entry in message["data"]["operations"]:
+                        self.apply_remote(entry["operation"])
+                elif message.get("command") == "EDIT_FILE":
+                    self.apply_remote(message["data"]["operation"])
+        except websockets.ConnectionClosed:
+            pass
+
+    def apply_remote(self, operation):
+        if operation["op_type"] == "resync":
+            self.document = ListDocument(list(operation["text"]))
+            return
+        if operation["op_type"] == "insert":
+            self.tracker.receive(operation["text"][0])
+        if operation["op_type"] in ("insert", "delete", "new line"):
+            SessionManager.apply_to_document(self.document, dict(operation))
+
+    def next_operation(self):
+        op_type = self.random.choices(
+            [name for name, _ in OP_MIX], [weight for _, weight in OP_MIX]
+        )[0]
+        y = self.random.randrange(len(self.document))
+        line = self.document.line_at(y)
+        x = self.random.randint(0, len(line))
+        if op_type == "delete" and line:
+            x = self.random.randrange(len(line))
+            end = min(len(line), x + self.random.randint(1, 5))
+            return {
+                "op_type": "delete",
+                "start_pos": {"y": y, "x": x},
+                "end_pos": {"y": y, "x": end},
+            }
+        if op_type == "new line":
+            return {"op_type": "new line", "start_pos": {"y": y, "x": x}}
+        token = f"<{self.index:x}.{self.sent:x}>"
+        return {"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": [token]}
+
+    async def type(self):
+        while self.sent < self.args.ops:
+            for _ in range(min(self.args.burst, self.args.ops - self.sent)):
+                operation = self.next_operation()
+                if operation["op_type"] == "insert":
+                    self.tracker.send(operation["text"][0], self.members - 1)
+                SessionManager.apply_to_document(self.document, dict(operation))
+                await self.send(
+                    "EDIT_FILE", {"filename": self.filename, "operation": operation}
+                )
+                self.sent += 1
+            await asyncio.sleep(self.args.think * self.random.uniform(0.5, 1.5))
+
+    async def close(self):
+        await self.send("CLOSE_FILE", {"filename": self.filename})
+        await self.websocket.close()
+        if self.reader is not None:
+            await self.reader
+
+
+async def run(args):
+    started = time.perf_counter()
+    processes, uris = start_workers(1, args.port, flush_delay=args.flush_delay)
+    tracker = Tracker()
+    try:
+        await wait_for_workers(uris)
+        members = [0] * args.documents
+        for index in range(args.clients):
+            members[index % args.documents] += 1
+        clients = [
+            SimulatedClient(
+                index,
+                f"load_{index % args.documents}.txt",
+                f"host{index % args.documents}",
+                members[index % args.documents],
+                args.codec,
+                args,
+                tracker,
+            )
+            for index in range(args.clients)
+        ]
+        for client in clients:
+            await client.connect(uris[0])
+        for client in clients[: args.documents]:
+            await client.request("CREATE_FILE", {"filename": client.filename})
+        for client in clients:
+            await client.open()
+
+        load_started = time.perf_counter()
+        await asyncio.gather(*(client.type() for client in clients))
+        sent_elapsed = time.perf_counter() - load_started
+        tracker.finished = True
+        if tracker.received < tracker.expected:
+            try:
+                await asyncio.wait_for(tracker.done.wait(), args.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = time.perf_counter() - load_started
+        for client in clients:
+            await client.close()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+    lifetime = time.perf_counter() - started
+
+    ops = sum(client.sent for client in clients)
+    latencies = [latency * 1000 for latency in tracker.latencies]
+    result = {
+        "seed": args.seed,
+        "clients": args.clients,
+        "documents": args.documents,
+        "codec": args.codec,
+        "ops": ops,
+        "seconds": round(elapsed, 3),
+        "ops_per_second": round(ops / sent_elapsed),
+        "broadcasts_expected": tracker.expected,
+        "broadcasts_received": tracker.received,
+        "latency_ms": {
+            name: round(value, 3) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 0.50)),
+                ("p95", percentile(latencies, 0.95)),
+                ("p99", percentile(latencies, 0.99)),
+                ("max", max(latencies, default=None)),
+            )
+        },
+        "server": server_usage(lifetime),
+    }
+    return result
+
+
+def server_usage(lifetime: float) -> dict:
+    # the server ran as our only child process, so RUSAGE_CHILDREN is its usage
+    if resource is None:
+        return {"cpu_seconds": None, "cpu_percent": None, "max_rss_mb": None}
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = usage.ru_utime + usage.ru_stime
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024)
+    return {
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(100 * cpu / lifetime, 1),
+        "max_rss_mb": round(rss, 1),
+    }
+
+
+def compare(result: dict, baseline: dict):
+    rows = [
+        ("ops/s", result["ops_per_second"], baseline["ops_per_second"]),
+        ("p50 ms", result["latency_ms"]["p50"], baseline["latency_ms"]["p50"]),
+        ("p99 ms", result["latency_ms"]["p99"], baseline["latency_ms"]["p99"]),
+        ("cpu s", result["server"]["cpu_seconds"], baseline["server"]["cpu_seconds"]),
+        ("rss MB", result["server"]["max_rss_mb"], baseline["server"]["max_rss_mb"]),
+    ]
+    for name, value, previous in rows:
+        if value is None or not previous:
+            print(f"{name:>8}: {value}")
+            continue
+        change = 100 * (value - previous) / previous
+        print(f"{name:>8}: {value} (baseline {previous}, {change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-client end-to-end load test")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=500, help="ops per client")
+    parser.add_argument("--burst", type=int, default=10, help="ops per typing burst")
+    parser.add_argument(
+        "--think", type=float, default=0.01, help="seconds between bursts"
+    )
+    parser.add_argument("--codec", default="json", choices=sorted(Protocol.codecs))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--flush-delay", type=float, default=1.0)
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=9865)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    parser.add_argument("--compare", help="JSON result of an earlier run")
+    args = parser.parse_args()
+    if args.documents > args.clients:
+        parser.error("--documents cannot exceed --clients")
+
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    # the server keeps its data under ./Server, so run inside a scratch dir
+    with tempfile.TemporaryDirectory(prefix="bench_load_") as scratch:
+        os.chdir(scratch)
+        os.makedirs("./Server/clients_information")
+        os.makedirs("./Server/files_change_history")
+        try:
+            result = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        latency = result["latency_ms"]
+        print(
+            f"{result['clients']} clients on {result['documents']} documents: "
+            f"{result['ops']} ops, {result['ops_per_second']} ops/s, "
+            f"broadcast p50 {latency['p50']} ms / p95 {latency['p95']} ms / "
+            f"p99 {latency['p99']} ms, "
+            f"{result['broadcasts_received']}/{result['broadcasts_expected']} delivered"
+        )
+        server = result["server"]
+        print(
+            f"server: {server['cpu_seconds']} s CPU ({server['cpu_percent']}%), "
+            f"max RSS {server['max_rss_mb']} MB"
+        )
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import tempfile
+import time
+
+import websockets
+
+from Server.router import Router, start_workers, wait_for_workers
+from Shared.protocol import Protocol
+
+
+async def request(websocket, command, data):
+    await websocket.send(Protocol.create_message(command, data))
+    return Protocol.parse_response(await websocket.recv())
+
+
+async def open_document(uri, user, filename, create):
+    websocket = await websockets.connect(uri, max_queue=None)
+    await request(websocket, "LOGIN", {"username": user})
+    if create:
+        await request(websocket, "CREATE_FILE", {"filename": filename})
+    await request(
+        websocket, "OPEN_FILE", {"filename": filename, "user_id": user, "host_id": user}
+    )
+    return websocket
+
+
+async def write(websocket, filename, ops):
+    for i in range(ops):
+        await websocket.send(
+            Protocol.create_message(
+                "EDIT_FILE",
+                {
+                    "filename": filename,
+                    "operation": {
+                        "op_type": "insert",
+                        "start_pos": {"y": 0, "x": i},
+                        "text": ["x"],
+                    },
+                },
+            )
+        )
+
+
+async def read(websocket, ops):
+    received = 0
+    while received < ops:
+        message = Protocol.parse_response(await websocket.recv())
+        if message["command"] == "EDIT_BATCH":
+            received += len(message["data"]["operations"])
+        elif message["command"] == "EDIT_FILE":
+            received += 1
+
+
+async def run(workers, documents, ops, base_port):
+    token = secrets.token_hex(16)
+    processes, uris = start_workers(workers, base_port + 1, control_token=token)
+    router = Router(uris, control_token=token)
+    try:
+        await wait_for_workers(uris)
+        async with websockets.serve(router.handle, "localhost", base_port):
+            uri = f"ws://localhost:{base_port}"
+            pairs = []
+            for d in range(documents):
+                user, filename = f"bench{d}", f"bench{workers}_{d}.txt"
+                writer = await open_document(uri, user, filename, create=True)
+                reader = await open_document(uri, user, filename, create=False)
+                pairs.append((filename, writer, reader))
+
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(write(writer, filename, ops) for filename, writer, _ in pairs),
+                *(read(reader, ops) for _, _, reader in pairs),
+            )
+            elapsed = time.perf_counter() - started
+
+            for _, writer, reader in pairs:
+                await writer.close()
+                await reader.close()
+    finally:
+        await router.close()
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    return {
+        "workers": workers,
+        "documents": documents,
+        "ops": documents * ops,
+        "seconds": round(elapsed, 3),
+        "ops_per_second": round(documents * ops / elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Router throughput vs worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--documents", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=2000, help="ops per document")
+    parser.add_argument("--port", type=int, default=9765)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    cwd = os.getcwd()
+    # the server keeps its data under ./Server, so run inside a scratch dir
+    with tempfile.TemporaryDirectory(prefix="bench_router_") as scratch:
+        os.chdir(scratch)
+        os.makedirs("./Server/clients_information")
+        try:
+            for workers in args.workers:
+                result = asyncio.run(run(workers, args.documents, args.ops, args.port))
+                results.append(result)
+                if not args.json:
+                    print(
+                        f"{result['workers']} workers: {result['ops']} ops in "
+                        f"{result['seconds']}s, {result['ops_per_second']} ops/s"
+                    )
+        finally:
+            os.chdir(cwd)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
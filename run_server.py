@@ -1,17 +1,146 @@
+import argparse
 import asyncio
+import secrets
 import websockets
+from Server.bus import TcpBroker, TcpBus
+from Server.log import get_logger, setup_logging, shutdown_logging
+from Server.router import Router, start_workers, wait_for_workers
 from Server.server import Server
+from Server.tracing import JsonLinesExporter, Tracer
 
+METADATA_DB = "./Server/clients_information/metadata.db"
 
-async def run_server():
-    server = Server()
-    async with websockets.serve(server.echo, "localhost", 8765):
-        print("Server started on ws://localhost:8765")
-        await asyncio.Future()
+logger = get_logger("main")
+
+
+async def run_server(
+    port: int = 8765,
+    bus_address: str = None,
+    broker=False,
+    metrics_port=None,
+    trace_file=None,
+    admin_users=(),
+):
+    bus = broker_server = None
+    oplog_dir = "./Server/files_oplog"
+    if bus_address is not None:
+        host, bus_port = bus_address.rsplit(":", 1)
+        if broker:
+            broker_server = TcpBroker()
+            await broker_server.start(host, int(bus_port))
+        bus = await TcpBus(host, int(bus_port)).connect()
+        # every node replays its own operations after a crash
+        oplog_dir = f"./Server/files_oplog/{port}"
+    tracer = Tracer(JsonLinesExporter(trace_file) if trace_file else None)
+    server = Server(
+        metadata_db=METADATA_DB,
+        oplog_dir=oplog_dir,
+        bus=bus,
+        tracer=tracer,
+        admin_users=admin_users,
+    )
+    if metrics_port is not None:
+        await server.metrics_server.start("localhost", metrics_port)
+        logger.info("metrics on http://localhost:%d/metrics", metrics_port)
+    try:
+        async with websockets.serve(server.echo, "localhost", port):
+            logger.info("server started on ws://localhost:%d", port)
+            await asyncio.Future()
+    finally:
+        await server.actors.stop_all()
+        await server.metrics_server.close()
+        server.shutdown()
+        tracer.close()
+        if bus is not None:
+            await bus.close()
+        if broker_server is not None:
+            await broker_server.close()
+
+
+async def run_router(workers: int, log_level="INFO", admin_users=()):
+    token = secrets.token_hex(16)
+    processes, uris = start_workers(
+        workers,
+        8766,
+        log_level=log_level,
+        metadata_db=METADATA_DB,
+        admin_users=admin_users,
+        control_token=token,
+    )
+    router = Router(uris, control_token=token)
+    try:
+        await wait_for_workers(uris)
+        async with websockets.serve(router.handle, "localhost", 8765):
+            logger.info(
+                "router started on ws://localhost:8765 with %d workers", workers
+            )
+            await asyncio.Future()
+    finally:
+        await router.close()
+        for process in processes:
+            process.terminate()
+            process.join()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="run N document worker processes behind a router",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--bus",
+        metavar="HOST:PORT",
+        help="relay document operations to other nodes through this broker",
+    )
+    parser.add_argument(
+        "--broker",
+        action="store_true",
+        help="also run the broker for --bus in this process",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics on http://localhost:PORT/metrics",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="append request pipeline spans to FILE as JSON lines",
+    )
+    parser.add_argument(
+        "--admin",
+        metavar="USER",
+        action="append",
+        default=[],
+        help="allow USER to query server statistics (repeatable)",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+    )
+    parser.add_argument("--log-file", help="write the log to FILE instead of stderr")
+    args = parser.parse_args()
+    setup_logging(args.log_level, filename=args.log_file)
     try:
-        asyncio.run(run_server())
+        if args.workers > 0:
+            asyncio.run(run_router(args.workers, args.log_level, args.admin))
+        else:
+            asyncio.run(
+                run_server(
+                    args.port,
+                    args.bus,
+                    args.broker,
+                    args.metrics_port,
+                    args.trace,
+                    args.admin,
+                )
+            )
     except KeyboardInterrupt:
-        print("Server stopped.")
+        logger.info("server stopped")
+    finally:
+        shutdown_logging()
@@ -0,0 +1,163 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from Server.bus import LocalBus, TcpBroker, TcpBus
+from Server.server import Server
+from Shared.protocol import Protocol
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_local_bus_delivers_in_publish_order_to_all_subscribers():
+    bus = LocalBus()
+    seen = {"a": [], "b": []}
+
+    async def record(name, message):
+        seen[name].append(message["n"])
+
+    assert await bus.subscribe("doc:x", lambda m: record("a", m)) == 0
+    assert await bus.subscribe("doc:x", lambda m: record("b", m)) == 1
+    for n in range(5):
+        await bus.publish("doc:x", {"n": n})
+    await bus.publish("doc:other", {"n": 99})
+    await settle()
+
+    assert seen == {"a": [0, 1, 2, 3, 4], "b": [0, 1, 2, 3, 4]}
+    await bus.close()
+
+
+@pytest.mark.asyncio
+async def test_tcp_broker_relays_between_buses():
+    broker = TcpBroker()
+    port = await broker.start("localhost", 0)
+    first, second = TcpBus("localhost", port), TcpBus("localhost", port)
+    received = {"first": [], "second": []}
+    done = asyncio.Event()
+
+    async def on_first(message):
+        received["first"].append(message["n"])
+
+    async def on_second(message):
+        received["second"].append(message["n"])
+        if len(received["second"]) == 4:
+            done.set()
+
+    try:
+        assert await first.subscribe("doc:x", on_first) == 0
+        assert await second.subscribe("doc:x", on_second) == 1
+        await first.publish("doc:x", {"n": 0})
+        await second.publish("doc:x", {"n": 1})
+        await first.publish("doc:x", {"n": 2})
+        await second.publish("doc:x", {"n": 3})
+        await asyncio.wait_for(done.wait(), 2)
+        await settle()
+
+        assert received["first"] == received["second"]
+        assert sorted(received["second"]) == [0, 1, 2, 3]
+    finally:
+        await first.close()
+        await second.close()
+        await broker.close()
+
+
+def make_node(tmp_path, bus, name):
+    server = Server(oplog_dir=str(tmp_path / name), bus=bus, node_id=name)
+    server.file_manager = Mock()
+    server.file_manager.open_file.return_value = (True, ["hello"])
+    server.file_manager.load_history.return_value = []
+    server.file_manager.validate_access.return_value = (True, None, None)
+    server.file_manager.save_file.return_value = (True, None)
+    return server
+
+
+def insert(x, text):
+    return {"op_type": "insert", "start_pos": {"y": 0, "x": x}, "text": [text]}
+
+
+@pytest.mark.asyncio
+async def test_clients_on_different_nodes_converge(tmp_path):
+    bus = LocalBus()
+    first, second = make_node(tmp_path, bus, "a"), make_node(tmp_path, bus, "b")
+    alice, bob = AsyncMock(), AsyncMock()
+    first.user_sessions[alice] = "alice"
+    second.user_sessions[bob] = "bob"
+    open_request = {
+        "command": "OPEN_FILE",
+        "data": {"filename": "f.txt", "user_id": "alice", "host_id": "alice"},
+    }
+
+    await first.handle_request(open_request, alice)
+    first.actors.submit("f.txt", alice, "alice", insert(5, "!"))
+    await first.actors.join("f.txt")
+    await second.handle_request(
+        {**open_request, "data": {**open_request["data"], "user_id": "bob"}}, bob
+    )
+
+    opened = Protocol.parse_response(bob.send.call_args[0][0])
+    assert opened["data"]["content"] == ["hello!"]
+    assert opened["data"]["revision"] == 1
+
+    first.actors.submit("f.txt", alice, "alice", insert(0, "A"))
+    second.actors.submit("f.txt", bob, "bob", insert(0, "B"))
+    await first.actors.join("f.txt")
+    await second.actors.join("f.txt")
+    await settle()
+
+    content = first.session_manager.get_content("f.txt").slice()
+    assert content == second.session_manager.get_content("f.txt").slice()
+    assert sorted(content[0][:2]) == ["A", "B"]
+    assert first.session_manager.revision("f.txt") == 3
+    assert second.session_manager.revision("f.txt") == 3
+    pushed = [Protocol.parse_response(c[0][0]) for c in bob.send.call_args_list]
+    assert {
+        "command": "EDIT_FILE",
+        "data": {
+            "operation": insert(0, "A"),
+            "filename": "f.txt",
+            "user_id": "alice",
+            "revision": 2,
+        },
+    } in pushed
+
+    await first.leave_session("f.txt", alice)
+    assert "doc:f.txt" in bus.subscribers
+    await second.leave_session("f.txt", bob)
+    assert "doc:f.txt" not in bus.subscribers
+    await first.actors.stop_all()
+    await second.actors.stop_all()
+    await bus.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_lost_by_the_bus_resyncs_its_sender(tmp_path):
+    bus = LocalBus()
+    server = make_node(tmp_path, bus, "a")
+    server.bus_apply_timeout = 0.05
+    alice = AsyncMock()
+    server.user_sessions[alice] = "alice"
+    await server.handle_request(
+        {
+            "command": "OPEN_FILE",
+            "data": {"filename": "f.txt", "user_id": "alice", "host_id": "alice"},
+        },
+        alice,
+    )
+    # the bus accepts the publish but never delivers it
+    bus.publish = AsyncMock()
+
+    server.actors.submit("f.txt", alice, "alice", insert(5, "!"))
+    await asyncio.wait_for(server.actors.join("f.txt"), 1)
+    await settle()
+
+    assert server.pending_batches == {}
+    assert server.session_manager.get_content("f.txt").slice() == ["hello"]
+    last = Protocol.parse_response(alice.send.call_args[0][0])
+    [resync] = last["data"]["operations"]
+    assert resync["operation"]["op_type"] == "resync"
+    assert resync["operation"]["text"] == ["hello"]
+    await server.actors.stop_all()
+    await bus.close()
@@ -2,11 +2,35 @@ import pytest
 import pytest_asyncio
 import asyncio
 import json
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from Client.client import Client
+from Client.connection import Connection
 from Shared.protocol import Protocol
 
 
+def serve(websocket_mock, responses):
+    # answers each request with the next canned response for its command
+    frames = asyncio.Queue()
+    responses = {command: list(items) for command, items in responses.items()}
+
+    async def send(frame):
+        message = json.loads(frame)
+        if responses.get(message["command"]):
+            response = responses[message["command"]].pop(0)
+            frames.put_nowait(json.dumps({**response, "id": message["id"]}))
+
+    websocket_mock.send.side_effect = send
+    websocket_mock.recv.side_effect = frames.get
+    return Connection(websocket_mock).start()
+
+
+def sent(websocket_mock):
+    return [
+        {key: value for key, value in json.loads(call.args[0]).items() if key != "id"}
+        for call in websocket_mock.send.call_args_list
+    ]
+
+
 @pytest.mark.asyncio
 class TestClient:
     @pytest_asyncio.fixture
@@ -22,24 +46,32 @@ class TestClient:
         websocket_mock = AsyncMock()
         mock_connect.return_value = websocket_mock
 
-        websocket_mock.recv.return_value = json.dumps(
-            Protocol.create_response(
-                "LOGIN", {"status": "success", "user_id": "fake_id"}
-            )
+        connection = serve(
+            websocket_mock,
+            {
+                "LOGIN": [
+                    Protocol.create_response(
+                        "LOGIN", {"status": "success", "user_id": "fake_id"}
+                    )
+                ]
+            },
         )
 
         with patch("aioconsole.ainput", new_callable=AsyncMock) as mock_ainput:
             mock_ainput.return_value = "test_user"
-            await client.login(websocket_mock)
+            await client.login(connection)
 
             assert client.user_id == "fake_id"
             client.console.print.assert_any_call(
                 "test_user logged in successfully with fake_id",
                 style="#00A6A6",
             )
-            websocket_mock.send.assert_any_call(
-                json.dumps(Protocol.create_response("LOGIN", {"username": "test_user"}))
-            )
+            assert sent(websocket_mock) == [
+                Protocol.create_response(
+                    "LOGIN",
+                    {"username": "test_user", "codecs": Protocol.preferred_codecs},
+                )
+            ]
 
     @patch("websockets.connect", new_callable=AsyncMock)
     async def test_login_timeout(self, mock_connect, setup_client):
@@ -47,11 +79,12 @@ class TestClient:
         websocket_mock = AsyncMock()
         mock_connect.return_value = websocket_mock
 
-        websocket_mock.recv.side_effect = asyncio.TimeoutError
+        connection = serve(websocket_mock, {})
+        client.login_timeout = 0.01
 
         with patch("aioconsole.ainput", new_callable=AsyncMock) as mock_ainput:
             mock_ainput.return_value = "test_user"
-            await client.login(websocket_mock)
+            await client.login(connection)
 
             client.console.print.assert_any_call(
                 "Login timed out. Please try again.", style="#F08700"
@@ -64,13 +97,21 @@ class TestClient:
         websocket_mock = AsyncMock()
         mock_connect.return_value = websocket_mock
 
-        websocket_mock.recv.return_value = json.dumps(
-            Protocol.create_response("GET_FILES", {"files": ["file1.txt", "file2.txt"]})
+        connection = serve(
+            websocket_mock,
+            {
+                "GET_FILES": [
+                    Protocol.create_response(
+                        "GET_FILES", {"files": ["file1.txt", "file2.txt"]}
+                    )
+                ]
+            },
         )
 
-        await client.get_files(websocket_mock)
-
-        websocket_mock.send.assert_any_call(Protocol.create_message("GET_FILES"))
+        assert await client.get_files(connection) == ["file1.txt", "file2.txt"]
+        assert sent(websocket_mock) == [
+            json.loads(Protocol.create_message("GET_FILES"))
+        ]
 
     @patch("websockets.connect", new_callable=AsyncMock)
     @patch("InquirerPy.inquirer.select", new_callable=AsyncMock)
@@ -79,13 +120,16 @@ class TestClient:
         websocket_mock = AsyncMock()
         mock_connect.return_value = websocket_mock
 
-        websocket_mock.recv.return_value = json.dumps(
-            Protocol.create_response("GET_FILES", {"files": []})
+        connection = serve(
+            websocket_mock,
+            {"GET_FILES": [Protocol.create_response("GET_FILES", {"files": []})]},
         )
 
-        file_list = await client.get_files(websocket_mock)
+        file_list = await client.get_files(connection)
 
-        websocket_mock.send.assert_called_with(Protocol.create_message("GET_FILES"))
+        assert sent(websocket_mock) == [
+            json.loads(Protocol.create_message("GET_FILES"))
+        ]
         assert file_list is None
         client.console.print.assert_any_call(
             "No files found in the folder.", style="#F08700"
@@ -113,19 +157,26 @@ class TestClient:
         websocket_mock = AsyncMock()
         mock_connect.return_value = websocket_mock
 
-        mock_select.return_value.execute_async = AsyncMock(return_value="proceed")
+        mock_select.return_value.execute_async = AsyncMock(
+            side_effect=["proceed", "crdt"]
+        )
         mock_ainput.return_value = "new_file.txt"
 
-        websocket_mock.recv.return_value = json.dumps(
-            Protocol.create_response("CREATE_FILE", {"status": "success"})
+        connection = serve(
+            websocket_mock,
+            {
+                "CREATE_FILE": [
+                    Protocol.create_response("CREATE_FILE", {"status": "success"})
+                ]
+            },
         )
 
-        await client.create_file(websocket_mock)
+        await client.create_file(connection)
 
         expected_message = Protocol.create_response(
-            "CREATE_FILE", {"filename": "new_file.txt"}
+            "CREATE_FILE", {"filename": "new_file.txt", "mode": "crdt"}
         )
-        websocket_mock.send.assert_any_call(json.dumps(expected_message))
+        assert sent(websocket_mock) == [expected_message]
         client.console.print.assert_any_call(
             "File 'new_file.txt' created successfully.", style="#00A6A6"
         )
@@ -138,27 +189,66 @@ class TestClient:
         mock_connect.return_value = websocket_mock
 
         mock_select.return_value.execute_async = AsyncMock(return_value="test_file.txt")
-        websocket_mock.recv.side_effect = [
-            json.dumps(
-                Protocol.create_response(
-                    "OPEN_FILE", {"status": "success", "content": ["Hello", "World"]}
-                )
-            ),
-            json.dumps(Protocol.create_response("CLOSE_FILE", {})),
-        ]
+        connection = serve(
+            websocket_mock,
+            {
+                "OPEN_FILE": [
+                    Protocol.create_response(
+                        "OPEN_FILE",
+                        {"status": "success", "content": ["Hello", "World"]},
+                    )
+                ]
+            },
+        )
 
-        await client.open_file(websocket_mock, ["test_file.txt"])
+        await client.open_file(connection, ["test_file.txt"])
 
-        websocket_mock.send.assert_any_call(
-            Protocol.create_message(
+        assert sent(websocket_mock) == [
+            Protocol.create_response(
                 "OPEN_FILE",
                 {"filename": "test_file.txt", "user_id": None, "host_id": None},
-            )
-        )
+            ),
+            Protocol.create_response("CLOSE_FILE", {"filename": "test_file.txt"}),
+        ]
         client.console.print.assert_any_call("\nFile content:", style="#61afef")
         client.console.print.assert_any_call("Hello")
         client.console.print.assert_any_call("World")
 
+    @patch("InquirerPy.inquirer.confirm")
+    @patch("InquirerPy.inquirer.select")
+    async def test_get_history_pages(self, mock_select, mock_confirm, setup_client):
+        client = setup_client
+        client.display_history = Mock()
+        websocket_mock = AsyncMock()
+
+        mock_select.return_value.execute_async = AsyncMock(
+            side_effect=["test_file.txt", "all"]
+        )
+        mock_confirm.return_value.execute_async = AsyncMock(return_value=True)
+        entry = {"user_id": "u", "time": "t", "operation": {"op_type": "insert"}}
+        connection = serve(
+            websocket_mock,
+            {
+                "GET_HISTORY": [
+                    Protocol.create_response(
+                        "GET_HISTORY",
+                        {
+                            "status": "success",
+                            "history": [entry],
+                            "cursor": cursor,
+                            "done": True,
+                        },
+                    )
+                    for cursor in (1, None)
+                ]
+            },
+        )
+
+        await client.get_history(connection, ["test_file.txt"])
+
+        assert client.display_history.call_count == 2
+        assert [message["data"]["cursor"] for message in sent(websocket_mock)] == [0, 1]
+
     @patch("websockets.connect", new_callable=AsyncMock)
     @patch("InquirerPy.inquirer.select")
     async def test_delete_file_success(self, mock_select, mock_connect, setup_client):
@@ -168,14 +258,18 @@ class TestClient:
 
         mock_select.return_value.execute_async = AsyncMock(return_value="test_file.txt")
 
-        websocket_mock.recv.side_effect = [
-            json.dumps(Protocol.create_response("DELETE_FILE", {"status": "success"})),
-            json.dumps(Protocol.create_response("DELETE_HISTORY", {})),
-        ]
+        connection = serve(
+            websocket_mock,
+            {
+                "DELETE_FILE": [
+                    Protocol.create_response("DELETE_FILE", {"status": "success"})
+                ]
+            },
+        )
 
-        await client.delete_file(websocket_mock, ["test_file.txt"])
+        await client.delete_file(connection, ["test_file.txt"])
 
-        websocket_mock.send.assert_any_call(
+        assert sent(websocket_mock)[0] == json.loads(
             Protocol.create_message("DELETE_FILE", {"filename": "test_file.txt"})
         )
         client.console.print.assert_any_call(
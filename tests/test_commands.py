@@ -0,0 +1,46 @@
+import pytest
+from Server.commands import CommandRegistry
+
+
+@pytest.mark.asyncio
+async def test_dispatch_records_count_and_percentiles():
+    registry = CommandRegistry(window=100)
+
+    @registry.register("ECHO")
+    async def echo(value):
+        return value
+
+    for i in range(10):
+        assert await registry.dispatch("ECHO", i) == i
+
+    summary = registry.summary()["ECHO"]
+    assert summary["count"] == 10
+    assert summary["errors"] == 0
+    assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_counts_errors():
+    registry = CommandRegistry()
+
+    async def fail():
+        raise ValueError("boom")
+
+    registry.register("FAIL", fail)
+    with pytest.raises(ValueError):
+        await registry.dispatch("FAIL")
+
+    assert registry.summary()["FAIL"]["errors"] == 1
+    registry.unregister("FAIL")
+    assert "FAIL" not in registry
+
+
+def test_percentile_uses_window():
+    registry = CommandRegistry(window=4)
+    registry.register("X", lambda: None)
+    stats = registry.stats["X"]
+    for elapsed in [10.0, 0.001, 0.002, 0.003, 0.004]:
+        stats.record(elapsed, False)
+
+    assert stats.count == 5
+    assert stats.percentile(0.99) == 0.004
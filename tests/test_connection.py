@@ -0,0 +1,116 @@
+import asyncio
+import json
+import pytest
+from Client.connection import Connection, ConnectionClosed
+from Shared.protocol import Protocol
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = asyncio.Queue()
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(json.loads(frame))
+
+    async def recv(self):
+        frame = await self.frames.get()
+        if isinstance(frame, Exception):
+            raise frame
+        return frame
+
+    def reply(self, message, request_id=None):
+        if request_id is not None:
+            message = {**message, "id": request_id}
+        self.frames.put_nowait(json.dumps(message))
+
+
+@pytest.mark.asyncio
+async def test_pipelined_requests_are_routed_by_id():
+    websocket = FakeWebSocket()
+    connection = Connection(websocket).start()
+
+    first = asyncio.create_task(connection.request("GET_FILES"))
+    second = asyncio.create_task(connection.request("GET_REGISTERED_USERS"))
+    await asyncio.sleep(0)
+    ids = [message["id"] for message in websocket.sent]
+    assert len(set(ids)) == 2
+
+    push = Protocol.create_response("EDIT_FILE", {"operation": {"op_type": "insert"}})
+    websocket.reply(
+        Protocol.create_response("GET_REGISTERED_USERS", {"users": []}), ids[1]
+    )
+    websocket.reply(push)
+    websocket.reply(Protocol.create_response("GET_FILES", {"files": ["a.txt"]}), ids[0])
+
+    assert (await first)["data"] == {"files": ["a.txt"]}
+    assert (await second)["data"] == {"users": []}
+    assert Protocol.parse_response(await connection.recv()) == push
+    await connection.stop()
+
+
+@pytest.mark.asyncio
+async def test_stream_and_subscribers():
+    websocket = FakeWebSocket()
+    connection = Connection(websocket).start()
+    received = []
+    connection.subscribe("EDIT_BATCH", received.append)
+
+    async def read_pages():
+        return [page async for page in connection.stream("GET_HISTORY", {})]
+
+    pages = asyncio.create_task(read_pages())
+    await asyncio.sleep(0)
+    request_id = websocket.sent[0]["id"]
+    websocket.reply(
+        Protocol.create_response("GET_HISTORY", {"done": False}), request_id
+    )
+    websocket.reply(Protocol.create_response("EDIT_BATCH", {"operations": []}))
+    websocket.reply(Protocol.create_response("GET_HISTORY", {"done": True}), request_id)
+
+    assert [page["data"]["done"] for page in await pages] == [False, True]
+    assert [message["command"] for message in received] == ["EDIT_BATCH"]
+    assert connection.pending == {}
+    await connection.stop()
+
+
+@pytest.mark.asyncio
+async def test_pending_requests_fail_when_connection_closes():
+    websocket = FakeWebSocket()
+    connection = Connection(websocket).start()
+
+    request = asyncio.create_task(connection.request("GET_FILES"))
+    await asyncio.sleep(0)
+    websocket.frames.put_nowait(ConnectionError("closed"))
+
+    with pytest.raises(ConnectionClosed):
+        await request
+    with pytest.raises(ConnectionClosed):
+        await connection.request("GET_FILES")
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_pushes_until_it_ends():
+    websocket = FakeWebSocket()
+    connection = Connection(websocket).start()
+    stream = connection.stream("OPEN_FILE", {}, clear_pushes=True, hold_pushes=True)
+
+    first = asyncio.create_task(stream.__anext__())
+    await asyncio.sleep(0)
+    request_id = websocket.sent[0]["id"]
+    stale = Protocol.create_response("EDIT_FILE", {"operation": {"op_type": "old"}})
+    push = Protocol.create_response("EDIT_FILE", {"operation": {"op_type": "new"}})
+    websocket.reply(stale)
+    websocket.reply(Protocol.create_response("OPEN_FILE", {"done": False}), request_id)
+    websocket.reply(push)
+    assert (await first)["data"] == {"done": False}
+    await asyncio.sleep(0)
+    assert connection.pushes.empty()
+
+    websocket.reply(Protocol.create_response("OPEN_FILE", {"done": True}), request_id)
+    assert [page async for page in stream] == [
+        {"command": "OPEN_FILE", "data": {"done": True}, "id": request_id}
+    ]
+    assert Protocol.parse_response(await connection.recv()) == push
+    assert connection.pushes.empty() and connection.held is None
+    await connection.stop()
@@ -0,0 +1,137 @@
+import copy
+import random
+import pytest
+from Server.session_manager import SessionManager
+from Shared import crdt
+from Shared.crdt import CrdtDocument
+from Shared.document import ListDocument
+
+
+def replicas(lines, count):
+    state = CrdtDocument(lines).state()
+    return [CrdtDocument.from_state(state, f"site{n}") for n in range(count)]
+
+
+def random_edit(rng, document):
+    lines = document.slice()
+    y = rng.randrange(len(lines))
+    x = rng.randint(0, len(lines[y]))
+    if rng.random() < 0.6:
+        text = [rng.choice("abc") * rng.randint(1, 3) for _ in range(rng.randint(1, 2))]
+        return document.local_insert(y, x, text)
+    end_y = rng.randint(y, len(lines) - 1)
+    end_x = rng.randint(x if end_y == y else 0, len(lines[end_y]))
+    return document.local_delete(y, x, end_y, end_x)
+
+
+def test_local_edits_keep_lines_in_step():
+    document = CrdtDocument(["hello", "world"])
+    document.local_insert(0, 5, [" there", "big"])
+    document.local_delete(1, 0, 1, 3)
+    document.insert(2, 5, ["!"])
+
+    assert document.slice() == ["hello there", "", "world!"]
+    assert CrdtDocument.from_state(document.state()) == document
+
+
+def test_concurrent_inserts_at_the_same_place_converge():
+    first, second = replicas(["ab"], 2)
+    one = first.local_insert(0, 1, ["X"])
+    two = second.local_insert(0, 1, ["Y"])
+    first.apply(copy.deepcopy(two))
+    second.apply(copy.deepcopy(one))
+
+    assert first.slice() == second.slice()
+    assert first.slice() in (["aXYb"], ["aYXb"])
+
+
+@pytest.fixture(params=[2, crdt.BLOCK_SIZE])
+def block_size(request, monkeypatch):
+    monkeypatch.setattr(crdt, "BLOCK_SIZE", request.param)
+    return request.param
+
+
+def test_ops_apply_in_any_order(block_size):
+    rng = random.Random(5)
+    for _ in range(200):
+        sites = replicas(["hello", "world"], 3)
+        operations = []
+        for _ in range(20):
+            index = rng.randrange(len(sites))
+            operation = random_edit(rng, sites[index])
+            if operation is not None:
+                operations.append((index, operation))
+
+        for index, document in enumerate(sites):
+            received = [
+                copy.deepcopy(op) for sender, op in operations if sender != index
+            ]
+            rng.shuffle(received)
+            # the returned line edits bring a plain copy along
+            shadow = ListDocument(document.slice())
+            for operation in received:
+                for edit in document.apply(operation):
+                    SessionManager.apply_to_document(shadow, edit)
+            assert shadow == document
+            assert not document.waiting and not document.orphans
+            assert document.byte_count() == sum(
+                len(line.encode()) + 1 for line in document.slice()
+            )
+
+        assert sites[0] == sites[1] == sites[2]
+
+
+def test_delete_before_its_insert_arrives():
+    first, second = replicas([""], 2)
+    insert = first.local_insert(0, 0, ["abc"])
+    second.apply(copy.deepcopy(insert))
+    delete = second.local_delete(0, 1, 0, 2)
+
+    third = replicas([""], 1)[0]
+    assert third.apply(copy.deepcopy(delete)) == []
+    third.apply(copy.deepcopy(insert))
+    assert third.slice() == ["ac"]
+
+
+def test_typing_and_collection_keep_runs_compact():
+    document, peer = replicas(["start"], 2)
+    for x in range(5, 105):
+        peer.apply(document.local_insert(0, x, ["a"]))
+    assert len(document.runs) == 2
+
+    peer.apply(document.local_delete(0, 2, 0, 50, revision=3))
+    peer.apply(document.local_delete(0, 10, 0, 20, revision=7))
+    assert document.tombstones == 58
+    operation = document.collect(stable=5)
+    assert document.tombstones == 10
+    peer.apply(operation)
+
+    assert peer == document
+    assert peer.tombstones == 10
+    document.collect()
+    assert len(document.runs) <= 3
+    assert document.slice() == peer.slice()
+
+
+def test_split_runs_merge_back():
+    document = CrdtDocument(["hello"])
+    document.local_delete(0, 1, 0, 3, revision=3)
+    assert len(document.runs) == 3
+    # the next delete splits "lo"; its "l" continues the deleted "el"
+    document.local_delete(0, 1, 0, 2, revision=3)
+    assert [run.text for run in document.runs] == ["h", "ell", "o"]
+    assert document.slice() == ["ho"]
+    assert document._find(crdt.ROOT, 4) == (document.runs[1], 2)
+
+
+def test_long_documents_keep_runs_in_blocks(block_size):
+    document, peer = replicas([f"line {i}" for i in range(200)], 2)
+    rng = random.Random(3)
+    for _ in range(300):
+        operation = random_edit(rng, document)
+        if operation is not None:
+            peer.apply(operation)
+    assert peer == document
+    assert all(len(block.runs) <= 2 * block_size for block in document.blocks)
+    assert document.runs == [run for block in document.blocks for run in block.runs]
+    assert CrdtDocument.from_state(document.state()) == document
@@ -1,5 +1,6 @@
 import pytest
 from Editor.cursor_mover import CursorMover
+from Editor.viewport import Viewport
 
 
 @pytest.fixture
@@ -63,5 +64,20 @@ def test_down(cursor_mover, cursor_x, cursor_y, text, expected):
     assert result == expected
 
 
+def test_pages_move_the_viewport_with_the_cursor():
+    viewport = Viewport(height=10, width=20, top=5)
+    mover = CursorMover(viewport)
+    text = ["line"] * 25 + ["end"]
+
+    assert mover.page_down(4, 7, text) == (4, 17)
+    assert viewport.top == 15
+    assert mover.page_down(4, 17, text) == (3, 25)
+    assert mover.page_up(3, 25, text) == (3, 15)
+    assert viewport.top == 13
+    assert mover.page_up(3, 15, text) == (3, 5)
+    assert mover.page_up(3, 5, text) == (3, 0)
+    assert viewport.top == 0
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,102 @@
+import random
+import pytest
+from Shared import document as document_module
+from Shared.document import ListDocument, RopeDocument
+
+
+@pytest.fixture(params=[ListDocument, RopeDocument])
+def document_class(request):
+    return request.param
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(document_module, "CHUNK_SIZE", 4)
+
+
+def test_line_access(document_class):
+    document = document_class(["one", "two", "three"])
+    assert document.line_count() == 3
+    assert len(document) == 3
+    assert document.line_at(1) == "two"
+    assert document.slice(1) == ["two", "three"]
+    assert document.slice(0, 2) == ["one", "two"]
+    assert document == ["one", "two", "three"]
+
+
+def test_insert_single_line(document_class):
+    document = document_class(["Hello World"])
+    end = document.insert(0, 6, ["big "])
+    assert end == (0, 10)
+    assert document == ["Hello big World"]
+
+
+def test_insert_multi_line(document_class):
+    document = document_class(["Hello World", "tail"])
+    end = document.insert(0, 5, [",", "dear", "new"])
+    assert end == (2, 3)
+    assert document == ["Hello,", "dear", "new World", "tail"]
+
+
+def test_split_line(document_class):
+    document = document_class(["Hello, world!"])
+    document.insert(0, 6, ["", ""])
+    assert document == ["Hello,", " world!"]
+
+
+def test_delete_single_line(document_class):
+    document = document_class(["Hello, world!"])
+    assert document.delete(0, 5, 0, 12) == [", world"]
+    assert document == ["Hello!"]
+
+
+def test_delete_multi_line(document_class):
+    document = document_class(["Hello, world!", "middle", "Another line."])
+    deleted = document.delete(0, 7, 2, 8)
+    assert deleted == ["world!", "middle", "Another "]
+    assert document == ["Hello, line."]
+
+
+def test_pad_to(document_class):
+    document = document_class([])
+    document.pad_to(2)
+    assert document == ["", "", ""]
+
+
+def size(document):
+    return sum(len(line.encode()) + 1 for line in document.slice())
+
+
+def test_byte_count_follows_edits(document_class):
+    document = document_class(["héllo", "wörld"])
+    assert document.byte_count() == size(document) == 14
+    document.insert(0, 1, ["€", "ß"])
+    document.delete(1, 0, 2, 2)
+    document.pad_to(3)
+    assert document.byte_count() == size(document)
+
+
+def test_rope_matches_list_on_random_edits(small_chunks):
+    rng = random.Random(7)
+    lines = [f"line {i}" for i in range(50)]
+    rope, reference = RopeDocument(lines), ListDocument(list(lines))
+
+    for _ in range(500):
+        y = rng.randrange(reference.line_count())
+        x = rng.randrange(len(reference.line_at(y)) + 1)
+        if rng.random() < 0.5:
+            text = [f"t{rng.randrange(100)}" for _ in range(rng.randint(1, 6))]
+            assert rope.insert(y, x, text) == reference.insert(y, x, text)
+        else:
+            end_y = min(y + rng.randint(0, 5), reference.line_count() - 1)
+            end_x = rng.randrange(len(reference.line_at(end_y)) + 1)
+            if end_y == y:
+                end_x = max(end_x, x)
+            assert rope.delete(y, x, end_y, end_x) == reference.delete(
+                y, x, end_y, end_x
+            )
+        assert rope.line_count() == reference.line_count()
+        assert rope.byte_count() == reference.byte_count() == size(reference)
+
+    assert rope == reference.slice()
+    assert rope.slice(10, 20) == reference.slice(10, 20)
@@ -1,7 +1,11 @@
 import pytest
 from unittest.mock import AsyncMock, Mock, patch
 import asyncio
+import threading
 from Editor.editor import Editor
+from Shared.crdt import CrdtDocument
+from Shared.ot import PendingOperations
+from Shared.protocol import Protocol
 
 
 @pytest.fixture
@@ -31,13 +35,12 @@ async def test_save_content_file(mock_protocol, editor):
 
 
 @pytest.mark.asyncio
+@patch("Editor.renderer.curses")
 @patch("Editor.editor.Protocol")
-async def test_listen_for_update_insert_operation(mock_protocol, editor):
+async def test_listen_for_update_insert_operation(mock_protocol, mock_curses, editor):
     websocket = AsyncMock()
     stdscr = Mock()
     current_content = ["Hello World"]
-    cursor_y = 0
-    cursor_x = 0
 
     message = {
         "data": {
@@ -52,14 +55,12 @@ async def test_listen_for_update_insert_operation(mock_protocol, editor):
 
     websocket.recv = AsyncMock(side_effect=[message, asyncio.CancelledError()])
 
-    await editor.listen_for_update(
-        websocket, stdscr, current_content, cursor_y, cursor_x
-    )
+    await editor.listen_for_update(websocket, stdscr, current_content)
 
     assert current_content == ["Hello !World"]
-    stdscr.clear.assert_called()
-    stdscr.addstr.assert_called()
+    stdscr.addstr.assert_called_with(0, 0, "Hello !World")
     stdscr.move.assert_called()
+    mock_curses.doupdate.assert_called_once()
 
 
 @patch("Editor.message_sender.MessageSender.send_edit_message", new_callable=AsyncMock)
@@ -126,7 +127,7 @@ async def test_edit(mock_curses_wrapper, editor):
     mock_curses_wrapper.assert_called_once()
 
 
-@patch("Editor.editor.curses")
+@patch("Editor.renderer.curses")
 def test_display_text(mock_curses, editor):
     stdscr = Mock()
     current_content = ["Line1", "Line2"]
@@ -135,10 +136,33 @@ def test_display_text(mock_curses, editor):
 
     editor.display_text(stdscr, current_content, cursor_y, cursor_x)
 
-    stdscr.clear.assert_called_once()
+    stdscr.erase.assert_called_once()
     stdscr.addstr.assert_any_call(0, 0, "Line1")
     stdscr.addstr.assert_any_call(1, 0, "Line2")
-    stdscr.move.assert_called_once_with(cursor_y, cursor_x)
+    stdscr.move.assert_called_with(cursor_y, cursor_x)
+    stdscr.noutrefresh.assert_called_once()
+
+
+@patch("Editor.renderer.curses")
+def test_frames_are_painted_under_the_editor_lock(mock_curses, editor):
+    stdscr = Mock()
+    acquired = []
+
+    def other_thread():
+        acquired.append(editor.lock.acquire(blocking=False))
+
+    def paint(*args):
+        # damage from the other thread must wait until the frame is done
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+
+    stdscr.noutrefresh.side_effect = paint
+    editor.display_text(stdscr, ["Line1"], 0, 0)
+
+    assert acquired == [False]
+    assert editor.lock.acquire(blocking=False)
+    editor.lock.release()
 
 
 @patch("Editor.editor.curses.curs_set")
@@ -149,6 +173,7 @@ def test_curses_editor(mock_time, mock_curs_set, editor):
     filename = "test.txt"
     websocket = Mock()
     stop_event = Mock()
+    stdscr.getmaxyx.return_value = (24, 80)
 
     stdscr.getch = Mock(
         side_effect=[
@@ -198,3 +223,125 @@ def test_curses_editor(mock_time, mock_curs_set, editor):
                             filename, content, websocket
                         )
                         stop_event.set.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_remote_operations_are_rebased_on_pending_ones(editor):
+    editor.sender.revisions = PendingOperations(revision=3)
+    typed = {"op_type": "insert", "start_pos": {"y": 0, "x": 0}, "text": ["ab"]}
+    (sent,) = editor.sender.revisions.submit(typed)
+    assert (sent["revision"], sent["seq"]) == (3, 1)
+
+    remote = {"op_type": "insert", "start_pos": {"y": 0, "x": 1}, "text": ["!"]}
+    rebased = editor.integrate({"operation": remote, "revision": 4})
+    assert rebased[0]["start_pos"] == {"y": 0, "x": 3}
+    editor.sender.acknowledge({"ack": True, "revision": 5, "seq": 1})
+    assert editor.sender.revisions.pending == []
+    assert editor.sender.revisions.revision == 5
+
+
+@pytest.mark.asyncio
+async def test_crdt_operations_are_sent_and_applied_as_line_edits(editor):
+    state = CrdtDocument(["hello"]).state()
+    editor.sender.replica = CrdtDocument.from_state(state, "me")
+    peer = CrdtDocument.from_state(state, "peer")
+    websocket = AsyncMock()
+    await editor.sender.submit(
+        websocket,
+        {
+            "filename": "doc.txt",
+            "operation": {"op_type": "new line", "start_pos": {"y": 0, "x": 2}},
+        },
+    )
+    sent = websocket.send.call_args.args[0]
+    operation = Protocol.parse_response(sent)["data"]["operation"]
+    assert operation["op_type"] == "crdt_insert"
+    peer.apply(operation)
+
+    content = ["he", "llo"]
+    remote = peer.local_delete(0, 1, 1, 1)
+    for edit in editor.integrate({"operation": remote, "user_id": "peer"}):
+        editor.apply_remote_operation(content, edit)
+    assert content == peer.slice() == ["hlo"]
+
+
+def edit_frame(operation, **data):
+    return Protocol.encode(
+        Protocol.create_response(
+            "EDIT_FILE", dict(data, filename="doc.txt", operation=operation)
+        )
+    )
+
+
+async def type_then_receive(editor, content, remote):
+    websocket = AsyncMock()
+    websocket.recv = AsyncMock(side_effect=[remote, asyncio.CancelledError()])
+    editor.typing.open(websocket, "doc.txt", asyncio.get_running_loop())
+    # typed in the curses thread, still buffered when the remote edit lands
+    content[0] += "!"
+    editor.typing.type(0, 5, "!")
+    with patch("Editor.renderer.curses"):
+        await editor.listen_for_update(websocket, Mock(), content)
+    return [
+        Protocol.parse_response(call.args[0])["data"]["operation"]
+        for call in websocket.send.call_args_list
+    ]
+
+
+@pytest.mark.asyncio
+async def test_buffered_typing_is_sent_before_remote_edits_apply(editor):
+    editor.sender.revisions = PendingOperations(revision=0)
+    content = ["hello"]
+    remote = {"op_type": "insert", "start_pos": {"y": 0, "x": 0}, "text": ["A"]}
+
+    sent = await type_then_receive(
+        editor, content, edit_frame(remote, revision=1, user_id="peer")
+    )
+
+    assert content == ["Ahello!"]
+    assert [(op["start_pos"], op["revision"]) for op in sent] == [({"y": 0, "x": 5}, 0)]
+    # the pending copy moved past the remote insert, as the server will
+    (pending,) = editor.sender.revisions.pending
+    assert pending[1][0]["start_pos"] == {"y": 0, "x": 6}
+
+
+@pytest.mark.asyncio
+async def test_buffered_typing_reaches_the_replica_before_remote_edits(editor):
+    state = CrdtDocument(["hello"]).state()
+    editor.sender.replica = CrdtDocument.from_state(state, "me")
+    peer = CrdtDocument.from_state(state, "peer")
+    content = ["hello"]
+
+    sent = await type_then_receive(
+        editor, content, edit_frame(peer.local_insert(0, 0, ["A"]), user_id="peer")
+    )
+
+    assert content == editor.sender.replica.slice() == ["Ahello!"]
+    for operation in sent:
+        peer.apply(operation)
+    assert peer.slice() == content
+
+
+@pytest.mark.asyncio
+@patch("Editor.renderer.curses")
+async def test_remote_edits_keep_the_live_cursor_in_view(mock_curses, editor):
+    content = [f"line {i}" for i in range(50)]
+    stdscr = Mock()
+    editor.viewport.resize(10, 40)
+    # the curses thread moved down after listening started
+    editor.display_text(stdscr, content, 40, 2)
+    remote = {"op_type": "insert", "start_pos": {"y": 40, "x": 0}, "text": ["ab"]}
+    websocket = AsyncMock()
+    websocket.recv = AsyncMock(
+        side_effect=[
+            edit_frame(remote, user_id="peer"),
+            asyncio.CancelledError(),
+        ]
+    )
+
+    await editor.listen_for_update(websocket, stdscr, content)
+
+    assert content[40] == "abline 40"
+    assert (editor.cursor_y, editor.cursor_x) == (40, 4)
+    assert editor.viewport.top == 31
+    stdscr.move.assert_called_with(9, 4)
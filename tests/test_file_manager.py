@@ -123,9 +123,8 @@ def test_validate_access_granted(file_manager):
     }
 
     with patch.object(file_manager, "load_user_information", return_value=user_info):
-        success, filepath, msg = file_manager.validate_access(
-            user_id, host_id, filename
-        )
+        file_manager.load_index()
+    success, filepath, msg = file_manager.validate_access(user_id, host_id, filename)
 
     assert success is True
     assert filepath == os.path.join(
@@ -148,9 +147,8 @@ def test_validate_access_denied(file_manager):
     }
 
     with patch.object(file_manager, "load_user_information", return_value=user_info):
-        success, filepath, msg = file_manager.validate_access(
-            user_id, host_id, filename
-        )
+        file_manager.load_index()
+    success, filepath, msg = file_manager.validate_access(user_id, host_id, filename)
 
     assert success is False
     assert filepath is None
@@ -172,9 +170,12 @@ def test_grant_access_success(file_manager):
         file_manager, "load_user_information", return_value=user_info
     ), patch.object(
         file_manager, "get_files", return_value=host_files
+    ), patch(
+        "os.path.exists", return_value=True
     ), patch(
         "builtins.open", mock_open()
     ):
+        file_manager.load_index()
         result = file_manager.grant_access(user_id, host_id, filename)
 
     assert result == f'Access granted to file "{filename}" for user: {user_id}'
@@ -195,7 +196,10 @@ def test_grant_access_file_not_found(file_manager):
         file_manager, "load_user_information", return_value=user_info
     ), patch.object(
         file_manager, "get_files", return_value=host_files
+    ), patch(
+        "os.path.exists", return_value=True
     ):
+        file_manager.load_index()
         result = file_manager.grant_access(user_id, host_id, filename)
 
     assert result == f"File {filename} does not exist for these hosts: {host_id}"
@@ -212,6 +216,7 @@ def test_remove_access_success(mock_instance):
     mock_instance.load_user_information.return_value = {
         "1": {"host_access": {"2": {"files": ["file1.txt", "file2.txt"]}}}
     }
+    mock_instance.load_index()
     result = mock_instance.remove_access("1", "2", "file1.txt")
 
     expected_user_info = {"1": {"host_access": {"2": {"files": ["file2.txt"]}}}}
@@ -221,6 +226,7 @@ def test_remove_access_success(mock_instance):
 
 def test_remove_access_user_not_found(mock_instance):
     mock_instance.load_user_information.return_value = {}
+    mock_instance.load_index()
 
     result = mock_instance.remove_access("1", "2", "file1.txt")
 
@@ -230,6 +236,7 @@ def test_remove_access_user_not_found(mock_instance):
 
 def test_remove_access_host_not_found(mock_instance):
     mock_instance.load_user_information.return_value = {"1": {"host_access": {}}}
+    mock_instance.load_index()
 
     result = mock_instance.remove_access("1", "2", "file1.txt")
 
@@ -242,6 +249,7 @@ def test_remove_access_file_not_found(mock_instance):
     mock_instance.load_user_information.return_value = {
         "1": {"host_access": {"2": {"files": ["file2.txt"]}}}
     }
+    mock_instance.load_index()
 
     result = mock_instance.remove_access("1", "2", "file1.txt")
 
@@ -253,9 +261,102 @@ def test_remove_access_remove_host_after_last_file(mock_instance):
     mock_instance.load_user_information.return_value = {
         "1": {"host_access": {"2": {"files": ["file1.txt"]}}}
     }
+    mock_instance.load_index()
 
     result = mock_instance.remove_access("1", "2", "file1.txt")
 
     expected_user_info = {"1": {"host_access": {}}}
     mock_instance.save_user_information.assert_called_once_with(expected_user_info)
     assert result == 'Access to file "file1.txt" for user 1 from host 2 removed.'
+
+
+def test_iter_history_streams_entries(file_manager):
+    history = [
+        {"user_id": f"user{i}", "operation": {"text": ["x" * i]}} for i in range(20)
+    ]
+    with patch("os.path.exists", return_value=True), patch(
+        "builtins.open", mock_open(read_data=json.dumps(history, indent=4).encode())
+    ):
+        entries = list(file_manager.iter_history("history_file.txt", chunk_size=16))
+    assert entries == history
+
+
+def test_history_resumes_at_a_byte_offset(file_manager, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Server" / "files_change_history").mkdir(parents=True)
+    history = [{"user_id": "ира", "operation": {"text": ["ж" * i]}} for i in range(9)]
+    path = tmp_path / "Server" / "files_change_history" / "notes.json"
+    path.write_text(json.dumps(history, indent=4, ensure_ascii=False), "utf-8")
+
+    pairs = list(file_manager.history_from("notes.txt", chunk_size=16))
+    assert [entry for _, entry in pairs] == history
+    offset = pairs[3][0]
+    resumed = file_manager.history_from("notes.txt", offset, chunk_size=16)
+    assert [entry for _, entry in resumed] == history[4:]
+
+
+def test_history_entries_count_entries(file_manager, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Server" / "files_change_history").mkdir(parents=True)
+    history = [{"user_id": "ира", "operation": {"text": ["ж" * i]}} for i in range(9)]
+    file_manager.save_history("notes.txt", history)
+
+    assert list(file_manager.history_entries("notes.txt", 6, chunk_size=16)) == [
+        (7, history[6]),
+        (8, history[7]),
+        (9, history[8]),
+    ]
+
+    entries = file_manager.history_entries("notes.txt", chunk_size=16)
+    assert [next(entries) for _ in range(3)] == [
+        (1, history[0]),
+        (2, history[1]),
+        (3, history[2]),
+    ]
+    entries.close()
+    assert 3 in file_manager.history_marks["notes"][1]
+    resumed = file_manager.history_entries("notes.txt", 3, chunk_size=16)
+    assert [entry for _, entry in resumed] == history[3:]
+
+    file_manager.save_history("notes.txt", history[:2] + history[4:])
+    resumed = file_manager.history_entries("notes.txt", 3, chunk_size=16)
+    assert [entry for _, entry in resumed] == history[5:]
+
+
+def test_index_tracks_grants_in_memory(file_manager):
+    user_info = {"user1": {"host_access": {"host1": {"files": ["a.txt"]}}}}
+    with patch.object(
+        file_manager, "load_user_information", return_value=user_info
+    ), patch.object(
+        file_manager, "load_json", return_value=[{"User ID": "user2"}]
+    ), patch(
+        "os.path.exists", return_value=True
+    ):
+        file_manager.load_index()
+
+    file_manager.own_files["user2"] = ["b.txt"]
+    with patch.object(file_manager, "save_user_information") as mock_save:
+        file_manager.grant_access("user3", "user2", "b.txt")
+        mock_save.assert_called_once_with(file_manager.user_info)
+
+    with patch.object(file_manager, "load_user_information") as mock_load:
+        assert file_manager.validate_access("user3", "user2", "b.txt")[0]
+        assert file_manager.get_files("user1") == [("a.txt", "host1")]
+        assert file_manager.get_files("user3") == [("b.txt", "user2")]
+        mock_load.assert_not_called()
+
+    with patch.object(file_manager, "save_user_information"):
+        file_manager.remove_access("user3", "user2", "b.txt")
+    assert not file_manager.validate_access("user3", "user2", "b.txt")[0]
+
+
+@patch("builtins.open", new_callable=mock_open)
+def test_append_registered_user_skips_write(mock_open, file_manager):
+    file_manager.registered_users = {"user1": None}
+
+    file_manager.append_user("user1")
+    mock_open.assert_not_called()
+
+    file_manager.append_user("user2")
+    assert file_manager.get_all_registered_users() == ["user1", "user2"]
+    mock_open.assert_called_once_with(file_manager.clients_base_dir, "w")
@@ -0,0 +1,52 @@
+from Server.history_query import HistoryFilter, history_pages, positioned
+
+
+def make_entry(user_id, op_type, y, time):
+    return {
+        "user_id": user_id,
+        "time": time,
+        "operation": {
+            "op_type": op_type,
+            "start_pos": {"y": y, "x": 0},
+            "end_pos": {"y": y, "x": 1},
+        },
+    }
+
+
+HISTORY = [
+    make_entry("irina", "insert", 0, "2024-12-16 00:31:49"),
+    make_entry("nikita", "delete", 3, "2024-12-16 00:32:10"),
+    make_entry("irina", "delete", 5, "2024-12-17 10:00:00"),
+    make_entry("irina", "insert", 9, "2024-12-18 12:00:00"),
+]
+
+
+def test_pages_split_by_page_size():
+    pages = list(history_pages(positioned(HISTORY), page_size=3))
+    assert [len(page) for page, _, _ in pages] == [3, 1]
+    assert pages[0][1:] == (3, False)
+    assert pages[-1][1:] == (None, True)
+
+
+def test_limit_stops_with_cursor():
+    pages = list(history_pages(positioned(HISTORY, 1), limit=2, page_size=10))
+    assert pages == [(HISTORY[1:3], 3, True)]
+
+
+def test_filters():
+    assert HistoryFilter(user_id="nikita").matches(HISTORY[1])
+    assert not HistoryFilter(op_type="insert").matches(HISTORY[1])
+    assert HistoryFilter(start_line=4, end_line=6).matches(HISTORY[2])
+    assert not HistoryFilter(start_line=4, end_line=6).matches(HISTORY[3])
+    assert HistoryFilter(since="2024-12-17").matches(HISTORY[2])
+    assert not HistoryFilter(until="2024-12-17").matches(HISTORY[2])
+    assert HistoryFilter(until="2024-12-17T10:00").matches(HISTORY[2])
+    assert not HistoryFilter(since="2024-12-17T10:00:01").matches(HISTORY[2])
+
+
+def test_filtered_pages_keep_scan_position():
+    history_filter = HistoryFilter.from_request({"user_id": "irina"})
+    pages = list(
+        history_pages(positioned(HISTORY), limit=2, history_filter=history_filter)
+    )
+    assert pages == [([HISTORY[0], HISTORY[2]], 3, True)]
@@ -0,0 +1,80 @@
+import io
+import logging
+import threading
+from Server.log import (
+    SampledLogger,
+    get_logger,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+class Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_sampled_logger_keeps_every_nth_and_reports_skips():
+    logger = logging.getLogger("test.sampled")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    recorder = Recorder()
+    logger.addHandler(recorder)
+    sampled = SampledLogger(logger, every=3)
+
+    for n in range(7):
+        sampled.debug("op %d", n)
+
+    assert recorder.messages == ["op 2 (2 similar skipped)", "op 5 (2 similar skipped)"]
+    logger.setLevel(logging.INFO)
+    sampled.debug("op %d", 7)
+    assert sampled.seen == 7
+
+
+def test_sampled_logger_rate_limit():
+    logger = logging.getLogger("test.rate")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    recorder = Recorder()
+    logger.addHandler(recorder)
+    sampled = SampledLogger(logger, per_second=2)
+
+    for n in range(10):
+        sampled.debug("op %d", n)
+
+    assert 2 <= len(recorder.messages) <= 4
+    assert recorder.messages[:2] == ["op 0", "op 1"]
+
+
+def test_records_are_formatted_on_the_listener_thread():
+    class Value:
+        def __init__(self):
+            self.threads = []
+
+        def __str__(self):
+            self.threads.append(threading.current_thread())
+            return "value"
+
+    stream = io.StringIO()
+    setup_logging("DEBUG", stream=stream, levels={"quiet": "WARNING"})
+    try:
+        value = Value()
+        get_logger("server").info("got %s", value)
+        get_logger("quiet").info("dropped")
+        get_logger("quiet").warning("kept")
+    finally:
+        shutdown_logging()
+        root = logging.getLogger("texteditor")
+        root.handlers, root.propagate = [], True
+        root.setLevel(logging.NOTSET)
+        get_logger("quiet").setLevel(logging.NOTSET)
+
+    output = stream.getvalue()
+    assert "INFO texteditor.server: got value" in output
+    assert "dropped" not in output
+    assert "WARNING texteditor.quiet: kept" in output
+    assert value.threads and threading.main_thread() not in value.threads
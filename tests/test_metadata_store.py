@@ -0,0 +1,64 @@
+import json
+import pytest
+from Server.file_manager import FileManager
+from Server.metadata_store import SqliteMetadataStore
+
+
+@pytest.fixture
+def json_files(tmp_path):
+    clients_base = tmp_path / "clients_base.json"
+    clients_info = tmp_path / "clients_info.json"
+    clients_base.write_text(json.dumps([{"User ID": "nikita"}, {"User ID": "irina"}]))
+    clients_info.write_text(
+        json.dumps({"irina": {"host_access": {"nikita": {"files": ["n.txt"]}}}})
+    )
+    return str(clients_base), str(clients_info)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteMetadataStore(str(tmp_path / "metadata.db"))
+    yield store
+    store.close()
+
+
+def test_import_json(store, json_files):
+    assert not store.is_imported()
+    assert store.import_json(*json_files) == (2, 1)
+    assert store.is_imported()
+    assert store.load_users() == ["nikita", "irina"]
+    assert store.load_user_information() == {
+        "irina": {"host_access": {"nikita": {"files": ["n.txt"]}}}
+    }
+
+
+def test_grants_and_users(store):
+    store.add_user("nikita")
+    store.add_user("nikita")
+    store.add_grant("irina", "nikita", "a.txt")
+    store.add_grant("irina", "nikita", "b.txt")
+    store.remove_grant("irina", "nikita", "a.txt")
+
+    assert store.load_users() == ["nikita"]
+    assert store.load_user_information() == {
+        "irina": {"host_access": {"nikita": {"files": ["b.txt"]}}}
+    }
+
+
+def test_file_manager_uses_sqlite_backend(tmp_path, store, json_files):
+    store.import_json(*json_files)
+    (tmp_path / "nikita's_files").mkdir()
+    (tmp_path / "nikita's_files" / "m.txt").write_text("")
+
+    file_manager = FileManager(str(tmp_path), metadata_db=store.db_path)
+    assert file_manager.get_all_registered_users() == ["nikita", "irina"]
+    assert file_manager.validate_access("irina", "nikita", "n.txt")[0]
+
+    file_manager.append_user("lexa")
+    file_manager.grant_access("lexa", "nikita", "m.txt")
+    file_manager.remove_access("irina", "nikita", "n.txt")
+
+    reopened = FileManager(str(tmp_path), metadata_db=store.db_path)
+    assert reopened.get_all_registered_users() == ["nikita", "irina", "lexa"]
+    assert reopened.validate_access("lexa", "nikita", "m.txt")[0]
+    assert not reopened.validate_access("irina", "nikita", "n.txt")[0]
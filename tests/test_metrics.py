@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from Server.metrics import MetricsRegistry, MetricsServer
+from Server.server import Server
+
+
+def test_render_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["command"])
+    requests.labels("PING").inc()
+    requests.labels("PING").inc(2)
+    registry.gauge("open_documents", "Open documents", callback=lambda: 3)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+
+    assert "# TYPE texteditor_requests_total counter" in text
+    assert 'texteditor_requests_total{command="PING"} 3' in text
+    assert "texteditor_open_documents 3" in text
+    assert 'texteditor_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'texteditor_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'texteditor_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "texteditor_latency_seconds_count 3" in text
+    assert registry.counter("requests_total", "Requests", ["command"]) is requests
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Requests")
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_registry():
+    registry = MetricsRegistry()
+    registry.counter("hits_total", "Hits").inc()
+    metrics_server = MetricsServer(registry)
+    port = await metrics_server.start("localhost", 0)
+    try:
+        reader, writer = await asyncio.open_connection("localhost", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = (await reader.read()).decode()
+        writer.close()
+
+        assert response.startswith("HTTP/1.1 200 OK")
+        assert "text/plain; version=0.0.4" in response
+        assert response.endswith("texteditor_hits_total 1\n")
+    finally:
+        await metrics_server.close()
+
+
+@pytest.mark.asyncio
+async def test_server_records_commands_and_documents(tmp_path):
+    server = Server(oplog_dir=str(tmp_path))
+    server.file_manager = Mock()
+    server.file_manager.open_file.return_value = (True, ["hello", "world"])
+    server.file_manager.load_history.return_value = [{"user_id": "u"}]
+    server.file_manager.save_file.return_value = (True, None)
+    websocket = AsyncMock()
+    server.user_sessions[websocket] = "u"
+
+    await server.handle_request(
+        {
+            "command": "OPEN_FILE",
+            "data": {"filename": "f.txt", "user_id": "u", "host_id": "u"},
+        },
+        websocket,
+    )
+    server.save_document("u", "f.txt")
+    text = server.metrics.render()
+
+    assert 'texteditor_command_duration_seconds_count{command="OPEN_FILE"} 1' in text
+    assert "texteditor_open_documents 1" in text
+    assert 'texteditor_document_bytes{filename="f.txt"} 12' in text
+    assert 'texteditor_history_entries{filename="f.txt"} 1' in text
+    assert "texteditor_save_file_bytes_total 12" in text
+    assert "texteditor_save_file_seconds_count 1" in text
@@ -0,0 +1,92 @@
+import pytest
+from Server.op_log import OperationLogStore
+from Server.session_manager import SessionManager
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OperationLogStore(str(tmp_path), snapshot_every=3)
+    yield store
+    store.shutdown()
+
+
+def insert(y, x, text):
+    return {"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": text}
+
+
+def open_document(store, content, history):
+    session_manager = SessionManager(op_log=store)
+    session_manager.start_session("doc.txt", object())
+    session_manager.update_content("doc.txt", content)
+    recovered = session_manager.recover("doc.txt", history)
+    return session_manager, recovered
+
+
+def test_append_and_read_records(store):
+    store.log("doc.txt").write_snapshot(0, ["base"], [])
+    store.append("doc.txt", {"operation": insert(0, 0, ["a"])})
+    store.append("doc.txt", {"operation": insert(0, 1, ["b"])})
+
+    snapshot, records = store.recover("doc.txt")
+    assert snapshot["content"] == ["base"]
+    assert [record["seq"] for record in records] == [1, 2]
+
+
+def test_snapshot_compacts_log(store):
+    log = store.log("doc.txt")
+    for i in range(5):
+        store.append("doc.txt", {"operation": insert(0, i, ["x"])})
+
+    store.snapshot("doc.txt", ["xxxxx"], [], background=False)
+    store.append("doc.txt", {"operation": insert(0, 5, ["y"])})
+
+    assert [record["seq"] for record in log.read_records()] == [6]
+    snapshot, records = store.recover("doc.txt")
+    assert snapshot["seq"] == 5
+    assert len(records) == 1
+
+
+def test_crash_recovery_replays_tail(tmp_path, store):
+    history = {}
+    session_manager, recovered = open_document(store, ["Hello"], history)
+    assert recovered is None
+
+    for i, char in enumerate("abcd"):
+        session_manager.apply_operation(
+            "doc.txt", "user1", insert(0, 5 + i, [char]), history
+        )
+    session_manager.apply_operation(
+        "doc.txt",
+        "user1",
+        {"op_type": "new line", "start_pos": {"y": 0, "x": 5}},
+        history,
+    )
+    session_manager.apply_operation(
+        "doc.txt", "user1", {"op_type": "cancel_changes"}, history
+    )
+    expected = session_manager.get_content("doc.txt").slice()
+    store.shutdown()
+
+    restarted = OperationLogStore(str(tmp_path), snapshot_every=3)
+    recovered_history = {"doc.txt": []}
+    _, recovered = open_document(restarted, ["Hello"], recovered_history)
+    restarted.shutdown()
+
+    assert recovered == expected == ["Hello", "abcd"]
+    assert len(recovered_history["doc.txt"]) == 3
+
+
+def test_append_many_writes_consecutive_seqs(store):
+    assert (
+        store.append_many(
+            "doc.txt", [{"operation": insert(0, i, ["x"])} for i in range(2)]
+        )
+        is False
+    )
+    assert store.append_many("doc.txt", [{"operation": insert(0, 2, ["y"])}]) is True
+
+    assert [record["seq"] for record in store.log("doc.txt").read_records()] == [
+        1,
+        2,
+        3,
+    ]
@@ -0,0 +1,184 @@
+import copy
+import random
+from collections import deque
+from Server.session_manager import SessionManager
+from Shared.document import ListDocument
+from Shared.ot import PendingOperations, RevisionLog, transform, transform_lists
+
+
+def insert(y, x, *text):
+    return {"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": list(text)}
+
+
+def delete(y, x, end_y, end_x):
+    return {
+        "op_type": "delete",
+        "start_pos": {"y": y, "x": x},
+        "end_pos": {"y": end_y, "x": end_x},
+    }
+
+
+def apply(lines, operations):
+    document = ListDocument(list(lines))
+    for operation in operations:
+        SessionManager.apply_to_document(document, copy.deepcopy(operation))
+    return document.slice()
+
+
+def random_operation(rng, lines):
+    y = rng.randrange(len(lines))
+    x = rng.randint(0, len(lines[y]))
+    kind = rng.random()
+    if kind < 0.45:
+        text = [rng.choice("abc") * rng.randint(0, 2) for _ in range(rng.randint(1, 3))]
+        return insert(y, x, *text)
+    if kind < 0.6:
+        return {"op_type": "new line", "start_pos": {"y": y, "x": x}}
+    end_y = rng.randint(y, min(len(lines) - 1, y + 2))
+    end_x = rng.randint(x if end_y == y else 0, len(lines[end_y]))
+    return delete(y, x, end_y, end_x)
+
+
+def test_concurrent_inserts_at_the_same_place():
+    first, second = insert(0, 2, "AA"), insert(0, 2, "B")
+
+    assert transform(second, first, first=False) == [insert(0, 4, "B")]
+    assert transform(first, second, first=True) == [first]
+    assert apply(["xyz"], [first, insert(0, 4, "B")]) == ["xyAABz"]
+
+
+def test_delete_around_an_insert_keeps_the_inserted_text():
+    lines = ["hello", "world"]
+    removal, typed = delete(0, 1, 1, 2), insert(0, 3, "X", "Y")
+
+    rebased = transform(removal, typed)
+    assert len(rebased) == 2
+    assert apply(lines, [typed] + rebased) == ["hX", "Yrld"]
+    assert apply(lines, [removal] + transform(typed, removal)) == ["hX", "Yrld"]
+
+
+def test_overlapping_deletes_remove_the_union_once():
+    lines = ["abcdef"]
+    first, second = delete(0, 1, 0, 4), delete(0, 2, 0, 5)
+
+    assert apply(lines, [first] + transform(second, first)) == ["af"]
+    assert apply(lines, [second] + transform(first, second)) == ["af"]
+    assert transform(delete(0, 2, 0, 3), first) == []
+
+
+def test_random_concurrent_sequences_converge():
+    rng = random.Random(7)
+    for _ in range(2000):
+        lines = ["".join(rng.choice("xyz") for _ in range(rng.randint(0, 4)))]
+        lines *= rng.randint(1, 4)
+        left = [random_operation(rng, lines)]
+        left.append(random_operation(rng, apply(lines, left)))
+        right = [random_operation(rng, lines)]
+        left_after, right_after = transform_lists(left, right, True)
+
+        assert apply(apply(lines, left), right_after) == apply(
+            apply(lines, right), left_after
+        )
+
+
+def test_revision_log_rebases_on_ops_the_client_had_not_seen():
+    log = RevisionLog()
+    assert log.submit(insert(0, 0, "abc"), "a", 0) == (1, [insert(0, 0, "abc")])
+    assert log.submit(insert(0, 1, "X"), "b", 0) == (2, [insert(0, 4, "X")])
+    # "a" already had its own insert when it typed at the end of it
+    assert log.submit(insert(0, 3, "!"), "a", 0) == (3, [insert(0, 3, "!")])
+    assert log.submit(insert(0, 0, "-"), None) == (4, [insert(0, 0, "-")])
+
+
+def test_revision_log_window():
+    log = RevisionLog(window=2)
+    for n in range(3):
+        log.submit(insert(0, 0, str(n)), "a", n)
+
+    assert log.submit(insert(0, 0, "late"), "b", 0) is None
+    assert log.submit(insert(0, 0, "ok"), "b", 1) is not None
+    restored = RevisionLog.from_state(log.state(), window=2)
+    assert restored.submit(insert(0, 0, "x"), "b", 1) == log.submit(
+        insert(0, 0, "x"), "b", 1
+    )
+
+
+def test_clients_with_many_ops_in_flight_converge():
+    # clients keep typing while their ops and the server's replies are queued,
+    # with at most `window` ops in flight each; each revision reaches a client
+    # in one piece, like an EDIT_BATCH frame
+    rng = random.Random(3)
+    for _ in range(150):
+        window = rng.choice([None, 1, 2])
+        start = ["abc", "de", ""]
+        server, log = ListDocument(list(start)), RevisionLog()
+        clients = [
+            {
+                "document": ListDocument(list(start)),
+                "revisions": PendingOperations(window=window),
+                "outbox": deque(),
+                "inbox": deque(),
+            }
+            for _ in range(3)
+        ]
+
+        def serve(index):
+            operation = clients[index]["outbox"].popleft()
+            base = operation.pop("revision")
+            operation.pop("seq")
+            revision, operations = log.submit(operation, index, base)
+            for applied in operations:
+                SessionManager.apply_to_document(server, applied)
+            for other, client in enumerate(clients):
+                message = None if other == index else copy.deepcopy(operations)
+                client["inbox"].append((message, revision))
+
+        def receive(client):
+            operations, revision = client["inbox"].popleft()
+            if operations is None:
+                client["outbox"].extend(client["revisions"].ack(revision))
+                return
+            for operation in operations:
+                for rebased in client["revisions"].receive(operation, revision):
+                    SessionManager.apply_to_document(client["document"], rebased)
+
+        for _ in range(120):
+            index = rng.randrange(len(clients))
+            client = clients[index]
+            roll = rng.random()
+            if roll < 0.4:
+                operation = random_operation(rng, client["document"].slice())
+                SessionManager.apply_to_document(
+                    client["document"], copy.deepcopy(operation)
+                )
+                client["outbox"].extend(client["revisions"].submit(operation))
+                in_flight = client["revisions"].in_flight()
+                assert window is None or in_flight <= window
+            elif roll < 0.7 and client["outbox"]:
+                serve(index)
+            elif client["inbox"]:
+                receive(client)
+        while any(client["outbox"] or client["inbox"] for client in clients):
+            for index, client in enumerate(clients):
+                if client["outbox"]:
+                    serve(index)
+                if client["inbox"]:
+                    receive(client)
+
+        for client in clients:
+            assert client["document"] == server
+            assert client["revisions"].pending == []
+
+
+def test_window_holds_operations_back_until_acked():
+    pending = PendingOperations(revision=2, window=1)
+    first = pending.submit(insert(0, 0, "a"))
+    assert first == [dict(insert(0, 0, "a"), revision=2, seq=1)]
+    assert pending.submit(insert(0, 1, "b")) == []
+    # someone else typed in front before the held op went out
+    assert pending.receive(insert(0, 0, "xy"), 3) == [insert(0, 0, "xy")]
+
+    assert pending.ack(4, seq=1) == [dict(insert(0, 3, "b"), revision=4, seq=2)]
+    assert pending.in_flight() == 1
+    assert pending.ack(5, seq=2) == []
+    assert pending.pending == []
@@ -0,0 +1,129 @@
+import asyncio
+from unittest.mock import AsyncMock
+import pytest
+from Server.outbound import OutboundQueues
+
+
+class SlowSocket:
+    def __init__(self):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.close = AsyncMock()
+
+    async def send(self, frame):
+        await self.gate.wait()
+        self.sent.append(frame)
+
+
+def resync(websocket, filename=None):
+    return [(filename or "doc.txt", f"resync:{filename or 'all'}")]
+
+
+@pytest.mark.asyncio
+async def test_writer_drains_in_order():
+    queues = OutboundQueues(maxsize=10, resync=resync)
+    websocket = AsyncMock()
+    queues.register(websocket)
+
+    for i in range(5):
+        assert queues.send(websocket, f"frame{i}", key="doc.txt")
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert [call.args[0] for call in websocket.send.call_args_list] == [
+        f"frame{i}" for i in range(5)
+    ]
+    assert queues.metrics()["sent"] == 5
+    queues.unregister(websocket)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_block_others():
+    queues = OutboundQueues(maxsize=10, resync=resync)
+    slow, fast = SlowSocket(), AsyncMock()
+    queues.register(slow)
+    queues.register(fast)
+
+    for client in (slow, fast):
+        queues.send(client, "frame", key="doc.txt")
+    await asyncio.sleep(0.01)
+
+    fast.send.assert_called_once_with("frame")
+    assert slow.sent == []
+    assert queues.metrics()["sent"] == 1
+    queues.unregister(slow)
+    queues.unregister(fast)
+
+
+@pytest.mark.asyncio
+async def test_drop_policy_replaces_queue_with_resync():
+    queues = OutboundQueues(maxsize=3, policy="drop", resync=resync)
+    slow = SlowSocket()
+    queues.register(slow)
+    await asyncio.sleep(0)
+
+    for i in range(6):
+        queues.send(slow, f"frame{i}", key="doc.txt")
+    slow.gate.set()
+    await asyncio.sleep(0.01)
+
+    assert slow.sent == ["resync:all", "frame4", "frame5"]
+    assert queues.metrics()["resyncs"] == 1
+    assert queues.metrics()["dropped"] == 4
+    queues.unregister(slow)
+
+
+@pytest.mark.asyncio
+async def test_drop_policy_keeps_replies():
+    queues = OutboundQueues(maxsize=3, policy="drop", resync=resync)
+    slow = SlowSocket()
+    queues.register(slow)
+    await asyncio.sleep(0)
+
+    queues.send(slow, "frame0", key="doc.txt")
+    await queues.send_wait(slow, "reply0")
+    queues.send(slow, "frame1", key="doc.txt")
+    queues.send(slow, "frame2", key="doc.txt")
+    queues.send(slow, "reply1")
+    slow.gate.set()
+    await asyncio.sleep(0.01)
+
+    assert slow.sent == ["reply0", "resync:all", "reply1"]
+    assert queues.metrics()["dropped"] == 3
+    queues.unregister(slow)
+
+
+@pytest.mark.asyncio
+async def test_coalesce_policy_keeps_other_documents():
+    queues = OutboundQueues(maxsize=3, policy="coalesce", resync=resync)
+    slow = SlowSocket()
+    queues.register(slow)
+    queues.send(slow, "first", key="a.txt")
+    await asyncio.sleep(0)
+
+    queues.send(slow, "a1", key="a.txt")
+    queues.send(slow, "b1", key="b.txt")
+    queues.send(slow, "a2", key="a.txt")
+    queues.send(slow, "a3", key="a.txt")
+    slow.gate.set()
+    await asyncio.sleep(0.01)
+
+    assert slow.sent == ["first", "b1", "resync:a.txt"]
+    assert queues.metrics()["coalesced"] == 3
+    queues.unregister(slow)
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_closes_slow_client():
+    queues = OutboundQueues(maxsize=2, policy="disconnect", resync=resync)
+    slow = SlowSocket()
+    queues.register(slow)
+    await asyncio.sleep(0)
+
+    for i in range(4):
+        queues.send(slow, f"frame{i}", key="doc.txt")
+    await asyncio.sleep(0)
+
+    slow.close.assert_awaited_once()
+    assert slow not in queues.queues
+    assert queues.metrics()["disconnects"] == 1
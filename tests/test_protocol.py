@@ -0,0 +1,103 @@
+import json
+import pytest
+from Shared.protocol import Protocol
+
+EDIT_MESSAGES = [
+    Protocol.create_response(
+        "EDIT_FILE",
+        {
+            "filename": "test.txt",
+            "operation": {
+                "op_type": "insert",
+                "start_pos": {"y": 300, "x": 2},
+                "length": 2,
+                "text": ["héllo", "wörld"],
+                "end_pos": {"y": None, "x": None},
+                "user_id": "user1",
+            },
+            "user_id": "user1",
+        },
+    ),
+    Protocol.create_response(
+        "EDIT_FILE",
+        {
+            "filename": "test.txt",
+            "operation": {
+                "op_type": "delete",
+                "start_pos": {"y": 0, "x": 0},
+                "end_pos": {"y": 1, "x": 4},
+                "text": None,
+            },
+            "user_id": "user1",
+        },
+    ),
+    Protocol.create_response(
+        "EDIT_FILE",
+        {"operation": {"op_type": "new line", "start_pos": {"y": 5, "x": 1}}},
+    ),
+    Protocol.create_response(
+        "EDIT_FILE",
+        {"operation": {"op_type": "custom", "start_pos": {"y": -1, "x": "a"}}},
+    ),
+    Protocol.create_response("EDIT_FILE", {"operation": None, "user_id": None}),
+]
+
+
+@pytest.mark.parametrize("message", EDIT_MESSAGES)
+def test_binary_round_trip_edit(message):
+    frame = Protocol.encode(message, "binary")
+    assert isinstance(frame, bytes)
+    assert Protocol.decode(frame) == message
+
+
+def test_binary_round_trip_other_commands():
+    for message in [
+        Protocol.create_response("GET_FILES", {"files": ["a.txt"]}),
+        Protocol.create_response("PING", {}),
+        Protocol.create_response("UNKNOWN", {"x": 1}),
+    ]:
+        assert Protocol.decode(Protocol.encode(message, "binary")) == message
+
+
+def test_binary_is_smaller_than_json():
+    message = EDIT_MESSAGES[0]
+    assert len(Protocol.encode(message, "binary")) < len(Protocol.encode(message))
+
+
+def test_negotiate():
+    assert Protocol.negotiate(["binary", "json"]) == "binary"
+    assert Protocol.negotiate(["msgpack", "json"]) == "json"
+    assert Protocol.negotiate(None) == "json"
+
+
+def test_decode_detects_frame_type():
+    message = Protocol.create_response("LOGIN", {"status": "success"})
+    assert Protocol.parse_request(json.dumps(message)) == message
+    assert Protocol.parse_response(Protocol.encode(message, "binary")) == message
+
+
+def test_binary_round_trip_batch():
+    message = Protocol.create_response(
+        "EDIT_BATCH",
+        {
+            "filename": "test.txt",
+            "operations": [message["data"] for message in EDIT_MESSAGES],
+        },
+    )
+    frame = Protocol.encode(message, "binary")
+    assert Protocol.decode(frame) == message
+    assert len(frame) < len(Protocol.encode(message))
+
+    odd = Protocol.create_response("EDIT_BATCH", {"operations": [1, "x"]})
+    assert Protocol.decode(Protocol.encode(odd, "binary")) == odd
+
+
+def test_binary_keeps_request_id():
+    message = {**Protocol.create_response("GET_FILES", {"files": []}), "id": 300}
+    assert Protocol.decode(Protocol.encode(message, "binary")) == message
+
+    edit = {**EDIT_MESSAGES[0], "id": 1}
+    assert Protocol.decode(Protocol.encode(edit, "binary")) == edit
+
+    odd = {**Protocol.create_response("GET_FILES", {}), "id": "abc"}
+    assert Protocol.decode(Protocol.encode(odd, "binary")) == odd
@@ -0,0 +1,170 @@
+import random
+import pytest
+from unittest.mock import Mock, call, patch
+from Editor.editor import Editor
+from Editor.renderer import Renderer
+from Editor.viewport import Viewport
+
+
+@pytest.fixture
+def renderer():
+    with patch("Editor.renderer.curses"):
+        renderer = Renderer()
+        renderer.render(Mock(), ["one", "two", "three"], 0, 0)
+        yield renderer
+
+
+def painted(stdscr):
+    return [args for name, args, _ in stdscr.mock_calls if name == "addstr"]
+
+
+def test_typing_repaints_only_its_row(renderer):
+    stdscr = Mock()
+    lines = ["one", "twox", "three"]
+    renderer.touch(1)
+    renderer.render(stdscr, lines, 1, 4)
+
+    assert painted(stdscr) == [(1, 0, "twox")]
+    stdscr.erase.assert_not_called()
+    assert renderer.cells == len("onetwothree") + 4
+    assert renderer.frames == 2
+
+
+def test_new_lines_scroll_the_rows_below(renderer):
+    stdscr = Mock()
+    operation = {"op_type": "insert", "start_pos": {"y": 0, "x": 1}, "text": ["X", "Y"]}
+    renderer.damage(operation)
+    lines = ["one", "two", "three"]
+    Editor.apply_remote_operation(lines, operation)
+    renderer.render(stdscr, lines, 0, 0)
+
+    assert lines == ["oX", "Yne", "two", "three"]
+    assert call.insdelln(1) in stdscr.mock_calls
+    assert painted(stdscr) == [(0, 0, "oX"), (1, 0, "Yne")]
+
+
+def test_deleted_lines_drop_their_pending_damage(renderer):
+    stdscr = Mock()
+    renderer.touch(2)
+    renderer.damage(
+        {
+            "op_type": "delete",
+            "start_pos": {"y": 0, "x": 1},
+            "end_pos": {"y": 1, "x": 1},
+        }
+    )
+    renderer.render(stdscr, ["owo", "three"], 0, 1)
+
+    assert call.insdelln(-1) in stdscr.mock_calls
+    assert painted(stdscr) == [(0, 0, "owo"), (1, 0, "three")]
+
+
+def test_resync_repaints_everything(renderer):
+    stdscr = Mock()
+    renderer.damage({"op_type": "resync", "text": ["a", "b"]})
+    renderer.render(stdscr, ["a", "b"], 0, 0)
+
+    stdscr.erase.assert_called_once()
+    assert painted(stdscr) == [(0, 0, "a"), (1, 0, "b")]
+    assert renderer.fps() == 2
+
+
+class Screen:
+    # just enough of a curses window to check what ends up on it
+    def __init__(self, height, width):
+        self.rows = [""] * height
+        self.y = 0
+        self.written = 0
+
+    def erase(self):
+        self.rows = [""] * len(self.rows)
+
+    def move(self, y, x):
+        assert 0 <= y < len(self.rows)
+        self.y = y
+
+    def clrtoeol(self):
+        self.rows[self.y] = ""
+
+    def addstr(self, y, x, text):
+        self.rows[y] = self.rows[y][:x].ljust(x) + text
+        self.written += 1
+
+    def insdelln(self, count):
+        height = len(self.rows)
+        if count > 0:
+            self.rows[self.y : self.y] = [""] * count
+        else:
+            del self.rows[self.y : self.y - count]
+            self.rows.extend([""] * -count)
+        del self.rows[height:]
+
+    def noutrefresh(self):
+        pass
+
+
+def test_only_the_viewport_is_drawn():
+    viewport = Viewport(height=3, width=4)
+    renderer = Renderer(viewport)
+    screen = Screen(3, 5)
+    lines = [f"line{n}" for n in range(100_000)]
+    with patch("Editor.renderer.curses"):
+        renderer.render(screen, lines, 50_000, 6)
+        assert screen.rows == ["e499", "e499", "e500"]
+        assert screen.written == 3
+
+        renderer.damage({"op_type": "new line", "start_pos": {"y": 10, "x": 0}})
+        Editor.apply_remote_operation(
+            lines, {"op_type": "new line", "start_pos": {"y": 10, "x": 0}}
+        )
+        renderer.render(screen, lines, 50_000, 6)
+        assert screen.rows == ["e499", "e499", "e499"]
+        assert screen.written == 4
+
+
+def test_incremental_frames_match_a_full_repaint():
+    rng = random.Random(11)
+    viewport = Viewport(height=6, width=8)
+    renderer = Renderer(viewport)
+    screen = Screen(6, 8)
+    lines = [f"{n}" * rng.randint(0, 12) for n in range(40)]
+    cursor_y = cursor_x = 0
+    with patch("Editor.renderer.curses"):
+        for _ in range(500):
+            y = rng.randrange(len(lines))
+            roll = rng.random()
+            if roll < 0.3:
+                text = ["x" * rng.randint(0, 3) for _ in range(rng.randint(1, 8))]
+                operation = {
+                    "op_type": "insert",
+                    "start_pos": {"y": y, "x": 0},
+                    "text": text,
+                }
+            elif roll < 0.5 and len(lines) > 1:
+                end_y = rng.randint(y, min(len(lines) - 1, y + 8))
+                operation = {
+                    "op_type": "delete",
+                    "start_pos": {"y": y, "x": 0},
+                    "end_pos": {"y": end_y, "x": 0},
+                }
+            elif roll < 0.6:
+                operation = {"op_type": "new line", "start_pos": {"y": y, "x": 0}}
+            else:
+                operation = None
+                cursor_y = min(max(cursor_y + rng.randint(-9, 9), 0), len(lines) - 1)
+            if operation is not None:
+                renderer.damage(operation)
+                Editor.apply_remote_operation(lines, operation)
+                cursor_y = min(cursor_y, len(lines) - 1)
+            cursor_x = min(len(lines[cursor_y]), rng.randint(0, 4))
+            renderer.render(screen, lines, cursor_y, cursor_x)
+
+            expected = [
+                (
+                    lines[y][viewport.left : viewport.left + viewport.width]
+                    if y < len(lines)
+                    else ""
+                )
+                for y in range(viewport.top, viewport.bottom())
+            ]
+            assert screen.rows == expected
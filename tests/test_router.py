@@ -0,0 +1,97 @@
+import asyncio
+import websockets
+import pytest
+from Server.router import HashRing, Router
+from Server.server import Server
+from Shared.protocol import Protocol
+
+
+def test_hash_ring_is_stable_and_balanced():
+    ring = HashRing(["a", "b", "c"])
+    keys = [f"file{i}.txt" for i in range(3000)]
+    owners = {key: ring.get(key) for key in keys}
+
+    assert owners == {key: HashRing(["a", "b", "c"]).get(key) for key in keys}
+    counts = {node: list(owners.values()).count(node) for node in "abc"}
+    assert min(counts.values()) > 500
+
+    ring.add("d")
+    moved = [key for key in keys if ring.get(key) != owners[key]]
+    assert all(ring.get(key) == "d" for key in moved)
+    assert len(moved) < len(keys) / 2
+
+
+async def request(websocket, command, data, request_id):
+    await websocket.send(
+        Protocol.encode({"command": command, "data": data, "id": request_id})
+    )
+    while True:
+        message = Protocol.parse_response(await websocket.recv())
+        if message.get("id") == request_id:
+            return message
+
+
+@pytest.mark.asyncio
+async def test_router_forwards_document_traffic(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Server" / "clients_information").mkdir(parents=True)
+    servers = [
+        Server(oplog_dir=str(tmp_path / f"oplog{i}"), control_token="token")
+        for i in range(2)
+    ]
+    listeners = [
+        await websockets.serve(server.echo, "localhost", 0) for server in servers
+    ]
+    uris = [
+        f"ws://localhost:{listener.sockets[0].getsockname()[1]}"
+        for listener in listeners
+    ]
+    router = Router(uris, control_token="token")
+    front = await websockets.serve(router.handle, "localhost", 0)
+    front_uri = f"ws://localhost:{front.sockets[0].getsockname()[1]}"
+
+    try:
+        async with websockets.connect(front_uri) as writer, websockets.connect(
+            front_uri
+        ) as reader:
+            for i, websocket in enumerate((writer, reader)):
+                await request(websocket, "LOGIN", {"username": "alice"}, 1)
+            await request(writer, "CREATE_FILE", {"filename": "doc.txt"}, 2)
+            for websocket in (writer, reader):
+                opened = await request(
+                    websocket,
+                    "OPEN_FILE",
+                    {"filename": "doc.txt", "user_id": "alice", "host_id": "alice"},
+                    3,
+                )
+                assert opened["data"]["status"] == "success"
+
+            await writer.send(
+                Protocol.create_message(
+                    "EDIT_FILE",
+                    {
+                        "filename": "doc.txt",
+                        "operation": {
+                            "op_type": "insert",
+                            "start_pos": {"y": 0, "x": 0},
+                            "text": ["hi"],
+                        },
+                    },
+                )
+            )
+            update = Protocol.parse_response(
+                await asyncio.wait_for(reader.recv(), timeout=5)
+            )
+            assert update["data"]["operation"]["text"] == ["hi"]
+
+        owner = servers[uris.index(router.ring.get("doc.txt"))]
+        assert owner.session_manager.open_files["doc.txt"].slice() == ["hi"]
+    finally:
+        front.close()
+        await front.wait_closed()
+        await router.close()
+        for listener, server in zip(listeners, servers):
+            listener.close()
+            await listener.wait_closed()
+            await server.actors.stop_all()
+            server.shutdown()
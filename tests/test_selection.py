@@ -2,9 +2,10 @@ import curses
 from unittest import mock
 
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
 from Editor.selection import Selection
 from Editor.container import Container
+from Editor.viewport import Viewport
 
 
 @pytest.fixture
@@ -665,5 +666,24 @@ def test_clear(container):
     assert container.container == []
 
 
+def test_drawing_is_clipped_to_the_viewport():
+    selection = Selection(Viewport(height=5, width=4, top=10, left=2))
+    stdscr = Mock()
+    text = ["abcdefgh"] * 20
+
+    selection.start(12, 1)
+    selection.down(stdscr, 3, 13, text)
+    stdscr.addstr.assert_has_calls(
+        [
+            call(2, 0, "cdef", curses.A_REVERSE),
+            call(3, 0, "c", curses.A_REVERSE),
+        ]
+    )
+    stdscr.reset_mock()
+    selection.draw_char(stdscr, 20, 3, "d")
+    selection.draw_char(stdscr, 12, 1, "b")
+    stdscr.addch.assert_not_called()
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -3,13 +3,14 @@ import pytest
 import json
 from unittest.mock import MagicMock, AsyncMock, patch, Mock
 from Server.server import Server
+from Shared.crdt import CrdtDocument
 from Shared.protocol import Protocol
 
 
 class TestServer:
     @pytest.fixture
-    def setup(self):
-        self.server = Server()
+    def setup(self, tmp_path):
+        self.server = Server(oplog_dir=str(tmp_path))
         self.websocket_mock = AsyncMock()
         self.user_sessions = {}
 
@@ -20,8 +21,8 @@ class TestServer:
         loop.close()
 
     @pytest.fixture
-    def server(self):
-        server = Server()
+    def server(self, tmp_path):
+        server = Server(oplog_dir=str(tmp_path))
         server.file_manager = Mock()
         server.session_manager = Mock()
         server.user_sessions = {}
@@ -147,7 +148,7 @@ class TestServer:
         await self.server.handle_request(json.loads(request), self.websocket_mock)
 
         expected_response = Protocol.create_message(
-            "OPEN_FILE", {"status": "success", "content": "A"}
+            "OPEN_FILE", {"status": "success", "content": "A", "revision": 0}
         )
         self.websocket_mock.send.assert_called_once_with(expected_response)
 
@@ -173,8 +174,8 @@ class TestServer:
         self.server.session_manager = MagicMock()
         self.server.session_manager.get_content = MagicMock(return_value="content")
         self.server.user_sessions[self.websocket_mock] = "fake_id"
-        self.server.session_manager.share_update = AsyncMock()
-        self.server.file_manager.save_file = MagicMock()
+        self.server.session_manager.share_batch = AsyncMock()
+        self.server.file_manager.save_file = MagicMock(return_value=(True, None))
 
         request = Protocol.create_message(
             "EDIT_FILE",
@@ -187,13 +188,23 @@ class TestServer:
         await self.server.handle_request(
             Protocol.parse_request(request), self.websocket_mock
         )
+        await self.server.actors.join("testfile.txt")
 
-        self.server.session_manager.apply_operation.assert_called_once_with(
+        self.server.session_manager.apply_batch.assert_called_once_with(
             "testfile.txt",
-            "fake_id",
-            {"op_type": "insert", "pos": 0, "char": "A"},
+            [
+                (
+                    self.websocket_mock,
+                    "fake_id",
+                    {"op_type": "insert", "pos": 0, "char": "A"},
+                )
+            ],
             {},
         )
+        self.server.file_manager.save_file.assert_not_called()
+        assert self.server.write_behind.is_dirty("testfile.txt")
+
+        self.server.write_behind.flush("testfile.txt")
         self.server.file_manager.save_file.assert_called_once_with(
             "fake_id", "testfile.txt", "content"
         )
@@ -283,6 +294,77 @@ class TestServer:
             "testfile.txt", self.websocket_mock
         )
 
+    @pytest.mark.asyncio
+    async def test_close_file_flushes_pending_edits(self, setup):
+        self.server.session_manager.start_session("testfile.txt", self.websocket_mock)
+        self.server.file_manager.save_file = MagicMock(return_value=(True, None))
+        self.server.write_behind.mark_dirty("testfile.txt", "fake_id")
+
+        request = Protocol.create_message("CLOSE_FILE", {"filename": "testfile.txt"})
+        with patch.object(self.server.file_manager, "save_history"):
+            await self.server.handle_request(
+                Protocol.parse_request(request), self.websocket_mock
+            )
+
+        self.server.file_manager.save_file.assert_called_once()
+        assert not self.server.write_behind.is_dirty("testfile.txt")
+
+    @pytest.mark.asyncio
+    async def test_get_history_streams_pages(self, setup):
+        self.server.history_changes["testfile.txt"] = [
+            {"user_id": "user1", "time": str(i), "operation": {"op_type": "insert"}}
+            for i in range(5)
+        ]
+        request = Protocol.create_message(
+            "GET_HISTORY", {"filename": "testfile.txt", "limit": 4, "page_size": 2}
+        )
+
+        await self.server.handle_request(
+            Protocol.parse_request(request), self.websocket_mock
+        )
+
+        frames = [
+            json.loads(call.args[0])["data"]
+            for call in self.websocket_mock.send.call_args_list
+        ]
+        assert [len(frame["history"]) for frame in frames] == [2, 2]
+        assert [frame["done"] for frame in frames] == [False, True]
+        assert frames[-1]["cursor"] == 4
+
+    @pytest.mark.asyncio
+    async def test_history_pages_across_closing_and_reopening(
+        self, setup, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "Server" / "files_change_history").mkdir(parents=True)
+        history = [
+            {"user_id": "user1", "time": str(i), "operation": {"op_type": "insert"}}
+            for i in range(5)
+        ]
+
+        async def page(cursor):
+            self.websocket_mock.send.reset_mock()
+            request = Protocol.create_message(
+                "GET_HISTORY",
+                {"filename": "testfile.txt", "cursor": cursor, "limit": 2},
+            )
+            await self.server.handle_request(
+                Protocol.parse_request(request), self.websocket_mock
+            )
+            frame = json.loads(self.websocket_mock.send.call_args.args[0])["data"]
+            return frame["history"], frame["cursor"]
+
+        self.server.history_changes["testfile.txt"] = list(history)
+        first, cursor = await page(None)
+        self.server.file_manager.save_history("testfile.txt", history)
+        self.server.history_changes.pop("testfile.txt")
+        second, cursor = await page(cursor)
+        self.server.history_changes["testfile.txt"] = list(history)
+        third, cursor = await page(cursor)
+
+        assert first + second + third == history
+        assert cursor is None
+
     @pytest.mark.asyncio
     async def test_echo_client_connect_and_disconnect(self, setup):
         self.server.handle_request = AsyncMock()
@@ -389,6 +471,270 @@ class TestServer:
             '{"type": "CREATE_FILE", "data": {"status": "success"}}'
         )
 
+    @pytest.mark.asyncio
+    async def test_concurrent_edits_are_batched(self, setup):
+        self.server.file_manager.save_file = MagicMock(return_value=(True, None))
+        writers = [AsyncMock(), AsyncMock()]
+        reader = AsyncMock()
+        for i, websocket in enumerate([*writers, reader]):
+            self.server.user_sessions[websocket] = f"user{i}"
+            self.server.session_manager.start_session("doc.txt", websocket)
+        self.server.session_manager.open_files["doc.txt"] = (
+            self.server.session_manager.document_class([""])
+        )
+
+        for i, char in enumerate("abcd"):
+            await self.server.handle_request(
+                {
+                    "command": "EDIT_FILE",
+                    "data": {
+                        "filename": "doc.txt",
+                        "operation": {
+                            "op_type": "insert",
+                            "start_pos": {"y": 0, "x": i},
+                            "text": [char],
+                        },
+                    },
+                },
+                writers[i % 2],
+            )
+        await self.server.actors.join("doc.txt")
+
+        assert self.server.session_manager.get_content("doc.txt").slice() == ["abcd"]
+        assert self.server.actors.batches == 1
+        reader.send.assert_called_once()
+        frame = json.loads(reader.send.call_args.args[0])
+        assert frame["command"] == "EDIT_BATCH"
+        assert len(frame["data"]["operations"]) == 4
+        own = json.loads(writers[0].send.call_args.args[0])
+        assert [op["user_id"] for op in own["data"]["operations"]] == ["user1", "user1"]
+        assert self.server.write_behind.is_dirty("doc.txt")
+
+    @pytest.mark.asyncio
+    async def test_get_stats_and_custom_command(self, setup):
+        handler = AsyncMock(return_value={"command": "CUSTOM", "data": {}})
+        self.server.commands.register("CUSTOM", handler)
+        await self.server.handle_request(
+            {"command": "CUSTOM", "data": {}}, self.websocket_mock
+        )
+        handler.assert_awaited_once_with(
+            {"command": "CUSTOM", "data": {}}, self.websocket_mock, None
+        )
+
+        # no admins are configured by default
+        self.server.user_sessions[self.websocket_mock] = "user1"
+        await self.server.handle_request(
+            {"command": "GET_STATS", "data": {}}, self.websocket_mock
+        )
+        denied = json.loads(self.websocket_mock.send.call_args.args[0])
+        assert denied["data"] == {"status": "error", "error": "Access denied"}
+
+        self.server.admin_users = {"admin"}
+        await self.server.handle_request(
+            {"command": "GET_STATS", "data": {}}, self.websocket_mock
+        )
+        denied = json.loads(self.websocket_mock.send.call_args.args[0])
+        assert denied["data"]["status"] == "error"
+
+        self.server.user_sessions[self.websocket_mock] = "admin"
+        await self.server.handle_request(
+            {"command": "GET_STATS", "data": {}}, self.websocket_mock
+        )
+        stats = json.loads(self.websocket_mock.send.call_args.args[0])["data"]
+        assert stats["status"] == "success"
+        assert stats["commands"]["CUSTOM"]["count"] == 1
+        assert stats["commands"]["GET_STATS"]["count"] == 2
+
+    @pytest.mark.asyncio
+    async def test_sync_index_needs_the_router_token(self, setup):
+        self.server.file_manager.load_index = Mock()
+        for data in ({}, {"token": "guess"}):
+            await self.server.handle_request(
+                {"command": "SYNC_INDEX", "data": data}, self.websocket_mock
+            )
+            refused = json.loads(self.websocket_mock.send.call_args.args[0])
+            assert refused["data"] == {"error": "Access denied"}
+
+        self.server.control_token = "secret"
+        await self.server.handle_request(
+            {"command": "SYNC_INDEX", "data": {"token": "guess"}}, self.websocket_mock
+        )
+        self.server.file_manager.load_index.assert_not_called()
+        await self.server.handle_request(
+            {"command": "SYNC_INDEX", "data": {"token": "secret"}}, self.websocket_mock
+        )
+        self.server.file_manager.load_index.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_request_id_is_echoed(self, setup):
+        self.server.file_manager.get_files = Mock(return_value=["a.txt"])
+        await self.server.handle_request(
+            {"command": "GET_FILES", "data": {}, "id": 7}, self.websocket_mock
+        )
+
+        response = json.loads(self.websocket_mock.send.call_args.args[0])
+        assert response["id"] == 7
+        assert response["data"] == {"files": ["a.txt"]}
+
+    @pytest.mark.asyncio
+    async def test_open_file_streams_after_viewport(self, setup):
+        lines = [f"line {n}" for n in range(25)]
+        self.server.file_manager.open_file = MagicMock(return_value=(True, lines))
+        self.server.file_manager.validate_access = MagicMock(
+            return_value=(True, "/mock/path/to/testfile.txt", None)
+        )
+        request = {
+            "command": "OPEN_FILE",
+            "data": {
+                "filename": "testfile.txt",
+                "user_id": "user1",
+                "host_id": "user1",
+                "viewport": 5,
+                "chunk_lines": 8,
+            },
+            "id": 3,
+        }
+        await self.server.handle_request(request, self.websocket_mock)
+        await asyncio.gather(*self.server.loading.values())
+
+        frames = [
+            json.loads(call.args[0]) for call in self.websocket_mock.send.call_args_list
+        ]
+        assert all(frame["id"] == 3 for frame in frames)
+        assert frames[0]["data"]["line_count"] == 25
+        assert [frame["data"]["start"] for frame in frames] == [0, 5, 13, 21]
+        assert [frame["data"]["done"] for frame in frames] == [False] * 3 + [True]
+        assert sum((frame["data"]["content"] for frame in frames), []) == lines
+        assert self.server.loading == {}
+
+        await self.server.handle_request(
+            {
+                "command": "GET_LINES",
+                "data": {"filename": "testfile.txt", "start": 20, "end": 22},
+            },
+            self.websocket_mock,
+        )
+        response = json.loads(self.websocket_mock.send.call_args.args[0])["data"]
+        assert response["lines"] == ["line 20", "line 21"]
+        assert response["line_count"] == 25
+
+        await self.server.handle_request(
+            {"command": "GET_LINES", "data": {"filename": "other.txt"}},
+            self.websocket_mock,
+        )
+        response = json.loads(self.websocket_mock.send.call_args.args[0])["data"]
+        assert response["status"] == "error"
+
+    @pytest.mark.asyncio
+    async def test_concurrent_edits_are_rebased_and_acked(self, setup):
+        self.server.file_manager.save_file = MagicMock(return_value=(True, None))
+        alice, bob = AsyncMock(), AsyncMock()
+        for websocket, name in ((alice, "alice"), (bob, "bob")):
+            self.server.user_sessions[websocket] = name
+            self.server.session_manager.start_session("doc.txt", websocket)
+        self.server.session_manager.update_content("doc.txt", ["hello"])
+
+        # both typed against revision 0; bob's insert moves past alice's
+        for websocket, x, text in ((alice, 0, ">"), (bob, 5, "!")):
+            await self.server.handle_request(
+                {
+                    "command": "EDIT_FILE",
+                    "data": {
+                        "filename": "doc.txt",
+                        "operation": {
+                            "op_type": "insert",
+                            "start_pos": {"y": 0, "x": x},
+                            "text": [text],
+                            "revision": 0,
+                            "seq": 7,
+                        },
+                    },
+                },
+                websocket,
+            )
+        await self.server.actors.join("doc.txt")
+
+        content = self.server.session_manager.get_content("doc.txt").slice()
+        assert content == [">hello!"]
+        assert self.server.session_manager.revision("doc.txt") == 2
+        frame = json.loads(bob.send.call_args.args[0])
+        assert frame["data"]["operations"] == [
+            {
+                "operation": {
+                    "op_type": "insert",
+                    "start_pos": {"y": 0, "x": 0},
+                    "text": [">"],
+                },
+                "user_id": "alice",
+                "revision": 1,
+            },
+            {"ack": True, "revision": 2, "seq": 7, "start_pos": {"y": 0, "x": 6}},
+        ]
+        frame = json.loads(alice.send.call_args.args[0])
+        assert frame["data"]["operations"] == [
+            {"ack": True, "revision": 1, "seq": 7, "start_pos": {"y": 0, "x": 0}},
+            {
+                "operation": {
+                    "op_type": "insert",
+                    "start_pos": {"y": 0, "x": 6},
+                    "text": ["!"],
+                },
+                "user_id": "bob",
+                "revision": 2,
+            },
+        ]
+
+    @pytest.mark.asyncio
+    async def test_crdt_file_operations_are_relayed_as_sent(self, setup):
+        self.server.file_manager.create_file = MagicMock(return_value=(True, None))
+        self.server.file_manager.open_file = MagicMock(return_value=(True, ["ab"]))
+        self.server.file_manager.save_file = MagicMock(return_value=(True, None))
+        self.server.file_manager.load_history = MagicMock(return_value=[])
+        alice, bob = AsyncMock(), AsyncMock()
+        await self.server.handle_request(
+            {"command": "CREATE_FILE", "data": {"filename": "doc.txt", "mode": "crdt"}},
+            alice,
+        )
+
+        replicas = {}
+        for websocket, name in ((alice, "alice"), (bob, "bob")):
+            self.server.user_sessions[websocket] = name
+            await self.server.handle_request(
+                {
+                    "command": "OPEN_FILE",
+                    "data": {"filename": "doc.txt", "user_id": "al", "host_id": "al"},
+                },
+                websocket,
+            )
+            response = json.loads(websocket.send.call_args.args[0])["data"]
+            assert response["mode"] == "crdt"
+            replicas[websocket] = CrdtDocument.from_state(response["crdt"], name)
+        # the snapshot made at creation wins over the file's content
+        assert replicas[alice] == [""]
+
+        sent = {}
+        for websocket, text in ((alice, "x"), (bob, "y")):
+            sent[websocket] = replicas[websocket].local_insert(0, 0, [text])
+            await self.server.handle_request(
+                {
+                    "command": "EDIT_FILE",
+                    "data": {
+                        "filename": "doc.txt",
+                        "operation": dict(sent[websocket], revision=0),
+                    },
+                },
+                websocket,
+            )
+        await self.server.actors.join("doc.txt")
+
+        for websocket, other in ((alice, bob), (bob, alice)):
+            frame = json.loads(websocket.send.call_args.args[0])["data"]
+            received = [entry for entry in frame["operations"] if "operation" in entry]
+            assert [entry["operation"] for entry in received] == [sent[other]]
+            replicas[websocket].apply(received[0]["operation"])
+        document = self.server.session_manager.get_content("doc.txt")
+        assert replicas[alice] == replicas[bob] == document == ["yx"]
+
 
 if __name__ == "__main__":
     pytest.main()
@@ -1,6 +1,12 @@
+import json
 from unittest.mock import AsyncMock, Mock
 import pytest
-from Server.session_manager import SessionManager, safe_list_get
+from Server.session_manager import SessionManager
+from Shared.crdt import CrdtDocument
+
+
+def insert_at(y, x, text):
+    return {"op_type": "insert", "start_pos": {"y": y, "x": x}, "text": [text]}
 
 
 @pytest.fixture
@@ -98,20 +104,6 @@ async def test_share_update(session_manager, mock_websocket):
     websocket2.send.assert_called_once()
 
 
-def test_safe_list_get_with_valid_index():
-    lst = [1, 2, 3]
-    result = safe_list_get(lst, 1, "default")
-    assert result == 2, "Should return the value at the specified index"
-
-
-def test_safe_list_get_with_invalid_index():
-    lst = [1, 2, 3]
-    result = safe_list_get(lst, 5, "default")
-    assert (
-        result == "default"
-    ), "Should return the default value when index is out of range"
-
-
 def test_apply_delete_operation(session_manager):
     filename = "test_file.txt"
     user_id = 1
@@ -141,3 +133,125 @@ def test_apply_new_line_operation(session_manager):
     history = {}
     session_manager.apply_operation(filename, user_id, operation, history)
     assert session_manager.open_files[filename] == ["Hello,", " world!"]
+
+
+def test_cancel_multi_line_delete(session_manager):
+    filename = "test_file.txt"
+    session_manager.start_session(filename, Mock())
+    session_manager.update_content(filename, ["Hello, world!", "middle", "end."])
+    operation = {
+        "op_type": "delete",
+        "start_pos": {"y": 0, "x": 7},
+        "end_pos": {"y": 2, "x": 1},
+        "text": [],
+    }
+    history = {}
+    session_manager.apply_operation(filename, 1, operation, history)
+    assert session_manager.open_files[filename] == ["Hello, nd."]
+
+    undo = session_manager.apply_operation(
+        filename, 1, {"op_type": "cancel_changes"}, history
+    )
+    assert undo["op_type"] == "insert"
+    assert session_manager.open_files[filename] == ["Hello, world!", "middle", "end."]
+
+
+@pytest.mark.asyncio
+async def test_share_update_encodes_once_per_codec(session_manager):
+    filename = "test_file.txt"
+    operation = {"op_type": "insert", "start_pos": {"y": 0, "x": 0}, "text": ["a"]}
+    sender = AsyncMock()
+    json_clients = [AsyncMock() for _ in range(3)]
+    binary_clients = [AsyncMock() for _ in range(2)]
+    for client in [sender, *json_clients, *binary_clients]:
+        session_manager.start_session(filename, client)
+    for client in binary_clients:
+        session_manager.codecs[client] = "binary"
+
+    await session_manager.share_update(filename, operation, sender, "user1")
+
+    sender.send.assert_not_called()
+    frames = {client.send.call_args.args[0] for client in json_clients}
+    assert len(frames) == 1
+    assert isinstance(binary_clients[0].send.call_args.args[0], bytes)
+    assert session_manager.frames_encoded == 2
+    assert session_manager.encodes_saved == 3
+
+
+def test_crdt_tombstones_are_collected_once_every_member_saw_them():
+    manager = SessionManager(tombstone_limit=0)
+    alice, bob = Mock(), Mock()
+    for websocket in (alice, bob):
+        manager.start_session("doc.txt", websocket)
+    manager.update_content("doc.txt", [""], CrdtDocument(["abc"]).state())
+    state = manager.crdt_state("doc.txt")
+    ours, theirs = (CrdtDocument.from_state(state, name) for name in ("a", "b"))
+
+    delete = ours.local_delete(0, 0, 0, 2)
+    updates = manager.apply_batch(
+        "doc.txt", [(alice, "a", dict(delete, revision=0))], {}
+    )
+    assert updates == [(alice, "a", delete, 1), (alice, "a", {"op_type": "ack"}, 1)]
+    theirs.apply(delete)
+    # bob has not typed since the delete, so it could still be referenced
+    insert = theirs.local_insert(0, 1, ["!"])
+    manager.apply_batch("doc.txt", [(bob, "b", dict(insert, revision=1))], {})
+    assert manager.open_files["doc.txt"].tombstones == 2
+
+    ours.apply(insert)
+    insert = ours.local_insert(0, 0, [">"])
+    updates = manager.apply_batch(
+        "doc.txt", [(alice, "a", dict(insert, revision=2))], {}
+    )
+    _, _, collect, revision = updates[-1]
+    assert collect["op_type"] == "crdt_gc" and revision == 4
+    assert manager.open_files["doc.txt"].tombstones == 0
+    ours.apply(collect)
+    assert ours == manager.open_files["doc.txt"] == [">c!"]
+
+
+@pytest.mark.asyncio
+async def test_invalid_operation_in_a_batch_resyncs_only_its_sender():
+    manager = SessionManager()
+    alice, bob = AsyncMock(), AsyncMock()
+    for websocket in (alice, bob):
+        manager.start_session("doc.txt", websocket)
+    manager.update_content("doc.txt", ["hello"])
+
+    def edit(operation, client):
+        return dict(operation, revision=0, seq=1, client=client)
+
+    batch = [
+        (alice, "a", edit(insert_at(0, 5, "!"), "a")),
+        # bob had seen alice's insert: the bad delete is logged, then fails
+        (
+            bob,
+            "b",
+            dict(
+                edit({"op_type": "delete", "start_pos": {"y": 0, "x": 0}}, "b"),
+                revision=1,
+            ),
+        ),
+        (alice, "a", dict(edit(insert_at(0, 0, ">"), "a"), seq=2)),
+    ]
+    updates = manager.apply_batch("doc.txt", batch, {})
+
+    assert manager.get_content("doc.txt") == [">hello!"]
+    assert manager.revisions["doc.txt"].revision == 2
+    assert [(ws, op["op_type"]) for ws, _, op, _ in updates] == [
+        (alice, "insert"),
+        (alice, "ack"),
+        (bob, "resync"),
+        (alice, "insert"),
+        (alice, "ack"),
+    ]
+    await manager.share_batch("doc.txt", updates)
+    (frame,) = [call.args[0] for call in bob.send.call_args_list]
+    operations = json.loads(frame)["data"]["operations"]
+    assert [entry["operation"]["op_type"] for entry in operations] == [
+        "insert",
+        "resync",
+        "insert",
+    ]
+    assert operations[1]["operation"]["text"] == ["hello!"]
+    assert operations[1]["revision"] == 1
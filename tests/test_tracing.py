@@ -0,0 +1,107 @@
+import json
+import pytest
+from unittest.mock import Mock
+from Server.server import Server
+from Server.tracing import (
+    NOOP_SPAN,
+    JsonLinesExporter,
+    RingBufferExporter,
+    Tracer,
+)
+from Shared.protocol import Protocol
+
+
+def test_default_tracer_is_noop():
+    tracer = Tracer()
+
+    with tracer.span("request", command="PING") as span:
+        span.set_attribute("status", "ok")
+
+    assert span is NOOP_SPAN
+    assert tracer.current() is None
+
+
+def test_spans_nest_and_ring_buffer_is_bounded():
+    exporter = RingBufferExporter(capacity=3)
+    tracer = Tracer(exporter)
+
+    with tracer.span("request", command="EDIT_FILE") as root:
+        with tracer.span("parse_request"):
+            pass
+        with tracer.span("detached", parent=None):
+            pass
+    with pytest.raises(ValueError):
+        with tracer.span("failing"):
+            raise ValueError("boom")
+
+    spans = {span["name"]: span for span in exporter.spans()}
+    assert list(spans) == ["detached", "request", "failing"]
+    assert spans["request"]["attributes"] == {"command": "EDIT_FILE"}
+    assert spans["detached"]["parent_id"] is None
+    assert spans["detached"]["trace_id"] != root.trace_id
+    assert spans["failing"]["attributes"]["error"] == "ValueError('boom')"
+    assert [span["name"] for span in exporter.spans(root.trace_id)] == ["request"]
+
+
+def test_json_lines_exporter(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = JsonLinesExporter(str(path))
+    tracer = Tracer(exporter)
+
+    with tracer.span("request"):
+        with tracer.span("save_file", filename="f.txt"):
+            pass
+    tracer.close()
+
+    assert not exporter.thread.is_alive()
+
+    child, parent = [json.loads(line) for line in path.read_text().splitlines()]
+    assert child["name"] == "save_file"
+    assert child["parent_id"] == parent["span_id"]
+    assert child["trace_id"] == parent["trace_id"]
+    assert child["attributes"] == {"filename": "f.txt"}
+
+
+class Socket:
+    def __init__(self, frames):
+        self.frames = frames
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+    async def __aiter__(self):
+        for frame in self.frames:
+            yield frame
+
+
+@pytest.mark.asyncio
+async def test_edit_pipeline_is_traced_stage_by_stage(tmp_path):
+    exporter = RingBufferExporter()
+    server = Server(oplog_dir=str(tmp_path), tracer=Tracer(exporter))
+    server.file_manager = Mock()
+    server.file_manager.open_file.return_value = (True, ["hello"])
+    server.file_manager.load_history.return_value = []
+    operation = {"op_type": "insert", "start_pos": {"y": 0, "x": 0}, "text": ["A"]}
+    websocket = Socket(
+        [
+            Protocol.create_message("LOGIN", {"username": "u"}),
+            Protocol.create_message(
+                "OPEN_FILE", {"filename": "f.txt", "user_id": "u", "host_id": "u"}
+            ),
+            Protocol.create_message(
+                "EDIT_FILE", {"filename": "f.txt", "operation": operation}
+            ),
+        ]
+    )
+    await server.echo(websocket)
+    await server.actors.stop_all()
+
+    spans = exporter.spans()
+    names = [span["name"] for span in spans]
+    assert names.count("request") == 3
+    assert names.count("parse_request") == 3
+    batch = next(span for span in spans if span["name"] == "apply_batch")
+    children = {span["name"] for span in spans if span["parent_id"] == batch["span_id"]}
+    assert children == {"apply_operation", "share_update"}
+    assert batch["attributes"] == {"filename": "f.txt", "operations": 1}
@@ -0,0 +1,93 @@
+import asyncio
+import os
+from unittest.mock import Mock
+import pytest
+from Server.file_manager import FileManager
+from Server.server import Server
+from Server.write_behind import WriteBehind
+from Shared.document import RopeDocument
+
+
+@pytest.mark.asyncio
+async def test_edits_are_coalesced_until_delay():
+    save = Mock()
+    write_behind = WriteBehind(save, max_delay=0.05, max_ops=100)
+
+    for _ in range(10):
+        write_behind.mark_dirty("file.txt", "user1")
+    save.assert_not_called()
+
+    await asyncio.sleep(0.1)
+    save.assert_called_once_with("user1", "file.txt")
+    assert not write_behind.is_dirty("file.txt")
+    assert write_behind.coalesced_ops == 9
+
+
+@pytest.mark.asyncio
+async def test_max_ops_forces_flush():
+    save = Mock()
+    write_behind = WriteBehind(save, max_delay=10, max_ops=3)
+
+    for _ in range(3):
+        write_behind.mark_dirty("file.txt", "user1")
+
+    save.assert_called_once_with("user1", "file.txt")
+    assert not write_behind.is_dirty("file.txt")
+
+
+@pytest.mark.asyncio
+async def test_flush_all_and_discard():
+    save = Mock()
+    write_behind = WriteBehind(save, max_delay=10, max_ops=100)
+    write_behind.mark_dirty("a.txt", "user1")
+    write_behind.mark_dirty("b.txt", "user2")
+    write_behind.discard("b.txt")
+
+    write_behind.flush_all()
+
+    save.assert_called_once_with("user1", "a.txt")
+    assert not write_behind.flush("a.txt")
+
+
+@pytest.mark.asyncio
+async def test_failed_save_keeps_the_edits_and_retries():
+    save = Mock(side_effect=[OSError("disk full"), None])
+    write_behind = WriteBehind(save, max_delay=0.05, max_ops=2)
+
+    write_behind.mark_dirty("file.txt", "user1", ops=2)
+    assert write_behind.is_dirty("file.txt")
+    assert write_behind.flushes == 0
+
+    await asyncio.sleep(0.2)
+    assert save.call_count == 2
+    assert not write_behind.is_dirty("file.txt")
+    assert write_behind.flushes == 1
+
+
+@pytest.mark.asyncio
+async def test_server_keeps_edits_dirty_until_the_disk_write_succeeds(tmp_path):
+    server = Server(oplog_dir=str(tmp_path / "oplog"), flush_delay=0.05)
+    server.file_manager = FileManager(base_dir=str(tmp_path / "files"))
+    server.file_manager.user_info = {}
+    server.session_manager.open_files["f.txt"] = RopeDocument(["hello"])
+
+    server.write_behind.mark_dirty("f.txt", "u")
+    await asyncio.sleep(0.08)
+    # the user's folder is missing, so the write fails
+    assert server.write_behind.is_dirty("f.txt")
+    assert server.write_behind.flushes == 0
+    assert server.saved_bytes.default.value == 0
+
+    os.makedirs(tmp_path / "files" / "u's_files")
+    await asyncio.sleep(0.2)
+    assert not server.write_behind.is_dirty("f.txt")
+    assert (tmp_path / "files" / "u's_files" / "f.txt").read_text() == "hello\n"
+    assert server.saved_bytes.default.value == 6
+
+    # once the document is closed there is nothing to write
+    server.write_behind.mark_dirty("f.txt", "u")
+    del server.session_manager.open_files["f.txt"]
+    assert not server.write_behind.flush("f.txt")
+    assert server.write_behind.is_dirty("f.txt")
+    assert server.write_behind.flushes == 1
+    server.write_behind.discard("f.txt")